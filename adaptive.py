@@ -0,0 +1,87 @@
+from sqlalchemy import update
+from .app import db
+from .models import QuestionStats, UserSkill
+from .progress import locked_rows
+import math
+
+# Modelo de Rasch (IRT de um parâmetro) ajustado online no estilo Elo: a
+# chance de acerto é logística na diferença habilidade - dificuldade, e cada
+# resposta move as duas estimativas na direção do erro de previsão. O passo
+# diminui com o número de tentativas (estimativas novas andam mais rápido).
+K_BASE = 0.8
+K_MIN = 0.05
+K_DECAY = 20
+
+# Estimativa inicial das questões a partir da dificuldade cadastrada
+INITIAL_RATINGS = {"easy": -1.0, "medium": 0.0, "hard": 1.0}
+
+
+def initial_rating(difficulty):
+    return INITIAL_RATINGS.get(difficulty, 0.0)
+
+
+def expected(ability, difficulty):
+    return 1 / (1 + math.exp(difficulty - ability))
+
+
+def k_factor(attempts):
+    return max(K_MIN, K_BASE / (1 + attempts / K_DECAY))
+
+
+def elo_update(skill, stats, is_correct):
+    # Atualiza em O(1) um UserSkill e um QuestionStats (ou objetos equivalentes)
+    error = (1.0 if is_correct else 0.0) - expected(skill.rating, stats.rating)
+    skill.rating += k_factor(skill.attempts) * error
+    stats.rating -= k_factor(stats.attempts) * error
+    skill.attempts += 1
+    stats.attempts += 1
+    if is_correct:
+        skill.correct += 1
+        stats.correct += 1
+
+
+def target_rating(ability, success_rate):
+    # Dificuldade em que o usuário acerta com a probabilidade desejada
+    return ability - math.log(success_rate / (1 - success_rate))
+
+
+def update_ratings(answers):
+    # Aplica as respostas (em ordem) às tabelas agregadas, em O(1) por
+    # resposta e com um número fixo de statements por lote. As linhas são
+    # travadas em ordem de chave (locked_rows), para que lotes concorrentes
+    # não percam atualizações. O commit fica a cargo de quem chama.
+    if not answers:
+        return
+    priors = {a.question_id: initial_rating(a.difficulty) for a in answers}
+    skill_keys = sorted({(a.user_id, a.subject) for a in answers})
+    question_ids = sorted(priors)
+
+    stats = locked_rows(QuestionStats, [QuestionStats.question_id], [
+        {"question_id": question_id, "attempts": 0, "correct": 0, "rating": priors[question_id]}
+        for question_id in question_ids
+    ])
+    skills = locked_rows(UserSkill, [UserSkill.user_id, UserSkill.subject], [
+        {"user_id": user_id, "subject": subject, "attempts": 0, "correct": 0, "rating": 0.0}
+        for user_id, subject in skill_keys
+    ])
+    for answer in answers:
+        elo_update(skills[(answer.user_id, answer.subject)], stats[(answer.question_id,)], answer.is_correct)
+
+    db.session.execute(update(QuestionStats), [vars(row) for row in stats.values()])
+    db.session.execute(update(UserSkill), [vars(row) for row in skills.values()])
+
+
+def user_ability(user_id, subject):
+    skill = db.session.get(UserSkill, (user_id, subject))
+    return skill.rating if skill else 0.0
+
+
+def question_ratings(records):
+    # {id: dificuldade estimada} para QuestionRecords; sem estatísticas ainda,
+    # vale a estimativa inicial pela dificuldade cadastrada
+    ratings = {r.id: initial_rating(r.difficulty) for r in records}
+    if ratings:
+        rows = db.session.query(QuestionStats.question_id, QuestionStats.rating) \
+            .filter(QuestionStats.question_id.in_(list(ratings)))
+        ratings.update(rows)
+    return ratings
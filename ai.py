@@ -1,30 +1,162 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, request, jsonify, stream_with_context, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from .app import db
-from .models import User, AIInteraction
-from openai import OpenAI
+from .models import AIInteraction
+from .authz import subscription_required
+from .generation import generate_one, persist_generated
+from .llm import CircuitOpenError, complete, record_usage, usage_tokens
+from .ratelimit import RateLimitError, enforce
+from .history import user_history, interaction_body
+from . import chat_cache
+import json
 import os
 
 ai_bp = Blueprint("ai", __name__, url_prefix="/ai")
 
-client = OpenAI()
+def chat_messages(message):
+    return [
+        {"role": "system", "content": "Você é um assistente de estudos especializado em ENEM e residência médica."},
+        {"role": "user", "content": message}
+    ]
+
+def sse_event(data, event=None):
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def cached_chat_response(message):
+    cache = chat_cache.get_cache()
+    return cache.get(message)[0] if cache is not None else None
+
+def remember_chat_response(message, response):
+    cache = chat_cache.get_cache()
+    if cache is not None:
+        cache.set(message, response)
+
+def log_chat(user_id, message, response, cached, tokens=(None, None)):
+    # Registrar interação com a IA (também quando a resposta veio do cache);
+    # tokens é (entrada, saída), desconhecido em streams interrompidos
+    prompt_tokens, completion_tokens = tokens
+    db.session.add(AIInteraction(
+        user_id=user_id,
+        interaction_type="chat",
+        prompt=message,
+        response=response,
+        cached=cached,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens
+    ))
+    db.session.commit()
+
+# Regras das rotas de IA, compartilhadas pelas views abaixo e pelo modo ASGI
+# (asgi.py), que só cuida do transporte. Resultados são (status, corpo JSON,
+# cabeçalhos).
+GENERATE_DENIED = "Assinatura necessária para gerar questões com IA"
+CHAT_DENIED = "Assinatura necessária para conversar com a IA"
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+def error_result(error, action):
+    # Limite ou cota do usuário (429) e OpenAI degradada com o circuit
+    # breaker aberto (503) falham na hora, com a espera sugerida
+    if isinstance(error, RateLimitError):
+        return 429, {"msg": str(error)}, {"Retry-After": str(error.retry_after)}
+    if isinstance(error, CircuitOpenError):
+        return 503, {"msg": str(error)}, {"Retry-After": str(error.retry_after)}
+    return 500, {"msg": f"Erro ao {action} com IA: {str(error)}"}, {}
+
+def parse_generation(data):
+    # ((prompt, assunto, prova), None) ou (None, erro)
+    data = data or {}
+    fields = (data.get("prompt"), data.get("subject"), data.get("exam_type"))
+    if not all(fields):
+        return None, (400, {"msg": "Prompt, assunto e tipo de prova são obrigatórios"}, {})
+    return fields, None
+
+def parse_chat(data):
+    message = (data or {}).get("message")
+    if not message:
+        return None, (400, {"msg": "Mensagem é obrigatória"}, {})
+    return message, None
+
+def admit(user_id, action):
+    # None se o usuário ainda tem fichas para a ação
+    try:
+        enforce(user_id, action)
+    except RateLimitError as e:
+        return error_result(e, action)
+    return None
+
+def save_generated(user_id, subject, exam_type, prompt, result):
+    new_question, = persist_generated(user_id, subject, exam_type, prompt, [result])
+    db.session.commit()
+    return 200, {"id": new_question.id, "text": new_question.text, "options": new_question.options}, {}
+
+def chat_reply(user_id, message, content, cached, tokens):
+    if not cached:
+        remember_chat_response(message, content)
+    log_chat(user_id, message, content, cached, tokens)
+    return 200, {"response": content}, {}
+
+class ChatStream:
+    """Estado de uma resposta de /ai/chat/stream: converte o texto recebido em
+    eventos SSE ("data" com {"delta": ...} e, ao final, "done" ou "error") e,
+    terminado o stream, grava o cache e o histórico."""
+
+    def __init__(self, user_id, message, cached_response):
+        self.user_id = user_id
+        self.message = message
+        self.cached = cached_response is not None
+        self.parts = []
+        self.completed = False
+        self.tokens = (None, None) # Desconhecidos em streams interrompidos
+
+    def delta(self, text):
+        self.parts.append(text)
+        return sse_event({"delta": text})
+
+    def feed(self, chunk):
+        # Evento do chunk do upstream, ou None se ele não traz texto
+        if chunk.usage is not None:
+            self.tokens = record_usage("chat", chunk.usage)
+        text = chunk.choices[0].delta.content if chunk.choices else None
+        return self.delta(text) if text else None
+
+    def done(self):
+        self.completed = True
+        return sse_event({}, event="done")
+
+    def failed(self, error):
+        return sse_event({"msg": f"Erro ao conversar com IA: {str(error)}"}, event="error")
+
+    def finish(self):
+        # O texto recebido é registrado mesmo se o stream foi interrompido;
+        # só respostas completas vão para o cache
+        content = "".join(self.parts)
+        if self.completed and not self.cached:
+            remember_chat_response(self.message, content)
+        if content:
+            try:
+                log_chat(self.user_id, self.message, content, self.cached, self.tokens)
+            except Exception as e:
+                db.session.rollback()
+                current_app.logger.warning("Erro ao registrar interação do chat: %s", e)
+
+def respond(result):
+    status, body, headers = result
+    return jsonify(body), status, headers
 
 @ai_bp.route("/generate_question_ia", methods=["POST"])
-@jwt_required()
+@subscription_required(GENERATE_DENIED)
 def generate_question_ia():
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
+    current_user_id = int(get_jwt_identity())
 
-    if not user or not user.is_subscribed:
-        return jsonify({"msg": "Assinatura necessária para gerar questões com IA"}), 403
+    fields, error = parse_generation(request.get_json(silent=True))
+    if error:
+        return respond(error)
+    prompt, subject, exam_type = fields
 
-    data = request.get_json()
-    prompt = data.get("prompt")
-    subject = data.get("subject")
-    exam_type = data.get("exam_type")
-
-    if not prompt or not subject or not exam_type:
-        return jsonify({"msg": "Prompt, assunto e tipo de prova são obrigatórios"}), 400
+    error = admit(current_user_id, "generate")
+    if error:
+        return respond(error)
 
     # Lógica para chamar a IA para gerar a questão
     # Exemplo com OpenAI (requer OPENAI_API_KEY no ambiente)
@@ -47,34 +179,10 @@ def generate_question_ia():
     #     return jsonify({"msg": f"Erro ao gerar questão com IA: {str(e)}"}), 500
 
     try:
-        response = client.chat.completions.create(
-            model="gpt-4.1-mini", # Ou outro modelo adequado
-            messages=[
-                {"role": "system", "content": f"Você é um especialista em {subject} para {exam_type} e cria questões de múltipla escolha. Formate a saída como um objeto JSON com as chaves 'question_text', 'options' (uma lista de strings) e 'correct_answer' (uma string que corresponde a uma das opções)."},
-                {"role": "user", "content": f"Crie uma questão de múltipla escolha sobre {prompt}."}
-            ],
-            response_format={ "type": "json_object" }
-        )
-        ia_response_content = response.choices[0].message.content
-        import json
-        generated_question_data = json.loads(ia_response_content)
-
-        # Criar e salvar a questão no banco de dados
-        new_question = Question(
-            text=generated_question_data["question_text"],
-            options=generated_question_data["options"],
-            correct_answer=generated_question_data["correct_answer"],
-            subject=subject,
-            exam_type=exam_type,
-            difficulty="dynamic", # Pode ser ajustado pela IA
-            created_by_ia=True
-        )
-        db.session.add(new_question)
-        db.session.commit()
-
-        return jsonify({"id": new_question.id, "text": new_question.text, "options": new_question.options}), 200
+        result = generate_one(subject, exam_type, prompt)
+        return respond(save_generated(current_user_id, subject, exam_type, prompt, result))
     except Exception as e:
-        return jsonify({"msg": f"Erro ao gerar questão com IA: {str(e)}"}), 500
+        return respond(error_result(e, "gerar questão"))
 
     # Registrar interação com a IA (se a geração for bem-sucedida)
     # Isso já está sendo feito dentro do bloco try, mas para o caso de erro, podemos registrar a falha também
@@ -82,19 +190,17 @@ def generate_question_ia():
     # Se houver um erro, a mensagem de erro já é retornada.
 
 @ai_bp.route("/chat", methods=["POST"])
-@jwt_required()
+@subscription_required(CHAT_DENIED)
 def chat_with_ia():
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
+    current_user_id = int(get_jwt_identity())
 
-    if not user or not user.is_subscribed:
-        return jsonify({"msg": "Assinatura necessária para conversar com a IA"}), 403
+    message, error = parse_chat(request.get_json(silent=True))
+    if error:
+        return respond(error)
 
-    data = request.get_json()
-    message = data.get("message")
-
-    if not message:
-        return jsonify({"msg": "Mensagem é obrigatória"}), 400
+    error = admit(current_user_id, "chat")
+    if error:
+        return respond(error)
 
     # Lógica para chamar a IA para o chat
     # Exemplo com OpenAI
@@ -110,29 +216,87 @@ def chat_with_ia():
     # except Exception as e:
     #     return jsonify({"msg": f"Erro ao conversar com IA: {str(e)}"}), 500
 
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4.1-mini", # Ou outro modelo adequado
-            messages=[
-                {"role": "system", "content": "Você é um assistente de estudos especializado em ENEM e residência médica."},
-                {"role": "user", "content": message}
-            ]
-        )
-        ia_response_content = response.choices[0].message.content
-    except Exception as e:
-        return jsonify({"msg": f"Erro ao conversar com IA: {str(e)}"}), 500
+    ia_response_content = cached_chat_response(message)
+    cached = ia_response_content is not None
+    tokens = (None, None)
 
-    # Registrar interação com a IA
-    ai_interaction = AIInteraction(
-        user_id=current_user_id,
-        interaction_type="chat",
-        prompt=message,
-        response=ia_response_content
-    )
-    db.session.add(ai_interaction)
-    db.session.commit()
+    if not cached:
+        try:
+            response = complete("chat", messages=chat_messages(message))
+            ia_response_content = response.choices[0].message.content
+        except Exception as e:
+            return respond(error_result(e, "conversar"))
+        tokens = usage_tokens(response)
+
+    return respond(chat_reply(current_user_id, message, ia_response_content, cached, tokens))
+
+@ai_bp.route("/chat/stream", methods=["POST"])
+@subscription_required(CHAT_DENIED)
+def chat_with_ia_stream():
+    # Mesmo contrato do /ai/chat, mas a resposta chega como Server-Sent Events:
+    # eventos "data" com {"delta": ...} e, ao final, um evento "done"
+    current_user_id = int(get_jwt_identity())
+
+    message, error = parse_chat(request.get_json(silent=True))
+    if error:
+        return respond(error)
+
+    error = admit(current_user_id, "chat")
+    if error:
+        return respond(error)
 
-    return jsonify({"response": ia_response_content}), 200
+    cached_response = cached_chat_response(message)
+    upstream = None
+    if cached_response is None:
+        # A conexão com a OpenAI é aberta antes de responder, para que falhas
+        # iniciais ainda voltem como erro JSON comum
+        try:
+            upstream = complete("chat", messages=chat_messages(message), stream=True)
+        except Exception as e:
+            return respond(error_result(e, "conversar"))
 
+    stream = ChatStream(current_user_id, message, cached_response)
 
+    def events():
+        try:
+            if upstream is None:
+                yield stream.delta(cached_response)
+            else:
+                for chunk in upstream:
+                    event = stream.feed(chunk)
+                    if event:
+                        yield event
+            yield stream.done()
+        except Exception as e:
+            yield stream.failed(e)
+        finally:
+            # Também executado quando o cliente desconecta (GeneratorExit):
+            # fechamos o upstream para parar de consumir (e pagar) tokens
+            if upstream is not None:
+                upstream.close()
+            stream.finish()
 
+    return Response(stream_with_context(events()), mimetype="text/event-stream", headers=SSE_HEADERS)
+
+@ai_bp.route("/history", methods=["GET"])
+@jwt_required()
+def history():
+    # Histórico do próprio usuário, das interações mais recentes para as mais
+    # antigas; a próxima página vem com ?cursor=<next_cursor>
+    current_user_id = int(get_jwt_identity())
+    limit = min(max(request.args.get("limit", 20, type=int), 1), 100)
+    interactions, next_cursor = user_history(
+        current_user_id,
+        limit=limit,
+        cursor=request.args.get("cursor"),
+        interaction_type=request.args.get("type")
+    )
+    return jsonify({
+        "results": [interaction_body(i) for i in interactions],
+        "next_cursor": next_cursor
+    }), 200
+
+@ai_bp.route("/cache/stats", methods=["GET"])
+@jwt_required()
+def chat_cache_stats():
+    return jsonify(chat_cache.stats()), 200
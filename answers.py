@@ -0,0 +1,233 @@
+from collections import namedtuple
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import insert
+from sqlalchemy.exc import OperationalError
+from .app import db
+from .models import AnswerEvent
+from .progress import upsert_progress
+from .adaptive import update_ratings
+from .reviews import schedule_reviews
+from .metrics import counter
+import atexit
+import threading
+
+answers_dropped = counter("answer_events_dropped_total", "Respostas do buffer write-behind descartadas, por motivo (rejected: recusadas pelo banco; overflow: buffer cheio com o banco falhando)")
+
+Answer = namedtuple("Answer", ["user_id", "question_id", "subject", "difficulty", "is_correct", "answered_at", "day"])
+
+
+def write_events(answers):
+    # Agrega os contadores por (usuário, dia) num único upsert e grava os
+    # eventos individuais num insert em lote. O commit fica a cargo de quem chama.
+    totals = {}
+    for answer in answers:
+        row = totals.setdefault((answer.user_id, answer.day), {
+            "user_id": answer.user_id,
+            "date": answer.day,
+            "questions_answered": 0,
+            "correct_answers": 0,
+        })
+        row["questions_answered"] += 1
+        row["correct_answers"] += 1 if answer.is_correct else 0
+    upsert_progress(list(totals.values()))
+    db.session.execute(insert(AnswerEvent), [{
+        "user_id": a.user_id,
+        "question_id": a.question_id,
+        "is_correct": a.is_correct,
+        "answered_at": a.answered_at,
+    } for a in answers])
+
+
+def write_aggregates(answers):
+    # Estimativas de habilidade e dificuldade e cartões de revisão: linhas
+    # travadas, disputadas por todas as respostas à mesma questão
+    update_ratings(answers)
+    schedule_reviews(answers)
+
+
+def write_answers(answers):
+    write_events(answers)
+    write_aggregates(answers)
+
+
+class AnswerBuffer:
+    """Buffer write-behind do processo, esvaziado por uma thread própria.
+    writer grava um lote na sessão (por padrão, tudo o que a resposta altera).
+
+    Um lote que falha volta ao início do buffer e é tentado de novo até
+    max_attempts vezes seguidas (sem limite quando o erro é de conexão,
+    OperationalError). Depois disso é dividido ao meio,
+    recursivamente, até isolar os eventos que o banco recusa (ex.: questão
+    apagada); esses são descartados e contados em answer_events_dropped_total.
+    Se nenhuma parte do lote entra, o banco está fora e o lote volta ao buffer.
+    O buffer nunca passa de max_unflushed eventos: enquanto as gravações
+    falham, os mais antigos são descartados em vez de gravados na requisição.
+    """
+
+    def __init__(self, app, interval_ms, batch_size, max_unflushed, max_attempts=3, writer=write_answers, name="answer-flusher"):
+        self.app = app
+        self.writer = writer
+        self.interval = interval_ms / 1000
+        self.batch_size = batch_size
+        self.max_unflushed = max_unflushed
+        self.max_attempts = max_attempts
+        self._answers = []
+        self._failures = 0 # Tentativas seguidas que falharam
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def append(self, answer):
+        with self._cond:
+            self._answers.append(answer)
+            if self._failures:
+                self._trim()
+            pending = len(self._answers)
+            if pending >= self.batch_size:
+                self._cond.notify()
+        if pending >= self.max_unflushed and not self._failures:
+            # Limite de perda atingido: grava antes de responder
+            self.flush()
+
+    def pending(self):
+        return len(self._answers)
+
+    def _trim(self):
+        # Chamado com self._cond adquirido
+        overflow = len(self._answers) - self.max_unflushed
+        if overflow > 0:
+            del self._answers[:overflow]
+            answers_dropped.inc(overflow, reason="overflow")
+
+    def _requeue(self, answers):
+        with self._cond:
+            self._answers[:0] = answers
+            self._trim()
+
+    def _write(self, answers):
+        try:
+            with self.app.app_context():
+                self.writer(answers)
+                db.session.commit()
+            return None
+        except Exception as e:
+            return e
+
+    def _write_isolating(self, answers):
+        # Grava em metades até isolar os eventos recusados; retorna (gravados, recusados)
+        if self._write(answers) is None:
+            return len(answers), []
+        if len(answers) == 1:
+            return 0, answers
+        middle = len(answers) // 2
+        written_left, rejected_left = self._write_isolating(answers[:middle])
+        written_right, rejected_right = self._write_isolating(answers[middle:])
+        return written_left + written_right, rejected_left + rejected_right
+
+    def flush(self):
+        with self._flush_lock:
+            with self._cond:
+                answers, self._answers = self._answers, []
+            if not answers:
+                return 0
+            error = self._write(answers)
+            if error is None:
+                self._failures = 0
+                return len(answers)
+
+            self._failures += 1
+            self.app.logger.warning("Erro ao gravar respostas em lote (tentativa %d): %s", self._failures, error)
+            if self._failures < self.max_attempts or isinstance(error, OperationalError):
+                # Falha de conexão ou banco travado não é culpa dos eventos: só espera
+                self._requeue(answers)
+                return 0
+            written, rejected = self._write_isolating(answers)
+            if not written:
+                # Nada entrou: o problema é o banco, não os eventos
+                self._failures = 1
+                self._requeue(answers)
+                return 0
+            self._failures = 0
+            answers_dropped.inc(len(rejected), reason="rejected")
+            for answer in rejected:
+                self.app.logger.warning("Resposta descartada, recusada pelo banco: %s", answer)
+            return written
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not self._stopped and len(self._answers) < self.batch_size:
+                    self._cond.wait(self.interval)
+                stopped = self._stopped
+            self.flush()
+            if stopped:
+                return
+
+    def close(self):
+        # Chamado no encerramento do processo: grava o que restou no buffer
+        with self._cond:
+            self._stopped = True
+            self._cond.notify()
+        self._thread.join(timeout=10)
+        self.flush()
+
+
+_buffer = None
+_aggregator = None
+_buffer_lock = threading.Lock()
+
+
+def _create_buffer(**kwargs):
+    config = current_app.config
+    return AnswerBuffer(
+        current_app._get_current_object(),
+        config["ANSWER_FLUSH_INTERVAL_MS"],
+        config["ANSWER_FLUSH_BATCH"],
+        config["ANSWER_MAX_UNFLUSHED"],
+        config["ANSWER_FLUSH_MAX_ATTEMPTS"],
+        **kwargs
+    )
+
+
+def get_buffer():
+    # Criado no primeiro uso, já dentro do worker (depois do fork do gunicorn)
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = _create_buffer()
+    return _buffer
+
+
+def get_aggregator():
+    # Buffer só das estimativas e revisões, usado fora do modo write-behind
+    global _aggregator
+    if _aggregator is None:
+        with _buffer_lock:
+            if _aggregator is None:
+                _aggregator = _create_buffer(writer=write_aggregates, name="answer-aggregator")
+    return _aggregator
+
+
+def record_answer(user_id, question, is_correct):
+    # question é um QuestionRecord do catálogo. Retorna True se a resposta já
+    # foi gravada na sessão atual (falta o commit) ou False se ficou no buffer
+    # write-behind. Sem write-behind, progresso e histórico são gravados na
+    # requisição e, com ANSWER_DEFER_AGGREGATES, estimativas e revisões vão em
+    # lote pelo agregador (refletidas em até ANSWER_FLUSH_INTERVAL_MS)
+    answer = Answer(user_id, question.id, question.subject, question.difficulty, is_correct,
+                    datetime.utcnow(), datetime.now().date())
+    config = current_app.config
+    if config["ANSWER_WRITE_BEHIND"]:
+        get_buffer().append(answer)
+        return False
+    if config["ANSWER_DEFER_AGGREGATES"]:
+        write_events([answer])
+        get_aggregator().append(answer)
+    else:
+        write_answers([answer])
+    return True
@@ -1,5 +1,5 @@
 from flask import Flask, request, jsonify
-from config import Config
+from .config import Config
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
@@ -17,8 +17,17 @@ migrate = Migrate(app, db)
 # Configuração JWT
 jwt = JWTManager(app)
 
+# Métricas (/metrics), contagem e tempo das queries por requisição e
+# configuração das chamadas à OpenAI
+from .metrics import init_app as init_metrics
+from .query_stats import init_app as init_query_stats
+from .llm import init_app as init_llm
+init_metrics(app)
+init_query_stats(app)
+init_llm(app)
+
 # Importar modelos e rotas aqui para evitar importações circulares
-from .models import User, Question, UserProgress, Subscription, AIInteraction
+from .models import User, Question, UserProgress, Subscription, AIInteraction, QuestionPoolBucket, AnswerEvent, ProgressSummary, QuestionStats, UserSkill, ReviewCard, StripeEvent
 from .auth import auth_bp
 from .questions import questions_bp
 from .progress import progress_bp
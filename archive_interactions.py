@@ -0,0 +1,19 @@
+import argparse
+import time
+from datetime import datetime, timedelta
+from .app import app
+from .history import archive_before
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move interações com a IA antigas para arquivos NDJSON.gz por dia")
+    parser.add_argument("--days", type=int, help="Mantém na tabela só os últimos N dias (padrão: AI_HISTORY_RETENTION_DAYS)")
+    parser.add_argument("--dir", help="Diretório dos arquivos (padrão: AI_HISTORY_ARCHIVE_DIR)")
+    parser.add_argument("--batch", type=int, default=5000)
+    args = parser.parse_args()
+    with app.app_context():
+        days = args.days or app.config["AI_HISTORY_RETENTION_DAYS"]
+        started = time.perf_counter()
+        stats = archive_before(datetime.utcnow() - timedelta(days=days), args.dir or app.config["AI_HISTORY_ARCHIVE_DIR"], args.batch)
+        ratio = stats["text_bytes"] / stats["archive_bytes"] if stats["archive_bytes"] else 0
+        print(f"{stats['rows']} interações arquivadas em {len(stats['files'])} arquivos em {time.perf_counter() - started:.1f}s "
+              f"({stats['text_bytes'] / 1e6:.1f} MB de texto -> {stats['archive_bytes'] / 1e6:.1f} MB, {ratio:.1f}x)")
@@ -0,0 +1,234 @@
+from a2wsgi import WSGIMiddleware
+from flask_jwt_extended import decode_token
+from flask_jwt_extended.exceptions import JWTExtendedException
+from jwt import ExpiredSignatureError, PyJWTError
+from .app import app
+from .ai import (CHAT_DENIED, GENERATE_DENIED, SSE_HEADERS, ChatStream, admit, cached_chat_response, chat_messages,
+                 chat_reply, error_result, parse_chat, parse_generation, save_generated)
+from .authz import is_revoked
+from .generation import agenerate_one
+from .llm import acomplete, usage_tokens
+from . import metrics, query_stats, stripe_events
+import asyncio
+import json
+import re
+import time
+
+# Modo ASGI (SERVE_MODE=asgi no gunicorn.conf.py): as rotas de IA rodam no
+# event loop com o cliente AsyncOpenAI, então um processo mantém centenas de
+# chamadas à IA em andamento sem ocupar uma thread cada. As demais rotas
+# continuam no app Flask, executado no pool de threads do a2wsgi. Validação,
+# limites, erros, cache e registro vêm de ai.py; aqui fica só o transporte
+# (leitura do corpo, autenticação, envio do JSON e dos eventos SSE).
+# benchmarks/check_serving_contract.py compara as respostas dos dois modos.
+
+_flask = WSGIMiddleware(app, workers=app.config["ASGI_WSGI_THREADS"])
+request_duration = metrics.histogram("http_request_duration_seconds")
+
+
+async def run_sync(fn, *args):
+    # Banco e cache são síncronos: rodam numa thread, dentro do contexto do app
+    def call():
+        with app.app_context():
+            return fn(*args)
+    return await asyncio.to_thread(call)
+
+
+async def read_json(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            break
+    try:
+        return json.loads(body or b"null")
+    except ValueError:
+        return None
+
+
+async def start_response(send, status, content_type, extra_headers=()):
+    headers = [(b"content-type", content_type.encode()), (b"access-control-allow-origin", b"*")]
+    headers.extend(extra_headers)
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+
+
+async def send_json(send, status, data, extra_headers=()):
+    await start_response(send, status, "application/json", extra_headers)
+    await send({"type": "http.response.body", "body": json.dumps(data).encode()})
+
+
+def encode_headers(headers):
+    return [(name.lower().encode(), value.encode()) for name, value in headers.items()]
+
+
+async def send_result(send, result):
+    status, body, headers = result
+    await send_json(send, status, body, encode_headers(headers))
+
+
+async def authorize(scope, msg):
+    # Mesmas regras de authz.subscription_required: retorna (user_id, None)
+    # ou (None, (status, corpo do erro))
+    header = dict(scope["headers"]).get(b"authorization", b"").decode().strip().strip(",")
+    if not header:
+        return None, (401, {"msg": "Missing Authorization Header"})
+    # Como o flask_jwt_extended: o cabeçalho pode trazer vários valores separados por vírgula
+    bearer = [value for value in re.split(r",\s*", header) if value and value.split()[0] == "Bearer"]
+    if len(bearer) != 1:
+        return None, (401, {"msg": "Missing 'Bearer' type in 'Authorization' header. Expected 'Authorization: Bearer <JWT>'"})
+    parts = bearer[0].split()
+    if len(parts) != 2:
+        return None, (422, {"msg": "Bad Authorization header. Expected 'Authorization: Bearer <JWT>'"})
+    token = parts[1]
+    with app.app_context():
+        try:
+            payload = decode_token(token)
+        except ExpiredSignatureError:
+            return None, (401, {"msg": "Token has expired"})
+        except (PyJWTError, JWTExtendedException) as e:
+            return None, (422, {"msg": str(e)})
+    if payload.get("type") != "access":
+        return None, (422, {"msg": "Only non-refresh tokens are allowed"})
+    # De tempos em tempos is_revoked relê as revogações no banco: fora do event loop
+    if await run_sync(is_revoked, payload):
+        return None, (401, {"msg": "Token has been revoked"})
+    if not payload.get("sub_active"):
+        return None, (403, {"msg": msg})
+    return int(payload["sub"]), None
+
+
+async def generate_question_ia(scope, receive, send):
+    user_id, error = await authorize(scope, GENERATE_DENIED)
+    if error:
+        return await send_json(send, *error)
+    fields, error = parse_generation(await read_json(receive))
+    if error:
+        return await send_result(send, error)
+    prompt, subject, exam_type = fields
+    error = await run_sync(admit, user_id, "generate")
+    if error:
+        return await send_result(send, error)
+    try:
+        result = await agenerate_one(subject, exam_type, prompt)
+        reply = await run_sync(save_generated, user_id, subject, exam_type, prompt, result)
+    except Exception as e:
+        reply = error_result(e, "gerar questão")
+    await send_result(send, reply)
+
+
+async def chat(scope, receive, send):
+    user_id, error = await authorize(scope, CHAT_DENIED)
+    if error:
+        return await send_json(send, *error)
+    message, error = parse_chat(await read_json(receive))
+    if error:
+        return await send_result(send, error)
+    error = await run_sync(admit, user_id, "chat")
+    if error:
+        return await send_result(send, error)
+
+    content = await run_sync(cached_chat_response, message)
+    cached = content is not None
+    tokens = (None, None)
+    if not cached:
+        try:
+            response = await acomplete("chat", messages=chat_messages(message))
+            content = response.choices[0].message.content
+        except Exception as e:
+            return await send_result(send, error_result(e, "conversar"))
+        tokens = usage_tokens(response)
+    await send_result(send, await run_sync(chat_reply, user_id, message, content, cached, tokens))
+
+
+async def chat_stream(scope, receive, send):
+    user_id, error = await authorize(scope, CHAT_DENIED)
+    if error:
+        return await send_json(send, *error)
+    message, error = parse_chat(await read_json(receive))
+    if error:
+        return await send_result(send, error)
+    error = await run_sync(admit, user_id, "chat")
+    if error:
+        return await send_result(send, error)
+
+    cached_response = await run_sync(cached_chat_response, message)
+    upstream = None
+    if cached_response is None:
+        try:
+            upstream = await acomplete("chat", messages=chat_messages(message), stream=True)
+        except Exception as e:
+            return await send_result(send, error_result(e, "conversar"))
+    state = ChatStream(user_id, message, cached_response)
+
+    async def emit(text):
+        await send({"type": "http.response.body", "body": text.encode(), "more_body": True})
+
+    async def stream():
+        await start_response(send, 200, "text/event-stream", encode_headers(SSE_HEADERS))
+        try:
+            if upstream is None:
+                await emit(state.delta(cached_response))
+            else:
+                async for chunk in upstream:
+                    event = state.feed(chunk)
+                    if event:
+                        await emit(event)
+            await emit(state.done())
+        except Exception as e:
+            await emit(state.failed(e))
+        await send({"type": "http.response.body", "body": b""})
+
+    async def disconnected():
+        while (await receive())["type"] != "http.disconnect":
+            pass
+
+    # Se o cliente desconectar, o stream é cancelado e o upstream fechado,
+    # para parar de consumir (e pagar) tokens
+    streaming, watcher = asyncio.ensure_future(stream()), asyncio.ensure_future(disconnected())
+    try:
+        await asyncio.wait({streaming, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for task in (streaming, watcher):
+            task.cancel()
+        await asyncio.gather(streaming, watcher, return_exceptions=True)
+        if upstream is not None:
+            await upstream.close()
+        await run_sync(state.finish)
+
+
+ROUTES = {
+    "/ai/generate_question_ia": generate_question_ia,
+    "/ai/chat": chat,
+    "/ai/chat/stream": chat_stream,
+}
+# Mesmos nomes de endpoint das rotas Flask equivalentes, para as métricas
+ENDPOINTS = {path: app.url_map.bind("").match(path, method="POST")[0] for path in ROUTES}
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                if app.config["METRICS_DIR"]:
+                    metrics.start_exporter(app.config["METRICS_DIR"], app.config["METRICS_EXPORT_INTERVAL"])
+                stripe_events.start_worker(app)
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    route = ROUTES.get(scope["path"]) if scope["type"] == "http" and scope["method"] == "POST" else None
+    if route is not None:
+        endpoint = ENDPOINTS[scope["path"]]
+        started = time.perf_counter()
+
+        async def send_timed(message):
+            if message["type"] == "http.response.start":
+                # Mesma medida das rotas Flask: até o início da resposta
+                request_duration.observe(time.perf_counter() - started, endpoint=endpoint, method="POST", status=message["status"])
+            await send(message)
+
+        with query_stats.track(endpoint):
+            return await route(scope, receive, send_timed)
+    await _flask(scope, receive, send)
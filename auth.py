@@ -1,8 +1,9 @@
 from flask import Blueprint, request, jsonify
 from werkzeug.security import generate_password_hash, check_password_hash
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required, get_jwt_identity
 from .app import db
 from .models import User
+from .authz import issue_tokens
 
 auth_bp = Blueprint("auth", __name__, url_prefix="/auth")
 
@@ -34,11 +35,21 @@ def login():
     user = User.query.filter_by(email=email).first()
 
     if user and check_password_hash(user.password, password):
-        access_token = create_access_token(identity=user.id)
-        return jsonify(access_token=access_token), 200
+        access_token, refresh_token = issue_tokens(user)
+        return jsonify(access_token=access_token, refresh_token=refresh_token), 200
     else:
         return jsonify({"msg": "Email ou senha incorretos"}), 401
 
+@auth_bp.route("/refresh", methods=["POST"])
+@jwt_required(refresh=True)
+def refresh():
+    # Única consulta ao usuário: recarrega o estado da assinatura para as claims
+    user = db.session.get(User, int(get_jwt_identity()))
+    if not user:
+        return jsonify({"msg": "Usuário não encontrado"}), 404
+    access_token, _ = issue_tokens(user)
+    return jsonify(access_token=access_token), 200
+
 @auth_bp.route("/protected", methods=["GET"])
 @jwt_required()
 def protected():
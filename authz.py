@@ -0,0 +1,95 @@
+from functools import wraps
+from flask import current_app, jsonify
+from flask_jwt_extended import create_access_token, create_refresh_token, get_jwt, verify_jwt_in_request
+from .app import db, jwt
+from .models import User
+import threading
+import time
+
+# Revogação dos tokens de acesso (mudança de assinatura via Stripe): o
+# instante fica em User.tokens_valid_after, visível para todos os processos.
+# Cada processo guarda as revogações ainda dentro do tempo de vida de um
+# token de acesso e relê a lista a cada TOKEN_REVOCATION_REFRESH_S, com uma
+# consulta só; as rotas continuam sem consultar o usuário a cada requisição.
+_revoked_after = {}
+_revoked_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+_refreshed_at = None
+
+
+def subscription_tier(user):
+    return "premium" if user.is_subscribed else "free"
+
+
+def issue_tokens(user):
+    # A assinatura vai como claims assinadas; as rotas protegidas não
+    # precisam consultar o usuário no banco
+    claims = {"sub_active": bool(user.is_subscribed), "tier": subscription_tier(user)}
+    identity = str(user.id)
+    return create_access_token(identity=identity, additional_claims=claims), create_refresh_token(identity=identity)
+
+
+def revoke_tokens(user_id):
+    # Tokens de acesso emitidos antes de agora deixam de valer; o cliente usa
+    # /auth/refresh para receber claims atualizadas. Grava na sessão atual:
+    # os outros processos veem a revogação depois do commit de quem chamou.
+    # iat é gravado em segundos inteiros: um token emitido no mesmo segundo
+    # da revogação (ex.: o refresh logo depois do webhook) continua valendo
+    now = int(time.time())
+    User.query.filter_by(id=int(user_id)).update({"tokens_valid_after": now}, synchronize_session=False)
+    with _revoked_lock:
+        _revoked_after[int(user_id)] = max(now, _revoked_after.get(int(user_id), 0))
+
+
+def _refresh_revocations():
+    global _revoked_after, _refreshed_at
+    horizon = int(time.time() - current_app.config["JWT_ACCESS_TOKEN_EXPIRES"].total_seconds())
+    try:
+        rows = db.session.query(User.id, User.tokens_valid_after).filter(User.tokens_valid_after >= horizon).all()
+    except Exception as e:
+        # Segue com a lista anterior até a próxima tentativa
+        current_app.logger.warning("Erro ao ler as revogações de tokens: %s", e)
+        rows = None
+    if rows is not None:
+        revoked = dict(rows)
+        with _revoked_lock:
+            # Mantém as revogações deste processo ainda não confirmadas
+            for user_id, revoked_at in _revoked_after.items():
+                if revoked_at >= horizon and revoked_at > revoked.get(user_id, 0):
+                    revoked[user_id] = revoked_at
+            _revoked_after = revoked
+    _refreshed_at = time.monotonic()
+
+
+def is_revoked(jwt_payload):
+    # Chamado com o contexto da aplicação ativo
+    if jwt_payload.get("type") != "access":
+        return False
+    stale = _refreshed_at is None or time.monotonic() - _refreshed_at >= current_app.config["TOKEN_REVOCATION_REFRESH_S"]
+    # Uma releitura por vez; enquanto isso, as demais requisições usam a lista atual
+    if stale and _refresh_lock.acquire(blocking=_refreshed_at is None):
+        try:
+            if _refreshed_at is None or time.monotonic() - _refreshed_at >= current_app.config["TOKEN_REVOCATION_REFRESH_S"]:
+                _refresh_revocations()
+        finally:
+            _refresh_lock.release()
+    revoked_at = _revoked_after.get(int(jwt_payload["sub"]))
+    return revoked_at is not None and jwt_payload["iat"] < revoked_at
+
+
+@jwt.token_in_blocklist_loader
+def _token_revoked(jwt_header, jwt_payload):
+    return is_revoked(jwt_payload)
+
+
+def subscription_required(msg="Assinatura necessária"):
+    # Substitui @jwt_required() nas rotas para assinantes, lendo só as claims
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            verify_jwt_in_request()
+            if not get_jwt().get("sub_active"):
+                return jsonify({"msg": msg}), 403
+            return fn(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,21 @@
+import importlib
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_app(database_url="sqlite:///:memory:", **env):
+    # O backend é um pacote com imports relativos; importamos pelo nome da
+    # pasta do repositório, com o banco e as variáveis apontando para recursos locais
+    os.environ["DATABASE_URL"] = database_url
+    os.environ.setdefault("OPENAI_API_KEY", "sk-local-benchmark")
+    os.environ.update(env)
+    for path in (ROOT, os.path.dirname(ROOT)):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+    return load_module("app")
+
+
+def load_module(name):
+    return importlib.import_module(f"{os.path.basename(ROOT)}.{name}")
@@ -0,0 +1,121 @@
+"""Simulação do modelo adaptativo com usuários e questões sintéticos.
+
+Cada usuário tem uma habilidade real e cada questão uma dificuldade real
+(normais padrão); as respostas seguem o modelo logístico. Mede o custo de
+cada atualização (em memória e gravando pelo caminho de write_answers) e a
+convergência das estimativas, sorteando questões ao acaso ou no modo
+adaptativo (alvo de ADAPTIVE_TARGET_SUCCESS de acerto).
+
+Uso: python benchmarks/bench_adaptive.py [--users 1000] [--questions 2000] [--answers-per-user 200]
+"""
+import argparse
+import json
+import math
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+from _bootstrap import load_app, load_module
+
+CHECKPOINTS = (10, 25, 50, 100, 200, 400)
+
+
+def rmse(estimates, truth):
+    # As escalas só são identificáveis a menos de uma translação: centraliza antes
+    offset = statistics.fmean(estimates) - statistics.fmean(truth)
+    return math.sqrt(statistics.fmean((e - offset - t) ** 2 for e, t in zip(estimates, truth)))
+
+
+def simulate(adaptive, args, adaptive_module, rng):
+    true_ability = [rng.gauss(0, 1) for _ in range(args.users)]
+    true_difficulty = [rng.gauss(0, 1) for _ in range(args.questions)]
+    skills = [SimpleNamespace(rating=0.0, attempts=0, correct=0) for _ in range(args.users)]
+    stats = [SimpleNamespace(rating=0.0, attempts=0, correct=0) for _ in range(args.questions)]
+    target_success = 0.7
+    report, update_time, outcomes = [], 0.0, []
+
+    for step in range(1, args.answers_per_user + 1):
+        for user in range(args.users):
+            if adaptive:
+                target = adaptive_module.target_rating(skills[user].rating, target_success)
+                candidates = rng.sample(range(args.questions), 8)
+                question = min(candidates, key=lambda q: abs(stats[q].rating - target))
+            else:
+                question = rng.randrange(args.questions)
+            p = adaptive_module.expected(true_ability[user], true_difficulty[question])
+            is_correct = rng.random() < p
+            if step > args.answers_per_user // 2:
+                outcomes.append(is_correct)
+            start = time.perf_counter()
+            adaptive_module.elo_update(skills[user], stats[question], is_correct)
+            update_time += time.perf_counter() - start
+        if step in CHECKPOINTS:
+            report.append({
+                "answers_per_user": step,
+                "ability_rmse": round(rmse([s.rating for s in skills], true_ability), 3),
+                "difficulty_rmse": round(rmse([s.rating for s in stats], true_difficulty), 3),
+            })
+    return {
+        "update_us": round(update_time / (args.users * args.answers_per_user) * 1e6, 2),
+        "success_rate_second_half": round(sum(outcomes) / len(outcomes), 3),
+        "convergence": report,
+    }
+
+
+def db_update_cost(args, rng):
+    database_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    app_module = load_app(database_url)
+    models = load_module("models")
+    answers_module = load_module("answers")
+    app, db = app_module.app, app_module.db
+    users, questions, total = 200, 2000, args.db_answers
+    with app.app_context():
+        db.create_all()
+        db.session.add_all(models.User(email=f"u{i}@example.com", password="x") for i in range(users))
+        db.session.add_all(
+            models.Question(text=f"Questão {i}?", options=["a", "b"], correct_answer="a", subject="Física", exam_type="ENEM")
+            for i in range(questions)
+        )
+        db.session.commit()
+        now = datetime.utcnow()
+        answers = [
+            answers_module.Answer(rng.randint(1, users), rng.randint(1, questions), "Física", "medium",
+                                  rng.random() < 0.6, now, now.date())
+            for _ in range(total)
+        ]
+        result = {}
+        for batch_size in (1, 500):
+            start = time.perf_counter()
+            for i in range(0, total, batch_size):
+                answers_module.write_answers(answers[i:i + batch_size])
+                db.session.commit()
+            result[f"batch_{batch_size}_us_per_answer"] = round((time.perf_counter() - start) / total * 1e6, 1)
+        result["question_stats_rows"] = models.QuestionStats.query.count()
+        result["user_skill_rows"] = models.UserSkill.query.count()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--questions", type=int, default=2000)
+    parser.add_argument("--answers-per-user", type=int, default=200)
+    parser.add_argument("--db-answers", type=int, default=5000)
+    args = parser.parse_args()
+
+    load_app()
+    adaptive_module = load_module("adaptive")
+    rng = random.Random(42)
+    print(json.dumps({
+        "random_selection": simulate(False, args, adaptive_module, rng),
+        "adaptive_selection": simulate(True, args, adaptive_module, rng),
+        "write_answers": db_update_cost(args, rng),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
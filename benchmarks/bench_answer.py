@@ -0,0 +1,155 @@
+"""Responde questões em paralelo e confere se nenhum incremento de
+UserProgress foi perdido; compara a vazão do caminho atual (upsert atômico)
+com o caminho antigo (quatro idas ao banco e leitura-modificação-escrita).
+
+Com --write-behind, o caminho atual usa o buffer de respostas e as contagens
+são conferidas depois do flush. Sem ele, estimativas e revisões vão pelo
+agregador (--inline-aggregates as grava na requisição, como antes). Termina
+com erro se o caminho atual perder ou recusar alguma resposta, inclusive nas
+estimativas de habilidade.
+
+Uso: python benchmarks/bench_answer.py [--answers 2000] [--threads 16] [--write-behind | --inline-aggregates] [--database-url sqlite:///...]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from _bootstrap import load_app, load_module
+
+
+def legacy_answer(db, models, user_id, question_id, answer):
+    # Reprodução do answer_question antes do upsert
+    user = db.session.get(models.User, user_id)
+    question = db.session.get(models.Question, question_id)
+    is_correct = answer == question.correct_answer
+    today = datetime.now().date()
+    progress = models.UserProgress.query.filter_by(user_id=user.id, date=today).first()
+    if not progress:
+        progress = models.UserProgress(user_id=user.id, date=today, questions_answered=0, correct_answers=0)
+        db.session.add(progress)
+    progress.questions_answered += 1
+    if is_correct:
+        progress.correct_answers += 1
+    db.session.commit()
+    return is_correct
+
+
+def run(app, fire, answers, threads):
+    errors = 0
+    errors_lock = threading.Lock()
+
+    def task(i):
+        nonlocal errors
+        with app.app_context():
+            try:
+                fire(i)
+            except Exception:
+                with errors_lock:
+                    errors += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        list(executor.map(task, range(answers)))
+    return time.perf_counter() - start, errors
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--answers", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--database-url", default=None)
+    parser.add_argument("--write-behind", action="store_true")
+    parser.add_argument("--inline-aggregates", action="store_true")
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    database_url = args.database_url or f"sqlite:///{os.path.join(tmpdir, 'bench.db')}"
+    app_module = load_app(database_url, ANSWER_WRITE_BEHIND=str(args.write_behind).lower(),
+                          ANSWER_DEFER_AGGREGATES=str(not args.inline_aggregates).lower())
+    models = load_module("models")
+    app, db = app_module.app, app_module.db
+    from flask_jwt_extended import create_access_token
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        users = [models.User(email=f"bench{i}@example.com", password="x") for i in range(2)]
+        question = models.Question(text="2 + 2?", options=["3", "4"], correct_answer="4", subject="Matemática", exam_type="ENEM")
+        db.session.add_all(users + [question])
+        db.session.commit()
+        current_id, legacy_id, question_id = users[0].id, users[1].id, question.id
+        headers = {"Authorization": f"Bearer {create_access_token(identity=str(current_id))}"}
+
+        legacy_headers = {"Authorization": f"Bearer {create_access_token(identity=str(legacy_id))}"}
+        database = db.engine.dialect.name
+
+    # O caminho antigo é exposto numa rota à parte para passar pelo mesmo
+    # processamento HTTP/JWT que o atual
+    from flask import request, jsonify
+    from flask_jwt_extended import jwt_required, get_jwt_identity
+
+    @jwt_required()
+    def legacy_view(question_id):
+        is_correct = legacy_answer(db, models, int(get_jwt_identity()), question_id, request.get_json()["answer"])
+        return jsonify({"is_correct": is_correct})
+
+    app.add_url_rule("/legacy/<int:question_id>/answer", "legacy_answer", legacy_view, methods=["POST"])
+    app.logger.disabled = True # Conflitos do caminho antigo são contados em "errors"
+    client = app.test_client()
+
+    def firing(prefix, headers):
+        def fire(i):
+            response = client.post(f"{prefix}/{question_id}/answer", json={"answer": "4" if i % 2 else "3"}, headers=headers)
+            if response.status_code != 200:
+                raise RuntimeError(response.status_code)
+        return fire
+
+    report = {"answers": args.answers, "threads": args.threads, "database": database}
+    for name, fire, user_id in (
+        ("legacy", firing("/legacy", legacy_headers), legacy_id),
+        ("current", firing("/questions", headers), current_id),
+    ):
+        elapsed, errors = run(app, fire, args.answers, args.threads)
+        if name == "current":
+            answers = load_module("answers")
+            with app.app_context():
+                if args.write_behind:
+                    answers.get_buffer().flush()
+                elif not args.inline_aggregates:
+                    answers.get_aggregator().flush()
+        with app.app_context():
+            rows = models.UserProgress.query.filter_by(user_id=user_id).all()
+            recorded = sum(r.questions_answered for r in rows)
+            correct = sum(r.correct_answers for r in rows)
+            skill = models.UserSkill.query.filter_by(user_id=user_id).first()
+        report[name] = {
+            "answers_per_s": round(args.answers / elapsed, 1),
+            "errors": errors,
+            "progress_rows": len(rows),
+            "recorded_answers": recorded,
+            "recorded_correct": correct,
+            "lost_updates": args.answers - errors - recorded,
+            "rated_answers": skill.attempts if skill else 0,
+        }
+
+    print(json.dumps(report, indent=2))
+
+    # O caminho antigo perde incrementos por construção; o atual não pode perder nenhum
+    current = report["current"]
+    expected_correct = args.answers // 2
+    if current["errors"] or current["recorded_answers"] != args.answers or current["recorded_correct"] != expected_correct \
+            or current["rated_answers"] != args.answers:
+        print(f"Caminho atual: {current['recorded_answers']}/{args.answers} respostas, "
+              f"{current['recorded_correct']}/{expected_correct} acertos e {current['rated_answers']}/{args.answers} "
+              f"estimativas gravados, {current['errors']} erros", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Consultas ao banco e vazão por requisição protegida por assinatura:
+checagem antiga (User.query.get a cada requisição) contra as claims do JWT.
+
+Uso: python benchmarks/bench_authz.py [--requests 3000]
+"""
+import argparse
+import json
+import time
+import warnings
+
+from _bootstrap import load_app, load_module
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=3000)
+    args = parser.parse_args()
+    warnings.simplefilter("ignore") # Query.get() da reprodução antiga é legado no SQLAlchemy 2
+
+    app_module = load_app()
+    models = load_module("models")
+    authz = load_module("authz")
+    app, db = app_module.app, app_module.db
+    from flask import jsonify
+    from flask_jwt_extended import jwt_required, get_jwt_identity
+    from sqlalchemy import event
+
+    # Duas rotas vazias, uma com cada forma de checar a assinatura
+    @jwt_required()
+    def legacy_gated():
+        user = models.User.query.get(get_jwt_identity())
+        if not user or not user.is_subscribed:
+            return jsonify({"msg": "Assinatura necessária"}), 403
+        return jsonify({"ok": True})
+
+    @authz.subscription_required()
+    def claims_gated():
+        return jsonify({"ok": True})
+
+    app.add_url_rule("/bench/legacy", "bench_legacy", legacy_gated)
+    app.add_url_rule("/bench/claims", "bench_claims", claims_gated)
+
+    with app.app_context():
+        db.create_all()
+        user = models.User(email="bench@example.com", password="x", is_subscribed=True)
+        db.session.add(user)
+        db.session.commit()
+        headers = {"Authorization": f"Bearer {authz.issue_tokens(user)[0]}"}
+        engine = db.engine
+
+    statements = 0
+
+    def count(*_):
+        nonlocal statements
+        statements += 1
+
+    event.listen(engine, "before_cursor_execute", count)
+
+    client = app.test_client()
+    report = {"requests": args.requests}
+    for name, path in (("legacy", "/bench/legacy"), ("claims", "/bench/claims")):
+        statements = 0
+        start = time.perf_counter()
+        for _ in range(args.requests):
+            assert client.get(path, headers=headers).status_code == 200
+        elapsed = time.perf_counter() - start
+        report[name] = {
+            "requests_per_s": round(args.requests / elapsed, 1),
+            "queries_per_request": round(statements / args.requests, 2),
+        }
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
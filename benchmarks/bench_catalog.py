@@ -0,0 +1,68 @@
+"""Vazão do caminho de resposta com o catálogo de questões ligado e desligado.
+
+Uso: python benchmarks/bench_catalog.py [--questions 500] [--answers 3000]
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from _bootstrap import load_app, load_module
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--questions", type=int, default=500)
+    parser.add_argument("--answers", type=int, default=3000)
+    args = parser.parse_args()
+
+    database_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    app_module = load_app(database_url)
+    models = load_module("models")
+    app, db = app_module.app, app_module.db
+    from flask_jwt_extended import create_access_token
+    from sqlalchemy import event
+
+    with app.app_context():
+        db.create_all()
+        user = models.User(email="bench@example.com", password="x")
+        db.session.add(user)
+        db.session.add_all(
+            models.Question(text=f"Questão {i}?", options=["a", "b", "c", "d"], correct_answer="b", subject="Física", exam_type="ENEM")
+            for i in range(args.questions)
+        )
+        db.session.commit()
+        headers = {"Authorization": f"Bearer {create_access_token(identity=str(user.id))}"}
+        engine = db.engine
+
+    statements = 0
+
+    def count(*_):
+        nonlocal statements
+        statements += 1
+
+    event.listen(engine, "before_cursor_execute", count)
+
+    client = app.test_client()
+    rng = random.Random(42)
+    ids = [rng.randint(1, args.questions) for _ in range(args.answers)]
+    report = {"questions": args.questions, "answers": args.answers}
+    for enabled in (False, True):
+        app.config["QUESTION_CACHE_ENABLED"] = enabled
+        statements = 0
+        start = time.perf_counter()
+        for question_id in ids:
+            client.post(f"/questions/{question_id}/answer", json={"answer": "b"}, headers=headers)
+        elapsed = time.perf_counter() - start
+        report["cache_on" if enabled else "cache_off"] = {
+            "answers_per_s": round(args.answers / elapsed, 1),
+            "queries_per_answer": round(statements / args.answers, 2),
+        }
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
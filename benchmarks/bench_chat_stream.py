@@ -0,0 +1,135 @@
+"""Mede o tempo até o primeiro byte (TTFB) de /ai/chat e /ai/chat/stream
+contra um upstream falso que emite tokens com atraso, e confere o contrato
+do stream:
+
+- eventos data com {"delta"} cuja concatenação é a resposta, seguidos de event: done
+- resposta do cache enviada num único delta, sem chamar o upstream
+- cliente que desconecta no meio do stream fecha a conexão com o upstream
+
+Termina com erro se alguma verificação falhar.
+
+Uso: python benchmarks/bench_chat_stream.py [--latency 0.3] [--token-delay 0.02] [--runs 5]
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+
+from _bootstrap import load_app, load_module
+from fake_openai import FakeOpenAI
+
+
+def timed(client, path, headers, message):
+    # Retorna (ttfb, total) lendo a resposta sem buffer
+    start = time.perf_counter()
+    response = client.post(path, json={"message": message}, headers=headers, buffered=False)
+    assert response.status_code == 200, response.status_code
+    chunks = iter(response.response)
+    next(chunks)
+    ttfb = time.perf_counter() - start
+    for _ in chunks:
+        pass
+    response.close()
+    return ttfb, time.perf_counter() - start
+
+
+def parse_sse(text):
+    # Lista de (evento, dados) na ordem recebida; evento None é o padrão (message)
+    events = []
+    for block in text.split("\n\n"):
+        if not block.strip():
+            continue
+        event, data = None, None
+        for line in block.split("\n"):
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+            elif line.startswith("data: "):
+                data = json.loads(line[len("data: "):])
+        events.append((event, data))
+    return events
+
+
+def check_stream(events, expected):
+    # Deltas seguidos de done; retorna a lista de problemas encontrados
+    problems = []
+    if not events or events[-1][0] != "done":
+        problems.append(f"último evento deveria ser done: {events[-1:]}")
+    deltas = events[:-1]
+    if any(event is not None or "delta" not in data for event, data in deltas):
+        problems.append("eventos antes de done deveriam ser só deltas")
+    text = "".join(data.get("delta", "") for _, data in deltas)
+    if text != expected:
+        problems.append(f"deltas concatenados diferem da resposta: {text[:80]!r}")
+    return problems, len(deltas)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    failures = []
+    with FakeOpenAI(latency=args.latency, token_delay=args.token_delay) as fake:
+        app_module = load_app(OPENAI_BASE_URL=fake.base_url, CHAT_CACHE_ENABLED="true", CHAT_CACHE_BACKEND="memory",
+                              CHAT_CACHE_SIMILARITY_THRESHOLD="0", RATE_LIMIT_ENABLED="false")
+        models = load_module("models")
+        authz = load_module("authz")
+
+        app, db = app_module.app, app_module.db
+        with app.app_context():
+            db.create_all()
+            user = models.User(email="bench@example.com", password="x", is_subscribed=True)
+            db.session.add(user)
+            db.session.commit()
+            headers = {"Authorization": f"Bearer {authz.issue_tokens(user)[0]}"}
+
+        client = app.test_client()
+        report = {"upstream_latency_s": args.latency, "token_delay_s": args.token_delay}
+        # Mensagens diferentes a cada execução: o cache não interfere na medida
+        for name, path in (("chat", "/ai/chat"), ("chat_stream", "/ai/chat/stream")):
+            samples = [timed(client, path, headers, f"O que é mitose? ({name} {i})") for i in range(args.runs)]
+            report[name] = {
+                "ttfb_median_s": round(statistics.median(s[0] for s in samples), 3),
+                "total_median_s": round(statistics.median(s[1] for s in samples), 3),
+            }
+
+        # Contrato: resposta nova em vários deltas, depois a mesma mensagem pelo cache
+        expected = fake.completion_content({})
+        message = "Qual a diferença entre mitose e meiose?"
+        for phase in ("upstream", "cached"):
+            calls_before = fake.requests
+            response = client.post("/ai/chat/stream", json={"message": message}, headers=headers)
+            problems, deltas = check_stream(parse_sse(response.get_data(as_text=True)), expected)
+            upstream_calls = fake.requests - calls_before
+            if phase == "upstream" and deltas < 2:
+                problems.append(f"resposta do upstream deveria vir em vários deltas, veio em {deltas}")
+            if phase == "cached" and (deltas != 1 or upstream_calls):
+                problems.append(f"resposta do cache deveria vir num único delta sem chamar o upstream ({deltas} deltas, {upstream_calls} chamadas)")
+            report[f"contract_{phase}"] = {"deltas": deltas, "upstream_calls": upstream_calls, "problems": problems}
+            failures += [f"{phase}: {p}" for p in problems]
+
+        # Desconexão: o cliente lê o primeiro evento e fecha; o upstream deve ver a conexão cair
+        fake.token_delay = max(args.token_delay, 0.05)
+        aborted_before = fake.streams_aborted
+        response = client.post("/ai/chat/stream", json={"message": "Explique a meiose em detalhes"}, headers=headers, buffered=False)
+        next(iter(response.response))
+        response.close()
+        deadline = time.monotonic() + fake.token_delay * len(expected.split()) + 5
+        while fake.streams_aborted == aborted_before and time.monotonic() < deadline:
+            time.sleep(0.05)
+        closed = fake.streams_aborted > aborted_before
+        report["disconnect_closes_upstream"] = closed
+        if not closed:
+            failures.append("desconexão: o upstream continuou transmitindo depois que o cliente fechou o stream")
+
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if failures:
+        print("Falhas:\n  " + "\n  ".join(failures), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
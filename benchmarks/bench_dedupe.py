@@ -0,0 +1,87 @@
+"""Tempo de carga e latência de consulta do índice MinHash/LSH de quase duplicatas.
+
+As assinaturas de fundo são aleatórias (equivalentes a textos distintos);
+as consultas usam textos reais, metade delas paráfrases de questões indexadas.
+
+Uso: python benchmarks/bench_dedupe.py [--questions 1000000] [--queries 2000]
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+from array import array
+
+from _bootstrap import load_app, load_module
+
+TEMPLATES = [
+    "Qual é a principal função do {0} no processo de {1} em {2}?",
+    "Em relação ao {0}, assinale a alternativa correta sobre {1} e {2}.",
+    "Paciente com {0} apresenta {1} há três dias; qual a conduta inicial para {2}?",
+]
+WORDS = "dna rna mitocondria ribossomo fotossintese mitose meiose enzima hipertensao diabetes febre tosse dispneia".split()
+
+
+def paraphrase(text, rng):
+    words = text.split()
+    i = rng.randrange(len(words))
+    return " ".join(words[:i] + ["realmente"] + words[i:])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--questions", type=int, default=1000000)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    load_app()
+    dedupe = load_module("dedupe")
+    rng = random.Random(42)
+
+    texts = [
+        rng.choice(TEMPLATES).format(*rng.sample(WORDS, 3)) + f" (caso {i})"
+        for i in range(args.queries // 2)
+    ]
+    start = time.perf_counter()
+    ids = array("I", range(1, args.questions + 1))
+    signatures = [array("H", (rng.getrandbits(16) for _ in range(dedupe.NUM_PERM))) for _ in range(args.questions - len(texts))]
+    signatures += [dedupe.signature(text) for text in texts]
+    generate_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index = dedupe.SignatureIndex(ids, signatures)
+    build_s = time.perf_counter() - start
+
+    queries = [paraphrase(text, rng) for text in texts] + [
+        rng.choice(TEMPLATES).format(*rng.sample(WORDS, 3)) + f" (novo {i})" for i in range(args.queries - len(texts))
+    ]
+    rng.shuffle(queries)
+    signature_times, lookup_times, found = [], [], 0
+    for text in queries:
+        t = time.perf_counter()
+        sig = dedupe.signature(text)
+        signature_times.append(time.perf_counter() - t)
+        t = time.perf_counter()
+        found += index.find(sig, 0.7) is not None
+        lookup_times.append(time.perf_counter() - t)
+
+    def summary(values):
+        values = sorted(values)
+        return {
+            "p50_us": round(statistics.median(values) * 1e6, 1),
+            "p99_us": round(values[int(len(values) * 0.99)] * 1e6, 1),
+        }
+
+    print(json.dumps({
+        "questions": args.questions,
+        "signatures_s": round(generate_s, 1),
+        "build_s": round(build_s, 1),
+        "signature": summary(signature_times),
+        "lookup": summary(lookup_times),
+        "paraphrases": len(texts),
+        "matched": found,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""Compara a geração sequencial (laço antigo) com o fan-out concorrente
+e com o modo em lote (várias questões por chamada).
+
+Uso: python benchmarks/bench_generation.py [--questions 10] [--latency 0.3] [--concurrency N] [--batch-size 5]
+"""
+import argparse
+import json
+import time
+
+from _bootstrap import load_app, load_module
+from fake_openai import FakeOpenAI
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--questions", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--concurrency", type=int, default=None, help="padrão: uma chamada por questão")
+    parser.add_argument("--batch-size", type=int, default=5)
+    parser.add_argument("--invalid-every", type=int, default=0, help="injeta um item inválido a cada N no lote")
+    args = parser.parse_args()
+
+    with FakeOpenAI(latency=args.latency, invalid_every=args.invalid_every) as fake:
+        app_module = load_app(OPENAI_BASE_URL=fake.base_url)
+        generation = load_module("generation")
+
+        with app_module.app.app_context():
+            start = time.perf_counter()
+            for _ in range(args.questions):
+                generation.generate_one("Biologia", "ENEM", "mitose")
+            sequential = time.perf_counter() - start
+
+            start = time.perf_counter()
+            results, errors = generation.generate_many(
+                "Biologia", "ENEM", "mitose", args.questions, max_concurrency=args.concurrency or args.questions
+            )
+            concurrent = time.perf_counter() - start
+
+            calls_before = fake.requests
+            start = time.perf_counter()
+            batch_results, batch_errors = generation.generate_many(
+                "Biologia", "ENEM", "mitose", args.questions, batch_size=args.batch_size
+            )
+            batched = time.perf_counter() - start
+            batch_calls = fake.requests - calls_before
+
+    print(json.dumps({
+        "questions": args.questions,
+        "upstream_latency_s": args.latency,
+        "sequential_s": round(sequential, 3),
+        "concurrent_s": round(concurrent, 3),
+        "generated": len(results),
+        "errors": len(errors),
+        "batched_s": round(batched, 3),
+        "batch_generated": len(batch_results),
+        "batch_errors": len(batch_errors),
+        "batch_upstream_calls": batch_calls,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""Histórico de interações com a IA (history.py) numa tabela grande: espaço
+ocupado pelas respostas com e sem compressão, latência do /ai/history (primeira
+página e páginas profundas pelo cursor) com o índice (user_id, timestamp, id)
+comparada a OFFSET e à tabela sem o índice, e o job de arquivamento (linhas
+movidas, tamanho dos arquivos NDJSON.gz e espaço liberado na tabela).
+
+As respostas são sorteadas de um conjunto gerado com o vocabulário das
+questões iniciais (frequência de Zipf), para que a taxa de compressão seja a de
+texto em português, não a de texto repetido.
+
+Uso: python benchmarks/bench_history.py [--rows 10000000] [--users 20000] [--heavy-rows 5000]
+"""
+import argparse
+import json
+import os
+import random
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import zlib
+from datetime import datetime, timedelta
+
+from _bootstrap import ROOT, load_app, load_module
+
+
+def vocabulary():
+    words = []
+    for name in sorted(os.listdir(os.path.join(ROOT, "initial_questions"))):
+        with open(os.path.join(ROOT, "initial_questions", name), encoding="utf-8") as f:
+            words += re.findall(r"\w+", f.read().lower())
+    return sorted(set(words))
+
+
+def make_text(rng, words, weights, n_words):
+    text = " ".join(rng.choices(words, weights, k=n_words))
+    # Frases de 8 a 20 palavras
+    sentences, start = [], 0
+    while start < n_words:
+        size = rng.randint(8, 20)
+        sentences.append(" ".join(text.split(" ")[start:start + size]).capitalize() + ".")
+        start += size
+    return " ".join(sentences)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return {"p50_ms": round(percentile(times, 0.5) * 1000, 3), "p99_ms": round(percentile(times, 0.99) * 1000, 3)}
+
+
+def live_bytes(path):
+    conn = sqlite3.connect(path)
+    page_size, pages, free = (conn.execute(f"PRAGMA {p}").fetchone()[0] for p in ("page_size", "page_count", "freelist_count"))
+    conn.close()
+    return (pages - free) * page_size
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--heavy-rows", type=int, default=5000, help="Interações do usuário mais ativo (paginação profunda)")
+    parser.add_argument("--days", type=int, default=365, help="Período coberto pelas interações")
+    parser.add_argument("--retention", type=int, default=180)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "bench.db")
+    app_module = load_app(f"sqlite:///{path}", JWT_SECRET_KEY="bench-secret-key-with-enough-bytes", RATE_LIMIT_ENABLED="false", QUERY_SLOW_MS="600000")
+    models = load_module("models")
+    authz = load_module("authz")
+    history = load_module("history")
+    app, db = app_module.app, app_module.db
+    from sqlalchemy import insert, text
+    AIInteraction = models.AIInteraction
+
+    rng = random.Random(42)
+    words = vocabulary()
+    weights = [1 / (rank + 1) for rank in range(len(words))]
+    rng.shuffle(words)
+    responses = []
+    for _ in range(5000):
+        body = make_text(rng, words, weights, rng.randint(60, 500))
+        data = body.encode("utf-8")
+        compressed = zlib.compress(data, 6) if len(data) >= AIInteraction.COMPRESS_MIN_BYTES else None
+        responses.append((body, compressed, len(data)))
+    prompts = [make_text(rng, words, weights, rng.randint(5, 30)) for _ in range(2000)]
+
+    with app.app_context():
+        db.create_all()
+        db.session.execute(insert(models.User), [{"email": f"bench{i}@example.com", "password": "x", "is_subscribed": True} for i in range(args.users)])
+        db.session.commit()
+        heavy_user = db.session.get(models.User, 1)
+        headers = {"Authorization": f"Bearer {authz.issue_tokens(heavy_user)[0]}"}
+
+        # Linhas em ordem de tempo, como chegam em produção (ids crescem com o timestamp)
+        start_time = datetime.utcnow() - timedelta(days=args.days)
+        step = args.days * 86400 / args.rows
+        heavy_every = max(1, args.rows // args.heavy_rows)
+        plain_total = stored_total = 0
+        started = time.perf_counter()
+        chunk = []
+        for i in range(args.rows):
+            body, compressed, size = responses[rng.randrange(len(responses))]
+            chunk.append({
+                "user_id": 1 if i % heavy_every == 0 else rng.randint(2, args.users),
+                "interaction_type": "chat" if i % 3 else "question_generation",
+                "prompt": prompts[rng.randrange(len(prompts))],
+                "response": None if compressed else body,
+                "response_z": compressed,
+                "cached": False,
+                "prompt_tokens": 50,
+                "completion_tokens": size // 4,
+                "timestamp": start_time + timedelta(seconds=i * step),
+            })
+            plain_total += size
+            stored_total += len(compressed) if compressed else size
+            if len(chunk) == 50000:
+                db.session.execute(insert(AIInteraction.__table__), chunk)
+                db.session.commit()
+                chunk = []
+        if chunk:
+            db.session.execute(insert(AIInteraction.__table__), chunk)
+            db.session.commit()
+        report = {
+            "rows": args.rows,
+            "insert_seconds": round(time.perf_counter() - started, 1),
+            "storage": {
+                "response_bytes_plain": plain_total,
+                "response_bytes_stored": stored_total,
+                "response_savings": round(1 - stored_total / plain_total, 3),
+                "database_bytes": os.path.getsize(path),
+            },
+        }
+
+        # Latência do histórico: usuário com heavy-rows interações e usuários comuns
+        pages = []
+        cursor = None
+        while True:
+            start = time.perf_counter()
+            rows, cursor = history.user_history(1, 20, cursor)
+            pages.append(time.perf_counter() - start)
+            if not cursor:
+                break
+        deepest = len(pages) - 1
+        report["history"] = {
+            "heavy_user_pages": len(pages),
+            "keyset_first_page": timed(lambda: history.user_history(1, 20), args.queries),
+            "keyset_all_pages_p50_ms": round(percentile(pages, 0.5) * 1000, 3),
+            "keyset_all_pages_p99_ms": round(percentile(pages, 0.99) * 1000, 3),
+            "offset_deepest_page": timed(lambda: AIInteraction.query.filter_by(user_id=1)
+                                         .order_by(AIInteraction.timestamp.desc(), AIInteraction.id.desc())
+                                         .offset(deepest * 20).limit(20).all(), 20),
+            "keyset_random_users": timed(lambda: history.user_history(rng.randint(2, args.users), 20), args.queries),
+        }
+        client = app.test_client()
+        report["history"]["route_first_page"] = timed(lambda: client.get("/ai/history?limit=20", headers=headers), args.queries)
+
+        db.session.execute(text("DROP INDEX ix_ai_interaction_user_timestamp"))
+        report["history"]["no_index_first_page"] = timed(lambda: history.user_history(1, 20), 3)
+        db.session.execute(text("CREATE INDEX ix_ai_interaction_user_timestamp ON ai_interaction (user_id, timestamp, id)"))
+        db.session.commit()
+
+        # Arquivamento: tudo o que passou do período de retenção
+        archive_dir = os.path.join(directory, "archive")
+        before = live_bytes(path)
+        started = time.perf_counter()
+        stats = history.archive_before(datetime.utcnow() - timedelta(days=args.retention), archive_dir)
+        elapsed = time.perf_counter() - started
+        remaining = AIInteraction.query.count()
+    after = live_bytes(path)
+    report["archive"] = {
+        "rows_moved": stats["rows"],
+        "rows_remaining": remaining,
+        "seconds": round(elapsed, 1),
+        "rows_per_second": round(stats["rows"] / elapsed) if elapsed else None,
+        "files": len(stats["files"]),
+        "text_bytes": stats["text_bytes"],
+        "archive_bytes": stats["archive_bytes"],
+        "archive_ratio": round(stats["text_bytes"] / stats["archive_bytes"], 2) if stats["archive_bytes"] else None,
+        "table_bytes_freed": before - after,
+    }
+    print(json.dumps(report, indent=2))
+    shutil.rmtree(directory, ignore_errors=True)
+
+    expected = args.rows * (args.days - args.retention) // args.days
+    if abs(stats["rows"] - expected) > args.rows * 0.01 or stats["rows"] + remaining != args.rows:
+        print(f"Arquivamento moveu {stats['rows']} linhas; esperado cerca de {expected}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Gera um arquivo sintético de questões e mede a importação em lote
+(linhas/s e pico de memória do processo).
+
+Uso: python benchmarks/bench_import.py [--questions 1000000] [--format json|ndjson] [--batch-size 1000]
+"""
+import argparse
+import json
+import os
+import resource
+import tempfile
+
+from _bootstrap import load_app, load_module
+
+
+def write_file(path, count, fmt):
+    # Escrita em fluxo; ~1% de duplicatas e ~1% de registros inválidos
+    with open(path, "w", encoding="utf-8") as f:
+        if fmt == "json":
+            f.write("[\n")
+        for i in range(count):
+            n = i - 1 if i % 100 == 99 else i
+            options = [f"Alternativa {n}-{k}" for k in range(4)]
+            record = {
+                "text": f"Questão sintética {n}: qual alternativa está correta?",
+                "options": options,
+                "correct_answer": options[n % 4] if i % 100 != 50 else "fora das opções",
+                "subject": f"Assunto {n % 20}",
+                "exam_type": "ENEM" if n % 2 else "Residência",
+                "difficulty": "medium",
+            }
+            line = json.dumps(record, ensure_ascii=False)
+            if fmt == "json":
+                f.write(("  " if i == 0 else ",\n  ") + line)
+            else:
+                f.write(line + "\n")
+        if fmt == "json":
+            f.write("\n]\n")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--questions", type=int, default=1_000_000)
+    parser.add_argument("--format", choices=("json", "ndjson"), default="json")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--database-url", default=None)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    data_path = os.path.join(tmpdir, f"questions.{args.format}")
+    write_file(data_path, args.questions, args.format)
+
+    app_module = load_app(args.database_url or f"sqlite:///{os.path.join(tmpdir, 'bench.db')}")
+    importer = load_module("import_questions")
+    app, db = app_module.app, app_module.db
+
+    with app.app_context():
+        db.create_all()
+        baseline_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        stats = importer.import_files([data_path], batch_size=args.batch_size, report_every=max(args.questions // 10, 1))
+
+    print(json.dumps({
+        "questions": args.questions,
+        "file_mb": round(os.path.getsize(data_path) / 2**20, 1),
+        "read": stats.read,
+        "inserted": stats.inserted,
+        "duplicates": stats.duplicates,
+        "invalid": stats.invalid,
+        "rows_per_s": round(stats.rate()),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "baseline_rss_mb": round(baseline_mb, 1),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""Custo da instrumentação por requisição (metrics.py e query_stats.py:
+latência por rota, queries por requisição e os eventos do SQLAlchemy), além
+do custo unitário de contadores e histogramas e do tempo para gerar o /metrics.
+O objetivo é ficar abaixo de 50 µs por requisição.
+
+O custo é medido diretamente: os hooks de before/after/teardown request e os
+eventos de cursor são chamados isoladamente, num contexto de requisição da
+rota, com os mesmos statements que ela executa (mediana das repetições). A
+comparação da rota inteira com e sem os hooks também sai no relatório, mas o
+ruído dela (centenas de µs) é maior que o orçamento, então não decide nada.
+
+Uso: python benchmarks/bench_metrics.py [--requests 2000] [--iterations 20000] [--repeats 7]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+from _bootstrap import load_app, load_module
+
+BUDGET_US = 50
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--repeats", type=int, default=7)
+    args = parser.parse_args()
+
+    database_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    app_module = load_app(database_url, JWT_SECRET_KEY="bench-secret-key-with-enough-bytes")
+    models = load_module("models")
+    authz = load_module("authz")
+    metrics = load_module("metrics")
+    query_stats = load_module("query_stats")
+    app, db = app_module.app, app_module.db
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+
+    with app.app_context():
+        db.create_all()
+        user = models.User(email="bench@example.com", password="x", is_subscribed=True)
+        db.session.add(user)
+        db.session.commit()
+        headers = {"Authorization": f"Bearer {authz.issue_tokens(user)[0]}"}
+        user_id = user.id
+
+    client = app.test_client()
+    routes = {
+        "GET /": ("/", {}),
+        "GET /progress/<id>/summary": (f"/progress/{user_id}/summary", headers),
+    }
+    instrumented_modules = (metrics.__name__, query_stats.__name__)
+    hooks = (app.before_request_funcs, app.after_request_funcs, app.teardown_request_funcs)
+    engine_events = [
+        ("before_cursor_execute", query_stats._before_cursor_execute),
+        ("after_cursor_execute", query_stats._after_cursor_execute),
+    ]
+    original = [{k: list(v) for k, v in funcs.items()} for funcs in hooks]
+
+    def instrument(enabled):
+        for funcs, saved in zip(hooks, original):
+            for key, functions in saved.items():
+                funcs[key] = functions if enabled else [f for f in functions if f.__module__ not in instrumented_modules]
+        for name, fn in engine_events:
+            if enabled and not event.contains(Engine, name, fn):
+                event.listen(Engine, name, fn)
+            elif not enabled and event.contains(Engine, name, fn):
+                event.remove(Engine, name, fn)
+
+    def per_request(path, route_headers):
+        start = time.perf_counter()
+        for _ in range(args.requests):
+            client.get(path, headers=route_headers)
+        return (time.perf_counter() - start) / args.requests
+
+    def executed_statements(path, route_headers):
+        statements = []
+
+        def record(conn, cursor, statement, *rest):
+            statements.append(statement)
+
+        event.listen(Engine, "before_cursor_execute", record)
+        try:
+            client.get(path, headers=route_headers)
+        finally:
+            event.remove(Engine, "before_cursor_execute", record)
+        return statements
+
+    def hook_cost(path, route_headers, statements):
+        # Só as funções de metrics.py e query_stats.py, na ordem em que o Flask as chama
+        before, after, teardown = (
+            [f for functions in funcs.values() for f in functions if f.__module__ in instrumented_modules]
+            for funcs in hooks
+        )
+        response = app.response_class("")
+        timings = []
+        with app.test_request_context(path, headers=route_headers):
+            for _ in range(args.repeats):
+                start = time.perf_counter()
+                for _ in range(args.iterations):
+                    for f in before:
+                        f()
+                    for statement in statements:
+                        context = SimpleNamespace()
+                        query_stats._before_cursor_execute(None, None, statement, (), context, False)
+                        query_stats._after_cursor_execute(None, None, statement, (), context, False)
+                    for f in reversed(after):
+                        response = f(response)
+                    for f in reversed(teardown):
+                        f(None)
+                timings.append((time.perf_counter() - start) / args.iterations)
+        return statistics.median(timings)
+
+    report = {"requests": args.requests, "iterations": args.iterations, "repeats": args.repeats, "routes": {}}
+    for name, (path, route_headers) in routes.items():
+        instrument(True)
+        statements = executed_statements(path, route_headers)
+        hooks_us = hook_cost(path, route_headers, statements) * 1e6
+        timings = {True: [], False: []}
+        for _ in range(args.repeats):
+            # Alternado, para que variações da máquina afetem os dois lados
+            for enabled in (False, True):
+                instrument(enabled)
+                timings[enabled].append(per_request(path, route_headers))
+        plain, instrumented = statistics.median(timings[False]), statistics.median(timings[True])
+        report["routes"][name] = {
+            "queries": len(statements),
+            "hooks_us": round(hooks_us, 1),
+            "plain_us": round(plain * 1e6, 1),
+            "instrumented_us": round(instrumented * 1e6, 1),
+            "end_to_end_overhead_us": round((instrumented - plain) * 1e6, 1),
+        }
+    instrument(True)
+
+    counter = metrics.counter("bench_counter_total")
+    histogram = metrics.histogram("bench_histogram_seconds")
+    n = 200000
+    start = time.perf_counter()
+    for _ in range(n):
+        counter.inc(endpoint="bench")
+    counter_ns = (time.perf_counter() - start) / n * 1e9
+    start = time.perf_counter()
+    for i in range(n):
+        histogram.observe(i % 1000 / 1000, endpoint="bench", method="GET", status=200)
+    histogram_ns = (time.perf_counter() - start) / n * 1e9
+    start = time.perf_counter()
+    body = metrics.render(metrics.collect())
+    report["primitives_ns"] = {"counter_inc": round(counter_ns), "histogram_observe": round(histogram_ns)}
+    report["render"] = {"ms": round((time.perf_counter() - start) * 1000, 2), "bytes": len(body)}
+    print(json.dumps(report, indent=2))
+
+    worst = max(route["hooks_us"] for route in report["routes"].values())
+    if worst > BUDGET_US:
+        print(f"Instrumentação custa {worst} µs por requisição, acima de {BUDGET_US} µs", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Queries por requisição nas rotas mais usadas (pelos histogramas de
+query_stats.py) e custo da instrumentação por statement.
+
+Com --budget endpoint=N o script termina com erro se a média de queries de
+algum endpoint passar de N, para pegar regressões (um N+1 novo, um lazy load
+esquecido) antes do deploy.
+
+Uso: python benchmarks/bench_queries.py [--requests 200] [--budget questions.answer_question=10]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+from _bootstrap import load_app, load_module
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200, help="Requisições por rota")
+    parser.add_argument("--questions", type=int, default=2000)
+    parser.add_argument("--statements", type=int, default=20000, help="Statements na medição de custo")
+    parser.add_argument("--budget", action="append", default=[], metavar="ENDPOINT=N")
+    parser.add_argument("--database-url")
+    args = parser.parse_args()
+
+    database_url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    app_module = load_app(database_url, JWT_SECRET_KEY="bench-secret-key-with-enough-bytes", QUESTION_POOL_ENABLED="false")
+    models = load_module("models")
+    authz = load_module("authz")
+    query_stats = load_module("query_stats")
+    app, db = app_module.app, app_module.db
+    from sqlalchemy import event, insert, text
+    from sqlalchemy.engine import Engine
+
+    rng = random.Random(42)
+    subjects = ["Física", "Química", "Biologia"]
+    with app.app_context():
+        db.create_all()
+        user = models.User(email="bench@example.com", password="x", is_subscribed=True)
+        db.session.add(user)
+        db.session.commit()
+        db.session.execute(insert(models.Question), [{
+            "text": f"Questão {i} sobre {rng.choice(['energia', 'força', 'célula', 'átomo'])}?",
+            "options": ["a", "b", "c", "d"], "correct_answer": "a",
+            "subject": subjects[i % len(subjects)], "exam_type": "ENEM", "difficulty": rng.choice(["easy", "medium", "hard"]),
+        } for i in range(args.questions)])
+        db.session.commit()
+        headers = {"Authorization": f"Bearer {authz.issue_tokens(user)[0]}"}
+        user_id = user.id
+
+    client = app.test_client()
+    routes = [
+        lambda: client.post(f"/questions/{rng.randint(1, args.questions)}/answer", json={"answer": rng.choice("ab")}, headers=headers),
+        lambda: client.get(f"/questions/{rng.randint(1, args.questions)}", headers=headers),
+        lambda: client.post("/questions/generate", json={"subject": rng.choice(subjects), "exam_type": "ENEM", "num_questions": 5}, headers=headers),
+        lambda: client.post("/questions/generate", json={"subject": rng.choice(subjects), "exam_type": "ENEM", "num_questions": 5, "adaptive": True}, headers=headers),
+        lambda: client.get("/questions/search?q=energia", headers=headers),
+        lambda: client.get("/questions/review?limit=20", headers=headers),
+        lambda: client.get(f"/progress/{user_id}", headers=headers),
+        lambda: client.get(f"/progress/{user_id}/summary", headers=headers),
+    ]
+    for route in routes:
+        for _ in range(args.requests):
+            response = route()
+            assert response.status_code in (200, 304), response.get_data(as_text=True)[:200]
+
+    report = {"requests_per_route": args.requests, "endpoints": query_stats.summary()}
+
+    # Custo da instrumentação: o mesmo statement trivial com e sem os eventos
+    with app.app_context():
+        connection = db.session.connection()
+        statement = text("SELECT 1")
+
+        def run():
+            start = time.perf_counter()
+            for _ in range(args.statements):
+                connection.execute(statement)
+            return (time.perf_counter() - start) / args.statements
+
+        query_stats.begin("bench")
+        instrumented = min(run() for _ in range(3))
+        query_stats._current.set(None)
+        event.remove(Engine, "before_cursor_execute", query_stats._before_cursor_execute)
+        event.remove(Engine, "after_cursor_execute", query_stats._after_cursor_execute)
+        plain = min(run() for _ in range(3))
+    report["statement_us"] = {
+        "plain": round(plain * 1e6, 2),
+        "instrumented": round(instrumented * 1e6, 2),
+        "overhead": round((instrumented - plain) * 1e6, 2),
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+    failed = False
+    for budget in args.budget:
+        endpoint, _, limit = budget.partition("=")
+        mean = report["endpoints"].get(endpoint, {}).get("queries_mean")
+        if mean is not None and mean > float(limit):
+            print(f"{endpoint}: {mean} queries por requisição, acima do limite de {limit}", file=sys.stderr)
+            failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
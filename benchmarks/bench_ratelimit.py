@@ -0,0 +1,117 @@
+"""Custo e contenção dos limites por usuário (ratelimit.py): verificações de
+balde por segundo e latência p99 com N threads disputando a mesma chave (um
+usuário martelando a rota) ou chaves diferentes, nos backends memory e sqlite.
+
+Confere também que o backend sqlite mantém o limite entre processos: P
+processos disputam um balde de C fichas (sem recomposição relevante) e o
+total aceito deve ser exatamente C; no backend memory cada processo tem o
+seu balde e aceita C, P * C no total.
+
+Uso: python benchmarks/bench_ratelimit.py [--checks 20000] [--threads 1 4 16 64] [--processes 4]
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+from _bootstrap import load_app, load_module
+
+CAPACITY = 50
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def hammer(backend, threads, checks, shared_key):
+    # Cada thread faz checks/threads verificações; balde grande o bastante para
+    # medir o custo da verificação, não as recusas
+    per_thread = max(1, checks // threads)
+    latencies = [[] for _ in range(threads)]
+    barrier = threading.Barrier(threads)
+
+    def run(i):
+        key = "bench:hot" if shared_key else f"bench:{i}"
+        out = latencies[i]
+        barrier.wait()
+        for _ in range(per_thread):
+            start = time.perf_counter()
+            backend.take(key, 1e9, 1e9)
+            out.append(time.perf_counter() - start)
+
+    workers = [threading.Thread(target=run, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    flat = [t for out in latencies for t in out]
+    return {
+        "checks_per_second": round(len(flat) / elapsed),
+        "p50_us": round(percentile(flat, 0.5) * 1e6, 1),
+        "p99_us": round(percentile(flat, 0.99) * 1e6, 1),
+    }
+
+
+def drain_bucket(kind, path, attempts, results):
+    # Processo filho: tenta attempts vezes e devolve quantas foram aceitas
+    ratelimit = load_module("ratelimit")
+    backend = ratelimit.SQLiteBackend(path) if kind == "sqlite" else ratelimit.MemoryBackend(60)
+    results.put(sum(1 for _ in range(attempts) if backend.take("bench:shared", CAPACITY, 1e-6) == 0))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--checks", type=int, default=20000)
+    parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--processes", type=int, default=4)
+    args = parser.parse_args()
+
+    load_app(f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}")
+    ratelimit = load_module("ratelimit")
+    directory = tempfile.mkdtemp()
+    backends = {
+        "memory": lambda: ratelimit.MemoryBackend(60),
+        "sqlite": lambda: ratelimit.SQLiteBackend(os.path.join(directory, f"contention-{time.monotonic_ns()}.sqlite3")),
+    }
+
+    report, failed = {"contention": {}}, False
+    for name, make in backends.items():
+        report["contention"][name] = {}
+        for threads in args.threads:
+            for shared_key in (True, False):
+                label = f"{threads}_threads_{'same_key' if shared_key else 'distinct_keys'}"
+                report["contention"][name][label] = hammer(make(), threads, args.checks, shared_key)
+
+    # Limite entre processos
+    context = multiprocessing.get_context("fork")
+    report["across_processes"] = {"capacity": CAPACITY, "processes": args.processes}
+    for kind in ("memory", "sqlite"):
+        path = os.path.join(directory, "shared.sqlite3")
+        if kind == "sqlite":
+            ratelimit.SQLiteBackend(path) # Cria as tabelas antes dos filhos
+        results = context.Queue()
+        children = [context.Process(target=drain_bucket, args=(kind, path, CAPACITY * 2, results)) for _ in range(args.processes)]
+        for child in children:
+            child.start()
+        accepted = sum(results.get() for _ in children)
+        for child in children:
+            child.join()
+        report["across_processes"][f"{kind}_accepted"] = accepted
+    if report["across_processes"]["sqlite_accepted"] != CAPACITY:
+        failed = True
+
+    print(json.dumps(report, indent=2))
+    if failed:
+        print(f"O backend sqlite aceitou {report['across_processes']['sqlite_accepted']} pedidos entre processos; o limite é {CAPACITY}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""Camada de resiliência das chamadas à OpenAI (llm.py) contra o servidor
+falso com injeção de falhas: novas tentativas em erros transitórios, erros
+que não devem ser repetidos, prazo total, circuit breaker (falha rápida e
+recuperação), modelo alternativo e hedging para a cauda de latência, nos
+clientes síncrono e assíncrono.
+
+Cada cenário imprime o que foi medido e se o comportamento esperado
+aconteceu ("ok"); o script termina com erro se algum falhar.
+
+Uso: python benchmarks/bench_resilience.py [--calls 200] [--threads 8] [--concurrency 32]
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from _bootstrap import load_app, load_module
+from fake_openai import FakeOpenAI
+
+MESSAGES = [{"role": "user", "content": "Explique mitose em uma frase."}]
+FALLBACK = "gpt-4.1-nano"
+
+
+def timed(fn):
+    start = time.perf_counter()
+    try:
+        fn()
+        error = None
+    except Exception as e:
+        error = type(e).__name__
+    return time.perf_counter() - start, error
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=200, help="Chamadas no cenário de hedging")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--concurrency", type=int, default=32, help="Chamadas simultâneas no cliente assíncrono")
+    args = parser.parse_args()
+
+    with FakeOpenAI(latency=0.05) as fake:
+        load_app(
+            OPENAI_BASE_URL=fake.base_url,
+            LLM_BACKOFF_BASE="0.05", LLM_BACKOFF_MAX="0.2",
+            LLM_BREAKER_FAILURES="5", LLM_BREAKER_COOLDOWN="1",
+        )
+        llm = load_module("llm")
+        settings = llm._settings
+        defaults = dict(vars(settings))
+
+        def reset(**overrides):
+            fake.latency, fake.slow_rate, fake.slow_latency, fake.slow_every = 0.05, 0.0, 0.0, 0
+            fake.failing_models.clear()
+            fake.models.clear()
+            fake._failures.clear()
+            llm._breakers.clear()
+            vars(settings).update(defaults, **overrides)
+
+        def call(**kwargs):
+            return llm.complete("chat", messages=MESSAGES, **kwargs)
+
+        report, failures = {}, []
+
+        def check(name, ok, **measured):
+            report[name] = {**measured, "ok": bool(ok)}
+            if not ok:
+                failures.append(name)
+
+        # 1. Erros transitórios (503 e 429 com Retry-After) são repetidos até dar certo
+        reset()
+        before = llm.retries.value(interaction_type="chat")
+        fake.fail_next(2, 503)
+        elapsed, error = timed(call)
+        check("transient_503", error is None, seconds=round(elapsed, 3), retries=llm.retries.value(interaction_type="chat") - before)
+        fake.fail_next(1, 429)
+        elapsed, error = timed(call)
+        check("rate_limited_429", error is None and elapsed >= 1, seconds=round(elapsed, 3))
+
+        # 2. Erro do pedido (400) não é repetido
+        reset()
+        fake.fail_next(3, 400)
+        requests = fake.requests
+        elapsed, error = timed(call)
+        check("bad_request_400", error == "BadRequestError" and fake.requests - requests == 1, seconds=round(elapsed, 3), requests=fake.requests - requests)
+
+        # 3. Upstream pendurado: a chamada respeita o prazo total
+        reset(timeout=0.5, deadline=1.2)
+        fake.latency = 5
+        elapsed, error = timed(call)
+        check("deadline", error == "APITimeoutError" and elapsed < 1.5, seconds=round(elapsed, 3), error=error)
+
+        # 4. Fora do ar: o breaker abre e as chamadas seguintes falham na hora; depois do cooldown, uma chamada de teste o fecha
+        reset(max_retries=1)
+        fake.failing_models.add(llm.MODEL)
+        outcomes = [timed(call) for _ in range(20)]
+        fast = [t for t, error in outcomes if error == "CircuitOpenError"]
+        upstream_calls = fake.models.get(llm.MODEL, 0)
+        fake.failing_models.clear()
+        time.sleep(settings.breaker_cooldown)
+        recovery, recovery_error = timed(call)
+        check(
+            "circuit_breaker", len(fast) >= 15 and recovery_error is None and llm.breaker(llm.MODEL).state == "closed",
+            upstream_requests=upstream_calls, failed_fast=len(fast),
+            fail_fast_p50_us=round(statistics.median(fast) * 1e6, 1) if fast else None,
+            recovery_seconds=round(recovery, 3),
+        )
+
+        # 5. Modelo alternativo: com o principal fora do ar, as chamadas seguem pelo alternativo
+        reset(max_retries=1, fallback_model=FALLBACK)
+        fake.failing_models.add(llm.MODEL)
+        outcomes = [timed(call) for _ in range(20)]
+        served = sum(1 for _, error in outcomes if error is None)
+        check("fallback_model", served >= 15, served=served, requests_by_model=dict(fake.models))
+
+        def hedge_count():
+            return sum(llm.hedges.value(winner=winner) for winner in ("primary", "hedge"))
+
+        # 6. Hedging: uma em cada 20 requisições demora 2 s; com hedge após 0,3 s
+        # só fica lenta a chamada cujo hedge também cai numa requisição lenta.
+        # Sem hedging a cauda tem de mostrar as lentas, senão o cenário não mede nada
+        for label, hedge_after in (("hedging_off", 0.0), ("hedging_on", 0.3)):
+            reset(hedge_after=hedge_after)
+            fake.slow_every, fake.slow_latency = 20, 2.0
+            requests, slow, hedged = fake.requests, fake.slow_requests, hedge_count()
+            with ThreadPoolExecutor(args.threads) as pool:
+                latencies = [t for t, error in pool.map(lambda _: timed(call), range(args.calls)) if error is None]
+            report[label] = {
+                "p50_s": round(percentile(latencies, 0.5), 3),
+                "p99_s": round(percentile(latencies, 0.99), 3),
+                "max_s": round(max(latencies), 3),
+                "slow_requests": fake.slow_requests - slow,
+                "hedges": hedge_count() - hedged,
+                "extra_requests": fake.requests - requests - args.calls,
+            }
+        off, on = report["hedging_off"], report.pop("hedging_on")
+        check("hedging", off["p99_s"] >= 1.5 and on["hedges"] > 0 and on["p99_s"] < off["p99_s"] / 2, **on)
+
+        # 7. Cliente assíncrono: mesmas regras de breaker e hedging
+        async def async_scenarios():
+            async def acall():
+                start = time.perf_counter()
+                try:
+                    await llm.acomplete("chat", messages=MESSAGES)
+                    return time.perf_counter() - start, None
+                except Exception as e:
+                    return time.perf_counter() - start, type(e).__name__
+
+            reset(max_retries=1)
+            fake.failing_models.add(llm.MODEL)
+            outcomes = [await acall() for _ in range(20)]
+            fast = sum(1 for _, error in outcomes if error == "CircuitOpenError")
+            check("async_circuit_breaker", fast >= 15, failed_fast=fast)
+
+            # Concorrência limitada, como num worker servindo requisições: com todas as
+            # chamadas disparadas de uma vez o orçamento de hedges (no máximo 10
+            # guardados) se esgota antes de as lentas aparecerem, e é esse o objetivo dele
+            async def bounded():
+                async with semaphore:
+                    return await acall()
+
+            for label, hedge_after in (("async_hedging_off", 0.0), ("async_hedging_on", 0.3)):
+                reset(hedge_after=hedge_after)
+                fake.slow_every, fake.slow_latency = 20, 2.0
+                semaphore = asyncio.Semaphore(args.concurrency)
+                slow, hedged = fake.slow_requests, hedge_count()
+                outcomes = await asyncio.gather(*(bounded() for _ in range(args.calls)))
+                latencies = [t for t, error in outcomes if error is None]
+                report[label] = {
+                    "p99_s": round(percentile(latencies, 0.99), 3),
+                    "ok_calls": len(latencies),
+                    "slow_requests": fake.slow_requests - slow,
+                    "hedges": hedge_count() - hedged,
+                }
+            off, on = report["async_hedging_off"], report.pop("async_hedging_on")
+            check("async_hedging", off["p99_s"] >= 1.5 and on["hedges"] > 0 and on["p99_s"] < 1.0, **on)
+
+        asyncio.run(async_scenarios())
+
+    print(json.dumps(report, indent=2))
+    if failures:
+        print(f"Cenários com falha: {', '.join(failures)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Fila de revisão espaçada: latência de GET /questions/review (consulta pelo
+índice (user_id, due_at)), custo do reagendamento por resposta e vazão do job
+de redistribuição para usuários que voltam de uma pausa longa.
+
+O cenário de referência é 100k usuários x 5k cartões (500M linhas, só viável
+no Postgres); o padrão aqui usa menos usuários com os mesmos 5k cartões cada,
+e o custo da consulta não depende do total de linhas.
+
+Uso: python benchmarks/bench_reviews.py [--users 200] [--cards 5000] [--returning 0.05]
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from _bootstrap import load_app, load_module
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--cards", type=int, default=5000)
+    parser.add_argument("--returning", type=float, default=0.05, help="Fração de usuários voltando de uma pausa de 60 dias")
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--database-url")
+    args = parser.parse_args()
+
+    database_url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    app_module = load_app(database_url)
+    models = load_module("models")
+    reviews = load_module("reviews")
+    answers_module = load_module("answers")
+    reschedule = load_module("reschedule_reviews")
+    app, db = app_module.app, app_module.db
+    from sqlalchemy import insert
+
+    rng = random.Random(42)
+    now = datetime.utcnow()
+    report = {"users": args.users, "cards_per_user": args.cards}
+    with app.app_context():
+        db.create_all()
+        db.session.execute(insert(models.User), [{"email": f"u{i}@example.com", "password": "x"} for i in range(args.users)])
+        db.session.execute(insert(models.Question), [
+            {"text": f"Questão {i}?", "options": ["a", "b"], "correct_answer": "a", "subject": "Física", "exam_type": "ENEM", "difficulty": "medium"}
+            for i in range(args.cards)
+        ])
+        db.session.commit()
+
+        start = time.perf_counter()
+        returning = set(rng.sample(range(1, args.users + 1), int(args.users * args.returning)))
+        for user_id in range(1, args.users + 1):
+            # Usuários ativos têm poucos cartões vencidos; os que voltam, todos
+            offset = -60 if user_id in returning else 0
+            db.session.execute(insert(models.ReviewCard), [{
+                "user_id": user_id, "question_id": question_id, "repetitions": 3, "interval_days": 15.0,
+                "ease": 2.5, "lapses": 0, "due_at": now + timedelta(days=offset + rng.uniform(-0.2, 30)),
+            } for question_id in range(1, args.cards + 1)])
+            db.session.commit()
+        report["load_s"] = round(time.perf_counter() - start, 1)
+
+        latencies = []
+        for _ in range(args.queries):
+            user_id = rng.randint(1, args.users)
+            t = time.perf_counter()
+            reviews.due_cards(user_id, now, 20)
+            reviews.next_due_at(user_id, now)
+            latencies.append(time.perf_counter() - t)
+        latencies.sort()
+        report["due_query"] = {
+            "p50_us": round(statistics.median(latencies) * 1e6, 1),
+            "p99_us": round(latencies[int(len(latencies) * 0.99)] * 1e6, 1),
+        }
+
+        for batch_size in (1, 500):
+            answers = [
+                answers_module.Answer(rng.randint(1, args.users), rng.randint(1, args.cards), "Física", "medium",
+                                      rng.random() < 0.7, now, now.date())
+                for _ in range(2000)
+            ]
+            t = time.perf_counter()
+            for i in range(0, len(answers), batch_size):
+                reviews.schedule_reviews(answers[i:i + batch_size])
+                db.session.commit()
+            report[f"schedule_batch_{batch_size}_us_per_answer"] = round((time.perf_counter() - t) / len(answers) * 1e6, 1)
+
+        t = time.perf_counter()
+        moved = reschedule.reschedule(100)
+        elapsed = time.perf_counter() - t
+        report["reschedule"] = {
+            "returning_users": len(returning),
+            "cards_moved": moved,
+            "seconds": round(elapsed, 2),
+            "cards_per_s": round(moved / max(elapsed, 1e-9)),
+        }
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Latência da busca de questões no índice invertido em memória (fallback do SQLite).
+
+Uso: python benchmarks/bench_search.py [--questions 100000 1000000] [--queries 200]
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+
+from _bootstrap import load_app, load_module
+
+WORDS = """
+celula mitose meiose dna rna proteina enzima fotossintese respiracao ecossistema
+independencia republica imperio revolucao industrial guerra fria constituicao
+funcao quadratica logaritmo geometria probabilidade estatistica matriz derivada
+hipertensao diabetes pneumonia insuficiencia cardiaca renal abdome apendicite
+antibiotico tratamento diagnostico sintoma febre dor toracica gestante pediatria
+energia cinetica forca aceleracao eletricidade optica termodinamica onda
+""".split()
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run(size, queries, rng):
+    app_module = load_app()
+    search = load_module("search")
+    index = search.InvertedIndex()
+    subjects = ["Biologia", "História", "Matemática", "Medicina", "Física"]
+    # Vocabulário com distribuição de Zipf: poucas palavras muito frequentes
+    # e uma cauda longa de termos raros, como em enunciados reais
+    vocabulary = WORDS + [f"termo{i}" for i in range(20000)]
+
+    start = time.perf_counter()
+    for i in range(size):
+        text = " ".join(vocabulary[min(int(rng.paretovariate(1.1)) - 1, len(vocabulary) - 1)] for _ in range(rng.randint(12, 30)))
+        index.add(i + 1, f"Questão {i}: {text}?", subjects[i % len(subjects)], "ENEM")
+    build_s = time.perf_counter() - start
+
+    latencies = {"one_term": [], "two_terms": [], "filtered": [], "next_page": []}
+    for _ in range(queries):
+        t = time.perf_counter()
+        index.search(rng.choice(WORDS), None, None, 21, None)
+        latencies["one_term"].append(time.perf_counter() - t)
+
+        q = f"{rng.choice(WORDS)} {rng.choice(WORDS)}"
+        t = time.perf_counter()
+        hits = index.search(q, None, None, 21, None)
+        latencies["two_terms"].append(time.perf_counter() - t)
+
+        t = time.perf_counter()
+        index.search(q, "Medicina", "ENEM", 21, None)
+        latencies["filtered"].append(time.perf_counter() - t)
+
+        t = time.perf_counter()
+        index.search(q, None, None, 21, hits[19][::-1] if len(hits) > 20 else None)
+        latencies["next_page"].append(time.perf_counter() - t)
+
+    with app_module.app.app_context():
+        app_module.db.engine.dispose()
+    return {
+        "questions": size,
+        "build_s": round(build_s, 2),
+        **{
+            name: {
+                "p50_ms": round(statistics.median(values) * 1000, 2),
+                "p95_ms": round(percentile(values, 0.95) * 1000, 2),
+            }
+            for name, values in latencies.items()
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--questions", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    print(json.dumps([run(size, args.queries, rng) for size in args.questions], indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Latência do sorteio de questões num banco grande: consulta antiga
+(sempre as primeiras linhas), ORDER BY random() e o SelectionEngine.
+
+Uso: python benchmarks/bench_selection.py [--questions 1000000] [--subjects 20] [--seen 5000]
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from _bootstrap import load_app, load_module
+
+
+def timed(fn, runs):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return {"median_ms": round(statistics.median(samples) * 1000, 3), "max_ms": round(max(samples) * 1000, 3)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--questions", type=int, default=1_000_000)
+    parser.add_argument("--subjects", type=int, default=20)
+    parser.add_argument("--seen", type=int, default=5000, help="questões já respondidas pelo usuário no balde")
+    parser.add_argument("--num", type=int, default=10)
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args()
+
+    database_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    app_module = load_app(database_url)
+    models = load_module("models")
+    selection = load_module("selection")
+    app, db = app_module.app, app_module.db
+    from sqlalchemy import insert, func
+
+    with app.app_context():
+        db.create_all()
+        db.session.add(models.User(email="bench@example.com", password="x"))
+        start = time.perf_counter()
+        chunk = 50_000
+        for offset in range(0, args.questions, chunk):
+            db.session.execute(insert(models.Question), [{
+                "text": f"Questão {i}?",
+                "options": ["a", "b", "c", "d"],
+                "correct_answer": "a",
+                "subject": f"Assunto {i % args.subjects}",
+                "exam_type": "ENEM",
+                "difficulty": "medium",
+            } for i in range(offset, min(offset + chunk, args.questions))])
+        db.session.commit()
+        load_s = time.perf_counter() - start
+
+        bucket_ids = [row[0] for row in db.session.query(models.Question.id).filter_by(subject="Assunto 0")]
+        db.session.execute(insert(models.AnswerEvent), [
+            {"user_id": 1, "question_id": qid, "is_correct": True}
+            for qid in random.sample(bucket_ids, min(args.seen, len(bucket_ids)))
+        ])
+        db.session.commit()
+
+        query = models.Question.query.filter_by(subject="Assunto 0", exam_type="ENEM")
+        engine = selection.SelectionEngine(bucket_ttl=3600, seen_ttl=3600, max_users=100)
+
+        start = time.perf_counter()
+        engine.sample(1, "Assunto 0", "ENEM", None, args.num)
+        cold_ms = (time.perf_counter() - start) * 1000
+
+        report = {
+            "questions": args.questions,
+            "bucket_size": len(bucket_ids),
+            "seen": args.seen,
+            "insert_s": round(load_s, 1),
+            "legacy_limit": timed(lambda: query.limit(args.num).all(), args.runs),
+            "order_by_random": timed(lambda: query.order_by(func.random()).limit(args.num).all(), min(args.runs, 10)),
+            "engine_cold_ms": round(cold_ms, 1),
+            "engine_warm": timed(lambda: engine.sample(1, "Assunto 0", "ENEM", None, args.num), args.runs),
+        }
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""Capacidade de requisições simultâneas às rotas de IA no gunicorn, nos
+modos wsgi (workers gthread) e asgi (workers uvicorn com AsyncOpenAI),
+contra um upstream falso com latência fixa. Durante a carga, mede também a
+latência de uma rota comum (GET /) para mostrar se ela continua respondendo.
+Todas as chamadas usam o mesmo usuário, então o limite por usuário fica
+desligado; qualquer resposta diferente de 200 faz o benchmark falhar.
+
+Requer gunicorn, uvicorn e a2wsgi (requirements.txt).
+
+Uso: python benchmarks/bench_serving.py [--concurrency 200] [--latency 1.0] [--workers 2] [--threads 8]
+"""
+import argparse
+import json
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from _bootstrap import ROOT, load_app, load_module
+from fake_openai import FakeOpenAI
+
+JWT_SECRET = "benchmark-secret-" + "x" * 32
+
+
+def request(url, body=None, headers=None, timeout=120):
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json", **(headers or {})})
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    except OSError:
+        status = None
+    return status, time.perf_counter() - start
+
+
+def wait_ready(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if request(url, timeout=1)[0] == 200:
+            return
+        time.sleep(0.2)
+    raise RuntimeError(f"servidor não respondeu em {url}")
+
+
+def run_mode(mode, args, env, headers):
+    port = 5600 + (mode == "asgi")
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", os.path.join(ROOT, "gunicorn.conf.py"), "--log-level", "warning", "--access-logfile", "/dev/null"],
+        cwd=ROOT,
+        env={**env, "SERVE_MODE": mode, "PORT": str(port), "WEB_CONCURRENCY": str(args.workers), "GUNICORN_THREADS": str(args.threads)},
+    )
+    base = f"http://127.0.0.1:{port}"
+    try:
+        wait_ready(base + "/")
+        probes, stop = [], threading.Event()
+
+        def probe():
+            # Rota comum, medida enquanto as chamadas à IA estão em andamento
+            while not stop.is_set():
+                probes.append(request(base + "/", timeout=60))
+                time.sleep(0.05)
+
+        prober = threading.Thread(target=probe)
+        start = time.perf_counter()
+        prober.start()
+        with ThreadPoolExecutor(args.concurrency) as pool:
+            results = list(pool.map(
+                lambda i: request(base + "/ai/chat", {"message": f"Pergunta {i}"}, headers),
+                range(args.concurrency),
+            ))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        prober.join()
+
+        latencies = sorted(t for status, t in results if status == 200)
+        probe_latencies = sorted(t for status, t in probes if status == 200)
+        errors = {}
+        for status, _ in results:
+            if status != 200:
+                errors[str(status)] = errors.get(str(status), 0) + 1
+        return {
+            "ok": len(latencies),
+            "errors": args.concurrency - len(latencies),
+            "error_statuses": errors,
+            "wall_s": round(elapsed, 2),
+            "requests_per_s": round(len(latencies) / elapsed, 1),
+            "latency_p50_s": round(statistics.median(latencies), 2) if latencies else None,
+            "latency_max_s": round(latencies[-1], 2) if latencies else None,
+            "plain_route_p50_ms": round(statistics.median(probe_latencies) * 1000, 1) if probe_latencies else None,
+            "plain_route_max_ms": round(probe_latencies[-1] * 1000, 1) if probe_latencies else None,
+        }
+    finally:
+        server.send_signal(signal.SIGTERM)
+        server.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=1.0)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--modes", nargs="+", default=["wsgi", "asgi"])
+    args = parser.parse_args()
+
+    database_url = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    with FakeOpenAI(latency=args.latency) as fake:
+        env = {
+            **os.environ,
+            "DATABASE_URL": database_url,
+            "JWT_SECRET_KEY": JWT_SECRET,
+            "OPENAI_BASE_URL": fake.base_url,
+            "OPENAI_API_KEY": "sk-local-benchmark",
+            "CHAT_CACHE_ENABLED": "false",
+            # Um só usuário faz todas as chamadas: o RATE_LIMIT_CHAT recusaria quase todas
+            "RATE_LIMIT_ENABLED": "false",
+        }
+        app_module = load_app(database_url, JWT_SECRET_KEY=JWT_SECRET)
+        models = load_module("models")
+        authz = load_module("authz")
+        with app_module.app.app_context():
+            app_module.db.create_all()
+            user = models.User(email="bench@example.com", password="x", is_subscribed=True)
+            app_module.db.session.add(user)
+            app_module.db.session.commit()
+            headers = {"Authorization": f"Bearer {authz.issue_tokens(user)[0]}"}
+
+        report = {
+            "concurrency": args.concurrency,
+            "upstream_latency_s": args.latency,
+            "workers": args.workers,
+            "threads_per_worker": args.threads,
+        }
+        for mode in args.modes:
+            report[mode] = run_mode(mode, args, env, headers)
+
+    print(json.dumps(report, indent=2))
+    failed = [mode for mode in args.modes if report[mode]["errors"]]
+    if failed:
+        print(f"Chamadas com erro nos modos: {', '.join(failed)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
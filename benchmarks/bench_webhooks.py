@@ -0,0 +1,179 @@
+"""Reprodução de eventos do Stripe assinados localmente (mesmo esquema de
+assinatura do Stripe, sem rede) contra o webhook e o worker de stripe_events.py.
+
+Cada cliente passa por uma sequência de eventos (checkout, atualizações,
+cancelamento) entregue em ordem, intercalada com os outros clientes, e parte
+das entregas é repetida, como nos reenvios do Stripe. Mede a latência do
+webhook, a vazão do worker aplicando um evento por transação (como o webhook
+fazia antes) e em lotes, e confere a idempotência: o estado final bate com o
+esperado e reenviar todos os eventos de novo não muda nada.
+
+Uso: python benchmarks/bench_webhooks.py [--customers 2000] [--duplicates 0.1] [--batch 200]
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+from _bootstrap import load_app, load_module
+
+SECRET = "whsec_bench_local"
+
+# Sequências de status por padrão de cliente; None é customer.subscription.deleted
+PATTERNS = [
+    ["active"],
+    ["past_due", "active"],
+    ["unpaid"],
+    ["active", None],
+]
+
+
+def sign(payload):
+    timestamp = int(time.time())
+    signature = hmac.new(SECRET.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+def customer_events(n, base_created):
+    customer, subscription = f"cus_bench{n}", f"sub_bench{n}"
+    events = [("checkout.session.completed", {"id": f"cs_bench{n}", "object": "checkout.session", "customer": customer, "subscription": subscription})]
+    for status in PATTERNS[n % len(PATTERNS)]:
+        kind = "customer.subscription.deleted" if status is None else "customer.subscription.updated"
+        events.append((kind, {"id": subscription, "object": "subscription", "customer": customer, "status": status or "canceled"}))
+    return [json.dumps({
+        "id": f"evt_bench{n}_{k}", "object": "event", "type": kind, "created": base_created + k, "data": {"object": obj},
+    }) for k, (kind, obj) in enumerate(events)]
+
+
+def expected_state(n):
+    statuses = PATTERNS[n % len(PATTERNS)]
+    if statuses[-1] is None:
+        return False, None
+    return statuses[-1] not in ("canceled", "unpaid"), statuses[-1]
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--customers", type=int, default=2000, help="Clientes em cada fase (um a um e em lote)")
+    parser.add_argument("--duplicates", type=float, default=0.1, help="Fração das entregas repetidas")
+    parser.add_argument("--batch", type=int, default=200)
+    parser.add_argument("--database-url")
+    args = parser.parse_args()
+
+    database_url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+    app_module = load_app(
+        database_url, JWT_SECRET_KEY="bench-secret-key-with-enough-bytes",
+        STRIPE_WEBHOOK_SECRET=SECRET, STRIPE_EVENTS_WORKER="false",
+    )
+    models = load_module("models")
+    stripe_events = load_module("stripe_events")
+    app, db = app_module.app, app_module.db
+    client = app.test_client()
+    rng = random.Random(42)
+    max_attempts = app.config["STRIPE_EVENTS_MAX_ATTEMPTS"]
+
+    with app.app_context():
+        db.create_all()
+        db.session.add_all(models.User(email=f"bench{n}@example.com", password="x", stripe_customer_id=f"cus_bench{n}") for n in range(2 * args.customers))
+        db.session.commit()
+
+    def deliveries(customers, base_created):
+        # Em ordem dentro de cada cliente, intercalada entre clientes, com reenvios
+        queues = [customer_events(n, base_created) for n in customers]
+        sent = []
+        while queues:
+            queue = queues[rng.randrange(len(queues))]
+            sent.append(queue.pop(0))
+            if rng.random() < args.duplicates:
+                sent.append(sent[-1])
+            queues = [q for q in queues if q]
+        return sent
+
+    def post_all(payloads):
+        latencies = []
+        for payload in payloads:
+            start = time.perf_counter()
+            response = client.post("/subscription/webhook", data=payload, headers={"Stripe-Signature": sign(payload), "Content-Type": "application/json"})
+            latencies.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.get_data(as_text=True)
+        return latencies
+
+    def drain(batch_size):
+        with app.app_context():
+            start = time.perf_counter()
+            applied = stripe_events.drain(batch_size, max_attempts)
+            return applied, time.perf_counter() - start
+
+    report, failures = {"customers_per_phase": args.customers}, []
+    all_payloads = []
+    base_created = 1_700_000_000
+    for phase, customers, batch_size in (
+        ("one_per_transaction", range(args.customers), 1),
+        ("batched", range(args.customers, 2 * args.customers), args.batch),
+    ):
+        payloads = deliveries(customers, base_created)
+        base_created += 1000
+        all_payloads += payloads
+        latencies = post_all(payloads)
+        applied, elapsed = drain(batch_size)
+        report[phase] = {
+            "deliveries": len(payloads),
+            "webhook_p50_ms": round(percentile(latencies, 0.5) * 1000, 2),
+            "webhook_p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+            "events_applied": applied,
+            "apply_seconds": round(elapsed, 3),
+            "events_per_second": round(applied / elapsed),
+        }
+
+    # Idempotência: todos os eventos reenviados de novo; nada muda
+    with app.app_context():
+        stored = models.StripeEvent.query.count()
+    replay_latencies = post_all(all_payloads)
+    applied_again, _ = drain(args.batch)
+    with app.app_context():
+        stored_after = models.StripeEvent.query.count()
+        pending = models.StripeEvent.query.filter(models.StripeEvent.processed_at.is_(None)).count()
+        users = {u.stripe_customer_id: u for u in models.User.query}
+        subscriptions = {s.stripe_customer_id: s for s in models.Subscription.query}
+        wrong = 0
+        for n in range(2 * args.customers):
+            subscribed, status = expected_state(n)
+            subscription = subscriptions.get(f"cus_bench{n}")
+            if users[f"cus_bench{n}"].is_subscribed != subscribed or (subscription.status if subscription else None) != status:
+                wrong += 1
+    unique_events = sum(len(customer_events(n, 0)) for n in range(2 * args.customers))
+    report["replay"] = {
+        "deliveries": len(all_payloads),
+        "webhook_p50_ms": round(percentile(replay_latencies, 0.5) * 1000, 2),
+        "events_stored": stored_after,
+        "events_applied": applied_again,
+        "pending": pending,
+        "wrong_final_states": wrong,
+    }
+    if not (stored == stored_after == unique_events and applied_again == 0 and pending == 0 and wrong == 0):
+        failures.append("idempotency")
+
+    bad = all_payloads[0]
+    response = client.post("/subscription/webhook", data=bad, headers={"Stripe-Signature": sign(bad).replace("v1=", "v1=0")})
+    report["bad_signature_status"] = response.status_code
+    if response.status_code != 400:
+        failures.append("signature")
+
+    print(json.dumps(report, indent=2))
+    if failures:
+        print(f"Falhas: {', '.join(failures)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""Envia as mesmas requisições às rotas de IA no app Flask (ai.py) e no app
+ASGI (asgi.py) e compara as respostas: status, corpo JSON, Retry-After,
+tipo de conteúdo e, nos streams, a sequência de eventos SSE e o texto.
+
+Cada cenário usa um usuário novo em cada servidor, para que limites e
+cache partam do mesmo estado. Termina com erro se algum cenário divergir.
+
+Requer a2wsgi (requirements.txt).
+
+Uso: python benchmarks/check_serving_contract.py
+"""
+import asyncio
+import json
+import sys
+import threading
+import time
+from itertools import count
+
+from _bootstrap import load_app, load_module
+from bench_chat_stream import parse_sse
+from fake_openai import FakeOpenAI
+
+
+class FlaskClient:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def post(self, path, body, headers):
+        data = body if isinstance(body, bytes) else json.dumps(body).encode()
+        response = self.client.post(path, data=data, headers={"Content-Type": "application/json", **headers})
+        return response.status_code, {k.lower(): v for k, v in response.headers.items()}, response.get_data()
+
+
+class ASGIClient:
+    # Chama asgi.application num event loop próprio, como o uvicorn faria
+    def __init__(self, application):
+        self.application = application
+        self.loop = asyncio.new_event_loop()
+        threading.Thread(target=self.loop.run_forever, daemon=True).start()
+
+    def post(self, path, body, headers):
+        return asyncio.run_coroutine_threadsafe(self._post(path, body, headers), self.loop).result()
+
+    async def _post(self, path, body, headers):
+        data = body if isinstance(body, bytes) else json.dumps(body).encode()
+        scope = {
+            "type": "http", "method": "POST", "path": path, "query_string": b"",
+            "headers": [(b"content-type", b"application/json")] + [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+        }
+        pending = [{"type": "http.request", "body": data, "more_body": False}]
+        finished = asyncio.Event()
+        status, response_headers, chunks = None, {}, []
+
+        async def receive():
+            if pending:
+                return pending.pop()
+            await finished.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                response_headers.update((k.decode(), v.decode()) for k, v in message["headers"])
+            else:
+                chunks.append(message.get("body", b""))
+                if not message.get("more_body"):
+                    finished.set()
+
+        await self.application(scope, receive, send)
+        return status, response_headers, b"".join(chunks)
+
+
+def normalize(status, headers, body):
+    content_type = headers.get("content-type", "").split(";")[0]
+    result = {"status": status, "content_type": content_type, "retry_after": "retry-after" in headers}
+    if content_type == "text/event-stream":
+        events = parse_sse(body.decode())
+        names = ["delta" if event is None and "delta" in data else event or "message" for event, data in events]
+        # Quantos deltas vieram depende do upstream; o contrato é a ordem dos tipos e o texto
+        result["events"] = [name for i, name in enumerate(names) if i == 0 or name != names[i - 1]]
+        result["text"] = "".join(data["delta"] for _, data in events if "delta" in data)
+        result["cache_control"] = headers.get("cache-control")
+    else:
+        data = json.loads(body)
+        if isinstance(data, dict) and "id" in data:
+            # Questão gerada: o conteúdo muda a cada chamada ao upstream falso
+            data = {key: type(value).__name__ for key, value in data.items()}
+        result["body"] = data
+    return result
+
+
+def main():
+    with FakeOpenAI(latency=0.01) as fake:
+        app_module = load_app(
+            OPENAI_BASE_URL=fake.base_url, CHAT_CACHE_ENABLED="true", CHAT_CACHE_BACKEND="memory",
+            CHAT_CACHE_SIMILARITY_THRESHOLD="0", RATE_LIMIT_CHAT="3/600",
+            LLM_MAX_RETRIES="0", LLM_BREAKER_FAILURES="1", LLM_BREAKER_COOLDOWN="60",
+        )
+        app, db = app_module.app, app_module.db
+        models, authz, llm = load_module("models"), load_module("authz"), load_module("llm")
+        servers = {"flask": FlaskClient(app), "asgi": ASGIClient(load_module("asgi").application)}
+        with app.app_context():
+            db.create_all()
+        emails = count()
+
+        def new_user(subscribed=True):
+            with app.app_context():
+                user = models.User(email=f"contract{next(emails)}@example.com", password="x", is_subscribed=subscribed)
+                db.session.add(user)
+                db.session.commit()
+                return user.id, {"Authorization": f"Bearer {authz.issue_tokens(user)[0]}"}
+
+        def revoked(server):
+            user_id, headers = new_user()
+            time.sleep(1.1) # iat em segundos inteiros: a revogação tem de ser posterior
+            with app.app_context():
+                authz.revoke_tokens(user_id)
+                db.session.commit()
+            return [server.post("/ai/chat", {"message": "Oi"}, headers)]
+
+        def repeated(path, body, times):
+            def scenario(server, name):
+                headers = new_user()[1]
+                return [server.post(path, body(name), headers) for _ in range(times)]
+            return scenario
+
+        def upstream_down(server, name):
+            # Primeira falha repassada como 500; com o breaker aberto, 503 em todas as rotas
+            llm._breakers.clear()
+            fake.failing_models.add(llm.MODEL)
+            headers = new_user()[1]
+            try:
+                return [
+                    server.post("/ai/chat", {"message": f"Upstream fora ({name})"}, headers),
+                    server.post("/ai/chat/stream", {"message": f"Upstream fora, stream ({name})"}, headers),
+                    server.post("/ai/generate_question_ia", {"prompt": "mitose", "subject": "Biologia", "exam_type": "ENEM"}, headers),
+                ]
+            finally:
+                fake.failing_models.clear()
+                llm._breakers.clear()
+
+        generate = {"prompt": "mitose", "subject": "Biologia", "exam_type": "ENEM"}
+        scenarios = {
+            "sem_token": lambda server, name: [server.post("/ai/chat", {"message": "Oi"}, {})],
+            "cabecalho_invalido": lambda server, name: [server.post("/ai/chat", {"message": "Oi"}, {"Authorization": value})
+                                                        for value in ("Token x", "Bearer", "Bearer a b", "Basic x, Bearer abc")],
+            "sem_assinatura": lambda server, name: [server.post(path, {"message": "Oi", **generate}, new_user(False)[1])
+                                                    for path in ("/ai/chat", "/ai/chat/stream", "/ai/generate_question_ia")],
+            "token_revogado": lambda server, name: revoked(server),
+            "campos_faltando": lambda server, name: [server.post(path, {}, new_user()[1])
+                                                     for path in ("/ai/chat", "/ai/chat/stream", "/ai/generate_question_ia")],
+            "corpo_invalido": lambda server, name: [server.post("/ai/chat", b"{", new_user()[1])],
+            "gerar_questao": repeated("/ai/generate_question_ia", lambda name: generate, 1),
+            # Segunda chamada com a mesma mensagem vem do cache
+            "chat": repeated("/ai/chat", lambda name: {"message": f"O que é mitose? ({name})"}, 2),
+            "chat_stream": repeated("/ai/chat/stream", lambda name: {"message": f"O que é meiose? ({name})"}, 2),
+            "limite_de_requisicoes": repeated("/ai/chat", lambda name: {"message": f"Pergunta ({name})"}, 4),
+            "upstream_fora": upstream_down,
+        }
+
+        report, failures = {}, []
+        for scenario, run in scenarios.items():
+            results = {name: [normalize(*response) for response in run(server, name)] for name, server in servers.items()}
+            same = results["flask"] == results["asgi"]
+            report[scenario] = {"same": same, "flask": results["flask"]}
+            if not same:
+                report[scenario]["asgi"] = results["asgi"]
+                failures.append(scenario)
+
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if failures:
+        print(f"Cenários com respostas diferentes: {', '.join(failures)}", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import itertools
+import json
+import random
+import re
+import threading
+import time
+
+_counter = itertools.count()
+
+
+def fake_question(n):
+    options = [f"Opção {n}-{i}" for i in range(4)]
+    return {
+        "question_text": f"Questão sintética número {n} sobre o conceito {n * 7919 % 100003} e sua aplicação {n % 97}?",
+        "options": options,
+        "correct_answer": options[n % 4],
+    }
+
+
+def fake_usage(content):
+    return {"prompt_tokens": 50, "completion_tokens": len(content) // 4, "total_tokens": 50 + len(content) // 4}
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Fila de conexões maior que o padrão (5): os benchmarks abrem centenas de uma vez
+    request_queue_size = 1024
+
+
+class FakeOpenAI:
+    """Servidor local compatível com /v1/chat/completions, com latência injetada.
+
+    latency é o tempo até o primeiro token; token_delay é o intervalo entre
+    tokens (palavras) da resposta, tanto no modo normal quanto com stream=True.
+
+    Injeção de falhas: fail_next (próximas N requisições com erro),
+    failing_models (modelos fora do ar, 503) e slow_rate/slow_latency
+    (fração das requisições, sorteada, que demora slow_latency, para testar
+    a cauda de latência). slow_every torna lenta cada N-ésima requisição, para
+    cenários que precisam de lentas garantidas; slow_requests conta as lentas.
+    """
+
+    def __init__(self, latency=0.2, host="127.0.0.1", port=0, invalid_every=0, token_delay=0.0, chat_words=40):
+        self.latency = latency
+        self.token_delay = token_delay
+        self.chat_words = chat_words
+        # Aproximadamente um a cada N itens de lote vem com correct_answer fora das opções
+        self.invalid_every = invalid_every
+        self.requests = 0
+        # Streams enviados até o fim e interrompidos pelo cliente (conexão fechada)
+        self.streams_completed = 0
+        self.streams_aborted = 0
+        self.models = {}
+        self.failing_models = set()
+        self.slow_rate = 0.0
+        self.slow_latency = 0.0
+        self.slow_every = 0
+        self.slow_requests = 0
+        self._random = random.Random(42)
+        self._failures = []
+        self._lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                with fake._lock:
+                    fake.requests += 1
+                    model = body.get("model", "fake")
+                    fake.models[model] = fake.models.get(model, 0) + 1
+                    slow = fake._random.random() < fake.slow_rate or bool(fake.slow_every and fake.requests % fake.slow_every == 0)
+                    fake.slow_requests += slow
+                time.sleep(fake.slow_latency if slow else fake.latency)
+                status = 503 if model in fake.failing_models else fake.next_failure()
+                try:
+                    if status is not None:
+                        fake.respond_error(self, status)
+                    elif body.get("stream"):
+                        fake.respond_stream(self, body)
+                    else:
+                        fake.respond(self, body)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass # Cliente desistiu (prazo estourado ou hedge que perdeu)
+
+        self.server = _Server((host, port), Handler)
+        self.base_url = f"http://{host}:{self.server.server_address[1]}/v1"
+
+    def fail_next(self, count, status=503):
+        # As próximas count requisições respondem com erro (testes de novas tentativas)
+        with self._lock:
+            self._failures.extend([status] * count)
+
+    def next_failure(self):
+        with self._lock:
+            return self._failures.pop(0) if self._failures else None
+
+    def respond_error(self, handler, status):
+        data = json.dumps({"error": {"message": "falha simulada", "type": "server_error"}}).encode()
+        handler.send_response(status)
+        if status == 429:
+            handler.send_header("Retry-After", "1")
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def completion_content(self, body):
+        if body.get("response_format", {}).get("type") == "json_object":
+            messages = body.get("messages", [])
+            if messages and "'questions'" in messages[0]["content"]:
+                match = re.search(r"Crie (\d+) questões", messages[-1]["content"])
+                items = []
+                for _ in range(int(match.group(1)) if match else 1):
+                    n = next(_counter)
+                    item = fake_question(n)
+                    if self.invalid_every and n % self.invalid_every == 0:
+                        item["correct_answer"] = "nenhuma das anteriores"
+                    items.append(item)
+                return json.dumps({"questions": items})
+            return json.dumps(fake_question(next(_counter)))
+        return " ".join(f"palavra{i}" for i in range(self.chat_words))
+
+    def respond(self, handler, body):
+        content = self.completion_content(body)
+        time.sleep(self.token_delay * len(content.split()))
+        payload = {
+            "id": f"chatcmpl-{next(_counter)}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": fake_usage(content),
+        }
+        data = json.dumps(payload).encode()
+        handler.send_response(200)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def respond_stream(self, handler, body):
+        content = self.completion_content(body)
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.end_headers()
+        completion_id = f"chatcmpl-{next(_counter)}"
+        words = content.split(" ")
+        try:
+            for i, word in enumerate(words):
+                delta = word if i == 0 else " " + word
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": body.get("model", "fake"),
+                    "choices": [{"index": 0, "delta": {"content": delta}, "finish_reason": None}],
+                }
+                handler.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                handler.wfile.flush()
+                time.sleep(self.token_delay)
+            if body.get("stream_options", {}).get("include_usage"):
+                chunk = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": body.get("model", "fake"),
+                    "choices": [],
+                    "usage": fake_usage(content),
+                }
+                handler.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            handler.wfile.write(b"data: [DONE]\n\n")
+            handler.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # Cliente fechou o stream no meio
+            with self._lock:
+                self.streams_aborted += 1
+            return
+        with self._lock:
+            self.streams_completed += 1
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
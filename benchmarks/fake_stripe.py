@@ -0,0 +1,104 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs
+import hashlib
+import hmac
+import itertools
+import json
+import threading
+import time
+
+_counter = itertools.count()
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+
+def sign(payload, secret):
+    # Mesmo esquema do header Stripe-Signature (t=...,v1=HMAC-SHA256)
+    timestamp = int(time.time())
+    signature = hmac.new(secret.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={signature}"
+
+
+def checkout_completed_event(customer_id, created=None):
+    # Evento que o Stripe envia ao webhook quando o checkout termina
+    n = next(_counter)
+    return json.dumps({
+        "id": f"evt_fake{n}", "object": "event", "type": "checkout.session.completed",
+        "created": created or int(time.time()),
+        "data": {"object": {"id": f"cs_fake{n}", "object": "checkout.session", "customer": customer_id, "subscription": f"sub_fake{n}"}},
+    })
+
+
+class FakeStripe:
+    """Servidor local com as rotas da API do Stripe usadas por subscription.py
+    (criar e buscar cliente, criar sessão de checkout), com latência injetada.
+
+    O app usa este servidor com STRIPE_API_BASE=fake.base_url.
+    """
+
+    def __init__(self, latency=0.1, host="127.0.0.1", port=0):
+        self.latency = latency
+        self.requests = 0
+        # email -> id dos clientes criados, para montar os eventos do webhook
+        self.customers = {}
+        self._lock = threading.Lock()
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                fake.count()
+                if self.path.startswith("/v1/customers/"):
+                    fake.respond(self, {"id": self.path.rsplit("/", 1)[1], "object": "customer"})
+                else:
+                    fake.respond(self, {"error": {"message": "rota não simulada", "type": "invalid_request_error"}}, 404)
+
+            def do_POST(self):
+                fake.count()
+                length = int(self.headers.get("Content-Length", 0))
+                form = parse_qs(self.rfile.read(length).decode())
+                n = next(_counter)
+                if self.path == "/v1/customers":
+                    email = form.get("email", [None])[0]
+                    with fake._lock:
+                        fake.customers[email] = f"cus_fake{n}"
+                    fake.respond(self, {"id": f"cus_fake{n}", "object": "customer", "email": email})
+                elif self.path == "/v1/checkout/sessions":
+                    fake.respond(self, {
+                        "id": f"cs_fake{n}", "object": "checkout.session", "customer": form.get("customer", [None])[0],
+                        "mode": "subscription", "url": f"https://checkout.stripe.test/c/cs_fake{n}",
+                    })
+                else:
+                    fake.respond(self, {"error": {"message": "rota não simulada", "type": "invalid_request_error"}}, 404)
+
+        self.server = _Server((host, port), Handler)
+        self.base_url = f"http://{host}:{self.server.server_address[1]}"
+
+    def count(self):
+        with self._lock:
+            self.requests += 1
+        time.sleep(self.latency)
+
+    def respond(self, handler, payload, status=200):
+        data = json.dumps(payload).encode()
+        try:
+            handler.send_response(status)
+            handler.send_header("Content-Type", "application/json")
+            handler.send_header("Content-Length", str(len(data)))
+            handler.end_headers()
+            handler.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,449 @@
+"""Teste de carga reproduzível das rotas mais usadas, com cargas mistas.
+
+Sobe o app (no próprio processo, num servidor werkzeug com threads, ou no
+gunicorn com gunicorn.conf.py) contra SQLite ou um Postgres local, popula
+questões, usuários e progresso sintéticos na escala pedida e troca a OpenAI e
+o Stripe por servidores falsos locais com latência configurável. Cada cliente
+(uma thread com conexão própria) executa --sessions sessões da carga:
+
+- exam: sorteia uma prova em /questions/generate e responde questão a questão
+- dashboard: consulta /progress e /progress/<id>/summary várias vezes, com If-None-Match
+- chat: rajada de mensagens em /ai/chat, parte delas repetida (cache)
+- checkout: usuário sem assinatura abre o checkout e o Stripe chama o webhook
+- mixed: as quatro acima, sorteadas com os pesos de WORKLOADS
+
+O sorteio usa --seed, então duas execuções com os mesmos argumentos fazem as
+mesmas requisições. O relatório (JSON) traz, por carga e por operação,
+vazão, latência p50/p95/p99 e queries por requisição (lidas do header
+Server-Timing). Com --baseline <relatório anterior> o script compara as
+execuções e termina com erro se houver regressão acima de --tolerance.
+
+Uso: python benchmarks/loadtest.py [--workload exam dashboard chat mixed] [--users 1000] [--questions 5000]
+     [--clients 16] [--sessions 20] [--server inprocess|gunicorn] [--database-url postgresql://...]
+     [--openai-latency 0.3] [--stripe-latency 0.1] [--output run.json] [--baseline previous.json]
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import re
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+
+from _bootstrap import ROOT, load_app, load_module
+from fake_openai import FakeOpenAI
+from fake_stripe import FakeStripe, checkout_completed_event, sign
+
+JWT_SECRET = "benchmark-secret-" + "x" * 32
+WEBHOOK_SECRET = "whsec_loadtest_local"
+SUBJECTS = ["Matemática", "Física", "Química", "Biologia", "História", "Geografia"]
+EXAM_TYPES = ["ENEM", "Residência"]
+DIFFICULTIES = ["easy", "medium", "hard"]
+TOPICS = ["energia", "força", "célula", "átomo", "função", "equação", "revolução", "clima", "genética", "reação"]
+# Perguntas frequentes: repetidas com probabilidade --chat-repeat, o resto é único
+POPULAR_MESSAGES = [
+    "Como resolver questões de estequiometria?",
+    "Qual a diferença entre mitose e meiose?",
+    "Explique a segunda lei de Newton com um exemplo.",
+    "Como calcular a probabilidade condicional?",
+    "Quais as causas da Revolução Francesa?",
+]
+
+WORKLOADS = {
+    "exam": {"exam": 1.0},
+    "dashboard": {"dashboard": 1.0},
+    "chat": {"chat": 1.0},
+    "checkout": {"checkout": 1.0},
+    "mixed": {"exam": 0.6, "dashboard": 0.25, "chat": 0.1, "checkout": 0.05},
+}
+
+_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))]
+
+
+class Client:
+    """Um usuário virtual: conexão HTTP própria e amostras (operação, status,
+    segundos, queries) de cada requisição."""
+
+    def __init__(self, host, port, think_time=0.0):
+        self.conn = http.client.HTTPConnection(host, port, timeout=180)
+        self.think_time = think_time
+        self.samples = []
+        self.etags = {}
+        self.recording = True
+
+    def call(self, op, method, path, body=None, token=None, headers=None):
+        headers = dict(headers or {})
+        data = None
+        if body is not None:
+            data = body if isinstance(body, (bytes, str)) else json.dumps(body)
+            headers.setdefault("Content-Type", "application/json")
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        start = time.perf_counter()
+        try:
+            self.conn.request(method, path, body=data, headers=headers)
+            response = self.conn.getresponse()
+            payload = response.read()
+            status, response_headers = response.status, response.headers
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            status, payload, response_headers = None, b"", {}
+        elapsed = time.perf_counter() - start
+        if self.recording:
+            match = _QUERIES.search(response_headers.get("Server-Timing", ""))
+            self.samples.append((op, status, elapsed, int(match.group(1)) if match else None))
+        if self.think_time:
+            time.sleep(self.think_time)
+        return status, response_headers, payload
+
+
+def exam_session(client, rng, env, args):
+    user = rng.choice(env["subscribers"])
+    status, _, payload = client.call("questions.generate", "POST", "/questions/generate", {
+        "subject": rng.choice(SUBJECTS), "exam_type": rng.choice(EXAM_TYPES), "num_questions": args.exam_questions,
+    }, user["token"])
+    if status != 200:
+        return
+    for question in json.loads(payload):
+        client.call("questions.get_question", "GET", f"/questions/{question['id']}", token=user["token"])
+        client.call("questions.answer_question", "POST", f"/questions/{question['id']}/answer",
+                    {"answer": rng.choice(question["options"])}, user["token"])
+    client.call("progress.summary", "GET", f"/progress/{user['id']}/summary", token=user["token"])
+
+
+def dashboard_session(client, rng, env, args):
+    user = rng.choice(env["subscribers"])
+    for _ in range(args.dashboard_polls):
+        for op, path in (("progress.calendar", f"/progress/{user['id']}"), ("progress.summary", f"/progress/{user['id']}/summary")):
+            etag = client.etags.get(path)
+            status, headers, _ = client.call(op, "GET", path, token=user["token"], headers={"If-None-Match": etag} if etag else None)
+            if status == 200 and headers.get("ETag"):
+                client.etags[path] = headers["ETag"]
+
+
+def chat_session(client, rng, env, args):
+    user = rng.choice(env["subscribers"])
+    for _ in range(args.chat_burst):
+        if rng.random() < args.chat_repeat:
+            message = rng.choice(POPULAR_MESSAGES)
+        else:
+            message = f"Explique {rng.choice(TOPICS)} no contexto {rng.randrange(10 ** 9)} com um exemplo."
+        client.call("ai.chat", "POST", "/ai/chat", {"message": message}, user["token"])
+
+
+def checkout_session(client, rng, env, args):
+    # Cada checkout usa um usuário sem assinatura ainda não usado: a mudança
+    # de assinatura revoga os tokens dele
+    user = env["next_free_user"]()
+    if user is None:
+        return
+    status, _, _ = client.call("subscription.create_checkout_session", "POST", "/subscription/create-checkout-session", {}, user["token"])
+    customer_id = env["stripe"].customers.get(user["email"])
+    if status != 200 or customer_id is None:
+        return
+    payload = checkout_completed_event(customer_id)
+    client.call("subscription.stripe_webhook", "POST", "/subscription/webhook", payload,
+                headers={"Stripe-Signature": sign(payload, WEBHOOK_SECRET)})
+
+
+SESSIONS = {"exam": exam_session, "dashboard": dashboard_session, "chat": chat_session, "checkout": checkout_session}
+
+
+def seed(app, db, models, authz, args, rng):
+    from sqlalchemy import insert, select
+
+    started = time.perf_counter()
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        for start in range(0, args.users, 10000):
+            db.session.execute(insert(models.User), [{
+                "email": f"load{i}@example.com", "password": "x", "is_subscribed": i < args.subscribers,
+            } for i in range(start, min(start + 10000, args.users))])
+        for start in range(0, args.questions, 10000):
+            rows = []
+            for i in range(start, min(start + 10000, args.questions)):
+                options = [f"Alternativa {i}-{k}" for k in range(4)]
+                rows.append({
+                    "text": f"Questão {i} sobre {rng.choice(TOPICS)} e {rng.choice(TOPICS)}: qual alternativa está correta?",
+                    "options": options, "correct_answer": rng.choice(options),
+                    "subject": SUBJECTS[i % len(SUBJECTS)], "exam_type": EXAM_TYPES[i // len(SUBJECTS) % len(EXAM_TYPES)],
+                    "difficulty": rng.choice(DIFFICULTIES),
+                })
+            db.session.execute(insert(models.Question), rows)
+        db.session.commit()
+
+        users = db.session.execute(select(models.User.id, models.User.email, models.User.is_subscribed).order_by(models.User.id)).all()
+        # Histórico de progresso: --progress-days dias sorteados do último ano por usuário
+        today = date.today()
+        days = min(args.progress_days, 365)
+        chunk, progress_rows = [], 0
+        for user in users:
+            for offset in rng.sample(range(365), days):
+                answered = rng.randint(1, 40)
+                chunk.append({"user_id": user.id, "date": today - timedelta(days=offset),
+                              "questions_answered": answered, "correct_answers": rng.randint(0, answered)})
+            if len(chunk) >= 50000:
+                db.session.execute(insert(models.UserProgress), chunk)
+                progress_rows += len(chunk)
+                chunk = []
+        if chunk:
+            db.session.execute(insert(models.UserProgress), chunk)
+            progress_rows += len(chunk)
+        db.session.commit()
+
+        subscribers, free = [], []
+        for user in users:
+            entry = {"id": user.id, "email": user.email}
+            (subscribers if user.is_subscribed else free).append(entry)
+        # Tokens emitidos antes da carga; os usuários sem assinatura só até o
+        # número de checkouts que a execução pode fazer
+        for entries, subscribed in ((subscribers, True), (free[:args.clients * (args.sessions + args.warmup) * len(args.workload)], False)):
+            for entry in entries:
+                entry["token"] = authz.issue_tokens(models.User(id=entry["id"], is_subscribed=subscribed))[0]
+        database = db.engine.dialect.name
+    # Compartilhado entre as cargas: um usuário que já assinou não volta ao checkout
+    free = iter([entry for entry in free if "token" in entry])
+    free_lock = threading.Lock()
+
+    def next_free_user():
+        with free_lock:
+            return next(free, None)
+
+    return {
+        "subscribers": subscribers,
+        "next_free_user": next_free_user,
+        "database": database,
+        "seed": {
+            "users": len(users),
+            "subscribers": len(subscribers),
+            "questions": args.questions,
+            "progress_rows": progress_rows,
+            "seconds": round(time.perf_counter() - started, 1),
+        },
+    }
+
+
+def run_workload(name, env, host, port, args):
+    weights = WORKLOADS[name]
+    kinds, probabilities = list(weights), list(weights.values())
+    clients = [Client(host, port, args.think_ms / 1000) for _ in range(args.clients)]
+    sessions = [0] * args.clients
+    barrier = threading.Barrier(args.clients + 1)
+
+    def run_client(index):
+        client = clients[index]
+        rng = random.Random(f"{args.seed}-{name}-{index}")
+        client.recording = False
+        for _ in range(args.warmup):
+            SESSIONS[rng.choices(kinds, probabilities)[0]](client, rng, env, args)
+        client.recording = True
+        barrier.wait()
+        for _ in range(args.sessions):
+            SESSIONS[rng.choices(kinds, probabilities)[0]](client, rng, env, args)
+            sessions[index] += 1
+
+    threads = [threading.Thread(target=run_client, args=(i,)) for i in range(args.clients)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    samples = [sample for client in clients for sample in client.samples]
+    return {
+        "sessions": sum(sessions),
+        "seconds": round(elapsed, 2),
+        **summarize(samples, elapsed),
+        "operations": {op: summarize([s for s in samples if s[0] == op], elapsed) for op in sorted({s[0] for s in samples})},
+    }
+
+
+def summarize(samples, elapsed):
+    if not samples:
+        return {"requests": 0}
+    latencies = [s[2] for s in samples]
+    queries = [s[3] for s in samples if s[3] is not None]
+    statuses = {}
+    for s in samples:
+        statuses[str(s[1])] = statuses.get(str(s[1]), 0) + 1
+    return {
+        "requests": len(samples),
+        "errors": sum(1 for s in samples if s[1] is None or s[1] >= 400),
+        "statuses": statuses,
+        "throughput_rps": round(len(samples) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "max_ms": round(max(latencies) * 1000, 2),
+        "queries_mean": round(sum(queries) / len(queries), 2) if queries else None,
+        "queries_max": max(queries) if queries else None,
+    }
+
+
+def compare(report, baseline, tolerance, min_delta_ms):
+    # Regressões: vazão menor, p95 maior ou mais queries por requisição que a
+    # execução de referência, em cargas e operações presentes nas duas
+    regressions = []
+    for name, current in report["workloads"].items():
+        previous = baseline.get("workloads", {}).get(name)
+        if not previous:
+            continue
+        if current.get("throughput_rps", 0) < previous.get("throughput_rps", 0) * (1 - tolerance):
+            regressions.append(f"{name}: vazão {previous['throughput_rps']} -> {current['throughput_rps']} req/s")
+        for op, stats in current["operations"].items():
+            before = previous.get("operations", {}).get(op)
+            if not before or not stats.get("requests") or not before.get("requests"):
+                continue
+            if stats["p95_ms"] > before["p95_ms"] * (1 + tolerance) and stats["p95_ms"] - before["p95_ms"] > min_delta_ms:
+                regressions.append(f"{name}/{op}: p95 {before['p95_ms']} -> {stats['p95_ms']} ms")
+            if stats["queries_mean"] is not None and before.get("queries_mean") is not None and stats["queries_mean"] > before["queries_mean"] + 0.5:
+                regressions.append(f"{name}/{op}: {before['queries_mean']} -> {stats['queries_mean']} queries por requisição")
+    return regressions
+
+
+def wait_ready(host, port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=1)
+            conn.request("GET", "/")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"servidor não respondeu em {host}:{port}")
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, timeout=10).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workload", nargs="+", default=["exam", "dashboard", "chat", "mixed"], choices=sorted(WORKLOADS))
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--subscribers", type=int, default=200, help="Usuários com assinatura (os demais servem aos checkouts)")
+    parser.add_argument("--questions", type=int, default=5000)
+    parser.add_argument("--progress-days", type=int, default=120, help="Dias com progresso por usuário no último ano")
+    parser.add_argument("--clients", type=int, default=16, help="Usuários virtuais simultâneos")
+    parser.add_argument("--sessions", type=int, default=20, help="Sessões medidas por cliente em cada carga")
+    parser.add_argument("--warmup", type=int, default=1, help="Sessões por cliente antes da medição")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="Pausa após cada requisição (0 = carga máxima)")
+    parser.add_argument("--exam-questions", type=int, default=10)
+    parser.add_argument("--dashboard-polls", type=int, default=3)
+    parser.add_argument("--chat-burst", type=int, default=5)
+    parser.add_argument("--chat-repeat", type=float, default=0.3, help="Fração das mensagens do chat repetidas")
+    parser.add_argument("--openai-latency", type=float, default=0.3)
+    parser.add_argument("--openai-token-delay", type=float, default=0.0)
+    parser.add_argument("--stripe-latency", type=float, default=0.1)
+    parser.add_argument("--server", choices=["inprocess", "gunicorn"], default="inprocess")
+    parser.add_argument("--workers", type=int, default=2, help="Workers do gunicorn")
+    parser.add_argument("--threads", type=int, default=8, help="Threads por worker do gunicorn")
+    parser.add_argument("--database-url", help="Padrão: SQLite num diretório temporário (o banco é recriado)")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="Configuração extra do app, ex.: ANSWER_WRITE_BEHIND=true")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Grava o relatório também neste arquivo")
+    parser.add_argument("--baseline", help="Relatório anterior para comparação")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Piora relativa aceita antes de acusar regressão")
+    parser.add_argument("--min-delta-ms", type=float, default=2.0, help="Diferença de p95 abaixo da qual não há regressão")
+    args = parser.parse_args()
+
+    database_url = args.database_url or f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'loadtest.db')}"
+    rng = random.Random(args.seed)
+    with FakeOpenAI(latency=args.openai_latency, token_delay=args.openai_token_delay) as openai, \
+            FakeStripe(latency=args.stripe_latency) as stripe:
+        app_env = {
+            "JWT_SECRET_KEY": JWT_SECRET,
+            "OPENAI_BASE_URL": openai.base_url,
+            "OPENAI_API_KEY": "sk-local-benchmark",
+            "STRIPE_API_BASE": stripe.base_url,
+            "STRIPE_SECRET_KEY": "sk_test_loadtest",
+            "STRIPE_WEBHOOK_SECRET": WEBHOOK_SECRET,
+            "QUERY_TIMING_HEADER": "true",
+            "QUERY_SLOW_MS": "600000",
+            "RATE_LIMIT_ENABLED": "false",
+            "QUESTION_POOL_ENABLED": "false",
+            **dict(item.split("=", 1) for item in args.env),
+        }
+        app_module = load_app(database_url, **app_env)
+        env = seed(app_module.app, app_module.db, load_module("models"), load_module("authz"), args, rng)
+        env["stripe"] = stripe
+
+        host, server = "127.0.0.1", None
+        if args.server == "gunicorn":
+            port = 5700
+            server = subprocess.Popen(
+                [sys.executable, "-m", "gunicorn", "-c", os.path.join(ROOT, "gunicorn.conf.py"), "--log-level", "warning", "--access-logfile", "/dev/null"],
+                cwd=ROOT,
+                env={**os.environ, "DATABASE_URL": database_url, "PORT": str(port),
+                     "WEB_CONCURRENCY": str(args.workers), "GUNICORN_THREADS": str(args.threads)},
+            )
+        else:
+            from werkzeug.serving import make_server
+            server = make_server(host, 0, app_module.app, threaded=True)
+            port = server.server_port
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        report = {
+            "meta": {
+                "commit": git_commit(),
+                "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "python": platform.python_version(),
+                "database": env["database"],
+                "server": args.server,
+                "args": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+            },
+            "seed": env["seed"],
+            "workloads": {},
+        }
+        try:
+            wait_ready(host, port)
+            for name in args.workload:
+                report["workloads"][name] = run_workload(name, env, host, port, args)
+        finally:
+            if args.server == "gunicorn":
+                server.send_signal(signal.SIGTERM)
+                server.wait(timeout=30)
+            else:
+                server.shutdown()
+        report["upstreams"] = {
+            "openai_latency_s": args.openai_latency,
+            "openai_requests": openai.requests,
+            "stripe_latency_s": args.stripe_latency,
+            "stripe_requests": stripe.requests,
+        }
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            report["regressions"] = compare(report, json.load(f), args.tolerance, args.min_delta_ms)
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    if report.get("regressions"):
+        print("Regressões em relação a " + args.baseline + ":\n  " + "\n  ".join(report["regressions"]), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
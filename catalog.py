@@ -0,0 +1,108 @@
+from collections import OrderedDict
+from flask import current_app
+from .app import db
+from .models import Question
+from .question_events import on_questions_committed
+import threading
+
+
+class QuestionRecord:
+    # Cópia compacta e imutável dos campos estáticos de uma questão
+    __slots__ = ("id", "text", "options", "correct_answer", "subject", "exam_type", "difficulty")
+
+    def __init__(self, question):
+        self.id = question.id
+        self.text = question.text
+        self.options = tuple(question.options)
+        self.correct_answer = question.correct_answer
+        self.subject = question.subject
+        self.exam_type = question.exam_type
+        self.difficulty = question.difficulty
+
+
+class QuestionCatalog:
+    """Cache LRU das questões no processo; as questões não mudam após criadas."""
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._records = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, question_id):
+        with self._lock:
+            record = self._records.get(question_id)
+            if record is not None:
+                self._records.move_to_end(question_id)
+                return record
+
+        question = db.session.get(Question, question_id)
+        if question is None:
+            return None
+        return self._store(QuestionRecord(question))
+
+    def get_many(self, question_ids):
+        # Busca as que faltam em uma única consulta; mantém a ordem pedida
+        with self._lock:
+            found = {i: self._records[i] for i in question_ids if i in self._records}
+        missing = [i for i in question_ids if i not in found]
+        if missing:
+            for question in Question.query.filter(Question.id.in_(missing)):
+                found[question.id] = self._store(QuestionRecord(question))
+        return [found[i] for i in question_ids if i in found]
+
+    def _store(self, record):
+        with self._lock:
+            self._records[record.id] = record
+            while len(self._records) > self.max_size:
+                self._records.popitem(last=False)
+        return record
+
+    def invalidate(self, question_id):
+        with self._lock:
+            self._records.pop(question_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._records.clear()
+
+    def __len__(self):
+        return len(self._records)
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog():
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                _catalog = QuestionCatalog(current_app.config["QUESTION_CACHE_SIZE"])
+    return _catalog
+
+
+def get_question_record(question_id):
+    # Com o cache desligado, cada chamada lê a questão do banco
+    if not current_app.config["QUESTION_CACHE_ENABLED"]:
+        question = db.session.get(Question, question_id)
+        return QuestionRecord(question) if question else None
+    return get_catalog().get(question_id)
+
+
+def get_question_records(question_ids):
+    if not current_app.config["QUESTION_CACHE_ENABLED"]:
+        by_id = {q.id: q for q in Question.query.filter(Question.id.in_(question_ids))}
+        return [QuestionRecord(by_id[i]) for i in question_ids if i in by_id]
+    return get_catalog().get_many(question_ids)
+
+
+@on_questions_committed
+def _invalidate_questions(changes, committed):
+    # Depois do commit (ou do rollback que desfez o flush), para que nenhum
+    # leitor concorrente guarde a versão antiga. Mudanças feitas em outro
+    # processo (ex.: seed.py) não chegam aqui; como ids novos nunca estão em
+    # cache, só edições de questões existentes ficam defasadas
+    if _catalog is not None:
+        for change in changes:
+            _catalog.invalidate(change.id)
@@ -0,0 +1,246 @@
+from collections import OrderedDict, defaultdict
+from flask import current_app
+from .metrics import counter
+from .textnorm import STOPWORDS, normalize_text, tokens
+import math
+import sqlite3
+import threading
+import time
+
+cache_hits = counter("chat_cache_hits_total", "Respostas do chat servidas pelo cache")
+cache_misses = counter("chat_cache_misses_total", "Mensagens do chat enviadas à OpenAI")
+
+# Além das palavras comuns, os verbos de comando que os alunos usam
+# ("explique", "defina"...) não contam para a similaridade
+CHAT_STOPWORDS = STOPWORDS | set("explique explica explicar defina define definir descreva fale diga resuma significa".split())
+
+
+def tokenize(normalized):
+    return tokens(normalized, CHAT_STOPWORDS)
+
+
+class MemoryBackend:
+    """Dicionário do processo com TTL e despejo LRU."""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        # Retorna as chaves despejadas para abrir espaço
+        evicted = []
+        with self._lock:
+            self._data[key] = (value, time.time() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                evicted.append(self._data.popitem(last=False)[0])
+        return evicted
+
+    def keys(self):
+        with self._lock:
+            return list(self._data.keys())
+
+
+class SQLiteBackend:
+    """Arquivo SQLite local, compartilhado entre os workers da mesma máquina."""
+
+    def __init__(self, path, max_entries, ttl):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS chat_cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, last_access REAL NOT NULL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS chat_cache_last_access ON chat_cache (last_access)")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key):
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute("SELECT value, expires_at FROM chat_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if row[1] < now:
+            conn.execute("DELETE FROM chat_cache WHERE key = ?", (key,))
+            return None
+        conn.execute("UPDATE chat_cache SET last_access = ? WHERE key = ?", (now, key))
+        return row[0]
+
+    def set(self, key, value):
+        conn = self._connect()
+        now = time.time()
+        conn.execute(
+            "INSERT INTO chat_cache (key, value, expires_at, last_access) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at, last_access = excluded.last_access",
+            (key, value, now + self.ttl, now)
+        )
+        return [row[0] for row in conn.execute(
+            "DELETE FROM chat_cache WHERE key IN (SELECT key FROM chat_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?) RETURNING key",
+            (self.max_entries,)
+        )]
+
+    def keys(self):
+        return [row[0] for row in self._connect().execute("SELECT key FROM chat_cache WHERE expires_at >= ?", (time.time(),))]
+
+
+class SimilarityIndex:
+    """Índice TF-IDF em memória sobre as mensagens normalizadas já respondidas.
+
+    Tem o mesmo limite de entradas e TTL do backend: as chaves despejadas
+    pelo backend saem do índice por discard, e as que outro worker despejou
+    (backend sqlite) saem quando envelhecem ou passam do limite.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._vectors = OrderedDict() # chave -> (termos, instante da inclusão), do mais antigo ao mais novo
+        self._postings = defaultdict(set)
+        self._df = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def add(self, key, normalized):
+        terms = set(tokenize(normalized))
+        if not terms:
+            return
+        now = time.time()
+        with self._lock:
+            if key in self._vectors:
+                self._vectors[key] = (self._vectors[key][0], now)
+                self._vectors.move_to_end(key)
+            else:
+                self._vectors[key] = (terms, now)
+                for term in terms:
+                    self._postings[term].add(key)
+                    self._df[term] += 1
+            while self._vectors:
+                oldest, (_, added_at) = next(iter(self._vectors.items()))
+                if len(self._vectors) <= self.max_entries and now - added_at <= self.ttl:
+                    break
+                self._remove(oldest)
+
+    def _weight(self, term):
+        return math.log(1 + (len(self._vectors) + 1) / (self._df.get(term, 0) + 1))
+
+    def most_similar(self, normalized, threshold):
+        terms = set(tokenize(normalized))
+        if not terms:
+            return None
+        with self._lock:
+            candidates = set().union(*(self._postings.get(t, ()) for t in terms))
+            query_norm = math.sqrt(sum(self._weight(t) ** 2 for t in terms))
+            best_key, best_score = None, threshold
+            for key in candidates:
+                other = self._vectors[key][0]
+                dot = sum(self._weight(t) ** 2 for t in terms & other)
+                other_norm = math.sqrt(sum(self._weight(t) ** 2 for t in other))
+                score = dot / (query_norm * other_norm)
+                if score >= best_score:
+                    best_key, best_score = key, score
+            return best_key
+
+    def discard(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._remove(key)
+
+    def _remove(self, key):
+        entry = self._vectors.pop(key, None)
+        for term in entry[0] if entry else ():
+            postings = self._postings[term]
+            postings.discard(key)
+            self._df[term] -= 1
+            if not postings:
+                del self._postings[term], self._df[term]
+
+    def __len__(self):
+        return len(self._vectors)
+
+
+class ChatCache:
+    def __init__(self, backend, similarity_threshold=0):
+        self.backend = backend
+        self.similarity_threshold = similarity_threshold
+        self.index = SimilarityIndex(backend.max_entries, backend.ttl) if similarity_threshold > 0 else None
+        if self.index is not None:
+            for key in backend.keys():
+                self.index.add(key, key)
+
+    def get(self, message):
+        # Retorna (resposta, camada) ou (None, None)
+        key = normalize_text(message)
+        value = self.backend.get(key)
+        if value is not None:
+            cache_hits.inc(tier="exact")
+            return value, "exact"
+        if self.index is not None:
+            self.index.discard(key) # Sem valor no backend: nunca respondida, expirou ou foi despejada
+            similar = self.index.most_similar(key, self.similarity_threshold)
+            if similar is not None:
+                value = self.backend.get(similar)
+                if value is not None:
+                    cache_hits.inc(tier="similar")
+                    return value, "similar"
+                self.index.discard(similar) # Expirou ou foi despejada do backend
+        cache_misses.inc()
+        return None, None
+
+    def set(self, message, response):
+        key = normalize_text(message)
+        evicted = self.backend.set(key, response)
+        if self.index is not None:
+            self.index.discard(*evicted)
+            self.index.add(key, key)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    # Retorna None quando o cache está desligado
+    global _cache
+    config = current_app.config
+    if not config["CHAT_CACHE_ENABLED"]:
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                if config["CHAT_CACHE_BACKEND"] == "sqlite":
+                    backend = SQLiteBackend(config["CHAT_CACHE_PATH"], config["CHAT_CACHE_MAX_ENTRIES"], config["CHAT_CACHE_TTL"])
+                else:
+                    backend = MemoryBackend(config["CHAT_CACHE_MAX_ENTRIES"], config["CHAT_CACHE_TTL"])
+                _cache = ChatCache(backend, config["CHAT_CACHE_SIMILARITY_THRESHOLD"])
+    return _cache
+
+
+def stats():
+    hits, misses = cache_hits.total(), cache_misses.total()
+    return {
+        "hits": hits,
+        "exact_hits": cache_hits.value(tier="exact"),
+        "similar_hits": cache_hits.value(tier="similar"),
+        "misses": misses,
+        "hit_ratio": hits / (hits + misses) if hits + misses else None,
+    }
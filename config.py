@@ -1,7 +1,193 @@
 import os
+from datetime import timedelta
+
+def engine_options(database_uri):
+    # Pool de conexões por processo. Cada worker abre até DB_POOL_SIZE +
+    # DB_MAX_OVERFLOW conexões: some isso para todos os workers e compare com
+    # o max_connections do Postgres. O SQLite usa o pool padrão do SQLAlchemy
+    if database_uri.startswith("sqlite"):
+        return {}
+    return {
+        "pool_size": int(os.environ.get("DB_POOL_SIZE", 10)),
+        "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", 5)),
+        "pool_timeout": float(os.environ.get("DB_POOL_TIMEOUT", 10)),
+        # Renova conexões antigas antes que o servidor ou um proxy as derrube
+        "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", 1800)),
+        "pool_pre_ping": os.environ.get("DB_POOL_PRE_PING", "true").lower() == "true",
+        # Reusa as conexões mais recentes; as ociosas ficam no fim da fila e são recicladas
+        "pool_use_lifo": True,
+    }
 
 class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get("DATABASE_URL", "postgresql://user:password@db:5432/quizdb")
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(SQLALCHEMY_DATABASE_URI)
     JWT_SECRET_KEY = os.environ.get("JWT_SECRET_KEY", "super-secret-jwt-key-replace-me-in-prod")
+    # Tokens de acesso curtos (carregam o estado da assinatura); renovados via /auth/refresh
+    JWT_ACCESS_TOKEN_EXPIRES = timedelta(minutes=int(os.environ.get("JWT_ACCESS_TOKEN_MINUTES", 15)))
+    JWT_REFRESH_TOKEN_EXPIRES = timedelta(days=int(os.environ.get("JWT_REFRESH_TOKEN_DAYS", 30)))
+    # Intervalo em que cada processo relê as revogações de tokens gravadas
+    # pelos demais (o processo que revoga aplica na hora)
+    TOKEN_REVOCATION_REFRESH_S = float(os.environ.get("TOKEN_REVOCATION_REFRESH_S", 5))
+
+    # Geração de questões com IA: limite de chamadas simultâneas à OpenAI
+    # por processo (tamanho do pool de threads) e por requisição
+    AI_MAX_CONCURRENCY = int(os.environ.get("AI_MAX_CONCURRENCY", 32))
+    AI_REQUEST_CONCURRENCY = int(os.environ.get("AI_REQUEST_CONCURRENCY", 8))
+    # Quantidade de questões pedidas por chamada no modo em lote
+    AI_BATCH_SIZE = int(os.environ.get("AI_BATCH_SIZE", 5))
+
+    # Pool de questões pré-geradas por IA: abaixo do mínimo o balde é marcado
+    # para reabastecimento, e o worker (refill_pool.py) completa até o máximo
+    QUESTION_POOL_ENABLED = os.environ.get("QUESTION_POOL_ENABLED", "true").lower() == "true"
+    QUESTION_POOL_LOW_WATERMARK = int(os.environ.get("QUESTION_POOL_LOW_WATERMARK", 5))
+    QUESTION_POOL_HIGH_WATERMARK = int(os.environ.get("QUESTION_POOL_HIGH_WATERMARK", 20))
+    QUESTION_POOL_REFILL_INTERVAL = int(os.environ.get("QUESTION_POOL_REFILL_INTERVAL", 30))
+    # Só entram no reabastecimento os temas da lista (separados por vírgula) ou
+    # os pedidos pelo menos QUESTION_POOL_MIN_HITS vezes; baldes sem pedidos há
+    # QUESTION_POOL_BUCKET_TTL segundos são removidos e o estoque volta ao banco
+    QUESTION_POOL_TOPICS = [t.strip() for t in os.environ.get("QUESTION_POOL_TOPICS", "").split(",") if t.strip()]
+    QUESTION_POOL_MIN_HITS = int(os.environ.get("QUESTION_POOL_MIN_HITS", 3))
+    QUESTION_POOL_BUCKET_TTL = int(os.environ.get("QUESTION_POOL_BUCKET_TTL", 7 * 24 * 3600))
+
+    # Cache de respostas do /ai/chat. Backend "memory" (por processo) ou
+    # "sqlite" (arquivo local compartilhado entre os workers). A camada de
+    # similaridade (TF-IDF) só é usada com limiar > 0, por exemplo 0.85
+    CHAT_CACHE_ENABLED = os.environ.get("CHAT_CACHE_ENABLED", "true").lower() == "true"
+    CHAT_CACHE_BACKEND = os.environ.get("CHAT_CACHE_BACKEND", "memory")
+    CHAT_CACHE_PATH = os.environ.get("CHAT_CACHE_PATH", "/tmp/quizmaster_chat_cache.sqlite3")
+    CHAT_CACHE_TTL = int(os.environ.get("CHAT_CACHE_TTL", 7 * 24 * 3600))
+    CHAT_CACHE_MAX_ENTRIES = int(os.environ.get("CHAT_CACHE_MAX_ENTRIES", 10000))
+    CHAT_CACHE_SIMILARITY_THRESHOLD = float(os.environ.get("CHAT_CACHE_SIMILARITY_THRESHOLD", 0))
+
+    # Cache em memória das questões (texto, opções e gabarito) por processo
+    QUESTION_CACHE_ENABLED = os.environ.get("QUESTION_CACHE_ENABLED", "true").lower() == "true"
+    QUESTION_CACHE_SIZE = int(os.environ.get("QUESTION_CACHE_SIZE", 50000))
+
+    # Modo write-behind das respostas: os eventos ficam num buffer do processo
+    # e são gravados em lote a cada ANSWER_FLUSH_INTERVAL_MS ou ANSWER_FLUSH_BATCH
+    # eventos. ANSWER_MAX_UNFLUSHED limita quanto pode ser perdido numa queda:
+    # ao atingi-lo, a própria requisição espera a gravação. Um lote que falha
+    # ANSWER_FLUSH_MAX_ATTEMPTS vezes seguidas é dividido para descartar só os
+    # eventos recusados pelo banco
+    ANSWER_WRITE_BEHIND = os.environ.get("ANSWER_WRITE_BEHIND", "false").lower() == "true"
+    # Fora do write-behind, progresso e histórico são gravados na requisição;
+    # com ANSWER_DEFER_AGGREGATES, as estimativas de habilidade/dificuldade e
+    # os cartões de revisão (linhas travadas, disputadas entre respostas) vão
+    # pelo mesmo tipo de buffer, com os mesmos intervalos e limites
+    ANSWER_DEFER_AGGREGATES = os.environ.get("ANSWER_DEFER_AGGREGATES", "true").lower() == "true"
+    ANSWER_FLUSH_INTERVAL_MS = int(os.environ.get("ANSWER_FLUSH_INTERVAL_MS", 500))
+    ANSWER_FLUSH_BATCH = int(os.environ.get("ANSWER_FLUSH_BATCH", 500))
+    ANSWER_MAX_UNFLUSHED = int(os.environ.get("ANSWER_MAX_UNFLUSHED", 5000))
+    ANSWER_FLUSH_MAX_ATTEMPTS = int(os.environ.get("ANSWER_FLUSH_MAX_ATTEMPTS", 3))
+
+    # Limites por usuário nas rotas de IA (balde de fichas: "N/S" permite N
+    # requisições de uma vez e recompõe N a cada S segundos; "0" desliga). Em
+    # /questions/generate com IA cada questão pedida gasta uma ficha. Backend
+    # "memory" (por worker) ou "sqlite" (arquivo local compartilhado entre os
+    # workers, para que o limite valha para o servidor todo)
+    RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "true").lower() == "true"
+    RATE_LIMIT_BACKEND = os.environ.get("RATE_LIMIT_BACKEND", "memory")
+    RATE_LIMIT_PATH = os.environ.get("RATE_LIMIT_PATH", "/tmp/quizmaster_rate_limit.sqlite3")
+    RATE_LIMIT_CHAT = os.environ.get("RATE_LIMIT_CHAT", "20/60")
+    RATE_LIMIT_GENERATE = os.environ.get("RATE_LIMIT_GENERATE", "30/300")
+    # Máximo de questões por pedido a /questions/generate
+    QUESTIONS_MAX_PER_REQUEST = int(os.environ.get("QUESTIONS_MAX_PER_REQUEST", 20))
+    # Cota diária de tokens da OpenAI por usuário (entrada + saída, dia UTC,
+    # somada de AIInteraction; 0 = sem cota). No backend "memory" cada worker
+    # relê o consumo do banco a cada AI_QUOTA_SYNC_INTERVAL segundos
+    AI_DAILY_TOKEN_QUOTA = int(os.environ.get("AI_DAILY_TOKEN_QUOTA", 200000))
+    AI_QUOTA_SYNC_INTERVAL = int(os.environ.get("AI_QUOTA_SYNC_INTERVAL", 60))
+
+    # Histórico de interações com a IA: o job archive_interactions.py move as
+    # mais antigas que AI_HISTORY_RETENTION_DAYS para arquivos NDJSON.gz por
+    # dia em AI_HISTORY_ARCHIVE_DIR e as apaga da tabela
+    AI_HISTORY_RETENTION_DAYS = int(os.environ.get("AI_HISTORY_RETENTION_DAYS", 180))
+    AI_HISTORY_ARCHIVE_DIR = os.environ.get("AI_HISTORY_ARCHIVE_DIR", "/var/lib/quizmaster/ai_history")
+
+    # Webhook do Stripe: o evento é gravado (o id descarta reenvios) e aplicado
+    # depois, em lotes e em ordem por cliente, por uma thread de cada worker
+    # web, iniciada quando o worker sobe (gunicorn.conf.py, lifespan do ASGI),
+    # que o webhook acorda e que também consulta os pendentes a cada
+    # STRIPE_EVENTS_POLL_INTERVAL segundos. Com STRIPE_EVENTS_WORKER=false, rode
+    # o worker separado (process_stripe_events.py). Um evento que falha é
+    # repetido até STRIPE_EVENTS_MAX_ATTEMPTS vezes
+    STRIPE_EVENTS_WORKER = os.environ.get("STRIPE_EVENTS_WORKER", "true").lower() == "true"
+    STRIPE_EVENTS_BATCH = int(os.environ.get("STRIPE_EVENTS_BATCH", 200))
+    STRIPE_EVENTS_POLL_INTERVAL = float(os.environ.get("STRIPE_EVENTS_POLL_INTERVAL", 5))
+    STRIPE_EVENTS_MAX_ATTEMPTS = int(os.environ.get("STRIPE_EVENTS_MAX_ATTEMPTS", 10))
+
+    # Sorteio de questões do banco: arrays de ids por (assunto, prova, dificuldade)
+    # e conjuntos de questões já vistas por usuário, ambos em memória
+    SELECTION_BUCKET_TTL = int(os.environ.get("SELECTION_BUCKET_TTL", 300))
+    SELECTION_SEEN_TTL = int(os.environ.get("SELECTION_SEEN_TTL", 600))
+    SELECTION_MAX_USERS = int(os.environ.get("SELECTION_MAX_USERS", 10000))
+
+    # Busca de questões: "postgres" (tsvector + GIN), "memory" (índice invertido
+    # BM25 no processo) ou "auto" (Postgres quando disponível)
+    SEARCH_BACKEND = os.environ.get("SEARCH_BACKEND", "auto")
+    # Intervalo em que o índice em memória lê as questões novas gravadas por
+    # outros processos (inclusive o import_questions)
+    SEARCH_REFRESH_INTERVAL = int(os.environ.get("SEARCH_REFRESH_INTERVAL", 60))
+
+    # Deduplicação das questões geradas pela IA (MinHash/LSH por assunto e prova):
+    # com similaridade estimada >= DEDUPE_THRESHOLD a questão existente é reutilizada
+    DEDUPE_ENABLED = os.environ.get("DEDUPE_ENABLED", "true").lower() == "true"
+    DEDUPE_THRESHOLD = float(os.environ.get("DEDUPE_THRESHOLD", 0.7))
+    DEDUPE_REFRESH_INTERVAL = int(os.environ.get("DEDUPE_REFRESH_INTERVAL", 60))
+    # Espera máxima pelo índice de um (assunto, prova) carregado numa thread;
+    # passado o prazo a questão é inserida sem checagem no banco
+    DEDUPE_LOAD_WAIT_S = float(os.environ.get("DEDUPE_LOAD_WAIT_S", 5))
+
+    # Modo adaptativo de /questions/generate ("adaptive": true): escolhe questões
+    # em que o usuário acerta com esta probabilidade, segundo as estimativas de
+    # habilidade e dificuldade; ADAPTIVE_CANDIDATES é quantas vezes mais questões
+    # são sorteadas para escolher as mais próximas
+    ADAPTIVE_TARGET_SUCCESS = float(os.environ.get("ADAPTIVE_TARGET_SUCCESS", 0.7))
+    ADAPTIVE_CANDIDATES = int(os.environ.get("ADAPTIVE_CANDIDATES", 8))
+
+    # Revisão espaçada: quantas revisões vencidas cada usuário recebe por dia
+    # quando o acúmulo é redistribuído por reschedule_reviews
+    REVIEW_DAILY_LIMIT = int(os.environ.get("REVIEW_DAILY_LIMIT", 100))
+
+    # Modo ASGI (SERVE_MODE=asgi): threads por processo para as rotas Flask
+    # que não são de IA; as rotas de IA rodam no event loop
+    ASGI_WSGI_THREADS = int(os.environ.get("ASGI_WSGI_THREADS", 16))
+
+    # Instrumentação das queries por requisição (query_stats.py): statements
+    # acima de QUERY_SLOW_MS e statements repetidos QUERY_NPLUS1_THRESHOLD
+    # vezes ou mais na mesma requisição (padrão N+1) são registrados no log.
+    # Com QUERY_TIMING_HEADER, as respostas trazem o header Server-Timing
+    QUERY_STATS_ENABLED = os.environ.get("QUERY_STATS_ENABLED", "true").lower() == "true"
+    QUERY_SLOW_MS = float(os.environ.get("QUERY_SLOW_MS", 100))
+    QUERY_NPLUS1_THRESHOLD = int(os.environ.get("QUERY_NPLUS1_THRESHOLD", 10))
+    QUERY_TIMING_HEADER = os.environ.get("QUERY_TIMING_HEADER", "false").lower() == "true"
+
+    # Métricas no formato do Prometheus em /metrics. Com vários workers,
+    # METRICS_DIR (definido pelo gunicorn.conf.py) é a pasta onde cada um
+    # exporta suas métricas a cada METRICS_EXPORT_INTERVAL segundos, para o
+    # /metrics somar todos. Com METRICS_TOKEN, o scrape precisa do header
+    # Authorization: Bearer <token>
+    METRICS_DIR = os.environ.get("METRICS_DIR", "")
+    METRICS_EXPORT_INTERVAL = float(os.environ.get("METRICS_EXPORT_INTERVAL", 5))
+    METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
 
+    # Chamadas à OpenAI (llm.py): prazo por tentativa e total por chamada,
+    # novas tentativas com backoff exponencial (base e teto em segundos) e
+    # circuit breaker por modelo (falhas seguidas para abrir e segundos aberto)
+    LLM_TIMEOUT = float(os.environ.get("LLM_TIMEOUT", 30))
+    LLM_DEADLINE = float(os.environ.get("LLM_DEADLINE", 60))
+    LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", 3))
+    LLM_BACKOFF_BASE = float(os.environ.get("LLM_BACKOFF_BASE", 0.5))
+    LLM_BACKOFF_MAX = float(os.environ.get("LLM_BACKOFF_MAX", 8))
+    LLM_BREAKER_FAILURES = int(os.environ.get("LLM_BREAKER_FAILURES", 5))
+    LLM_BREAKER_COOLDOWN = float(os.environ.get("LLM_BREAKER_COOLDOWN", 30))
+    # Modelo alternativo (mais barato), usado com o principal indisponível ou
+    # com LLM_FALLBACK_INFLIGHT chamadas em andamento no processo (0 desativa)
+    LLM_FALLBACK_MODEL = os.environ.get("LLM_FALLBACK_MODEL", "")
+    LLM_FALLBACK_INFLIGHT = int(os.environ.get("LLM_FALLBACK_INFLIGHT", 0))
+    # Hedging (0 desativa): sem resposta em LLM_HEDGE_AFTER segundos, dispara
+    # uma chamada duplicada, limitadas a LLM_HEDGE_RATIO das chamadas
+    LLM_HEDGE_AFTER = float(os.environ.get("LLM_HEDGE_AFTER", 0))
+    LLM_HEDGE_RATIO = float(os.environ.get("LLM_HEDGE_RATIO", 0.1))
+    LLM_HEDGE_THREADS = int(os.environ.get("LLM_HEDGE_THREADS", 32))
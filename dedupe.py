@@ -0,0 +1,283 @@
+from array import array
+from bisect import bisect_left
+from flask import current_app
+from operator import eq
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, object_session
+from .app import db
+from .metrics import counter
+from .models import Question
+from .selection import SeenSet
+from .textnorm import normalize_text, tokens
+import hashlib
+import threading
+import time
+import zlib
+
+# Assinaturas MinHash de 64 funções de hash, guardadas com 16 bits por valor
+# (b-bit minwise hashing) em Question.minhash. Os 64 hashes de cada shingle
+# saem de um único digest SHAKE-128, estável entre processos (as assinaturas
+# são persistidas). O LSH divide a assinatura em 16 faixas de 4 valores:
+# pares com Jaccard 0,7 viram candidatos em ~99% dos casos.
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+_EMPTY = array("H", [0xFFFF] * NUM_PERM)
+
+dedupe_hits = counter("question_dedupe_hits_total", "Questões geradas pela IA descartadas por serem quase duplicatas")
+dedupe_skipped = counter("question_dedupe_skipped_total", "Questões geradas pela IA inseridas sem checagem no banco, com o índice ainda em carga")
+dedupe_misses = counter("question_dedupe_misses_total", "Questões geradas pela IA inseridas como novas")
+
+
+def shingles(text):
+    # Palavras e pares de palavras consecutivas do texto normalizado, sem stopwords
+    words = tokens(normalize_text(text))
+    return set(words) | {f"{a} {b}" for a, b in zip(words, words[1:])}
+
+
+def signature(text):
+    hashes = [array("H", hashlib.shake_128(s.encode()).digest(2 * NUM_PERM)) for s in shingles(text)]
+    if not hashes:
+        return array("H", _EMPTY)
+    return array("H", map(min, *hashes)) if len(hashes) > 1 else hashes[0]
+
+
+def similarity(sig_a, sig_b):
+    # Estimativa do Jaccard entre os conjuntos de shingles
+    return sum(map(eq, sig_a, sig_b)) / NUM_PERM
+
+
+def band_keys(sig):
+    return [zlib.crc32(sig[band * ROWS:(band + 1) * ROWS]) for band in range(BANDS)]
+
+
+class SignatureIndex:
+    """Índice LSH das assinaturas de um (assunto, prova). As chaves de cada
+    faixa ficam em arrays ordenados (busca binária); o que é inserido depois
+    vai para dicionários pequenos, reincorporados aos arrays quando crescem."""
+
+    def __init__(self, question_ids=(), signatures=()):
+        self._question_ids = array("I", question_ids)
+        self._signatures = array("H")
+        for sig in signatures:
+            self._signatures.extend(sig)
+        self.max_id = max(self._question_ids, default=0)
+        self._members = SeenSet(self._question_ids)
+        self._lock = threading.Lock()
+        self._build()
+
+    def _build(self):
+        n = len(self._question_ids)
+        signatures = self._signatures
+        self._keys, self._positions = [], []
+        for band in range(BANDS):
+            offset = band * ROWS
+            keys = array("I", (zlib.crc32(signatures[p:p + ROWS]) for p in range(offset, n * NUM_PERM, NUM_PERM)))
+            order = sorted(range(n), key=keys.__getitem__)
+            self._keys.append(array("I", (keys[p] for p in order)))
+            self._positions.append(array("I", order))
+        self._recent = [{} for _ in range(BANDS)]
+        self._recent_count = 0
+
+    def __len__(self):
+        return len(self._question_ids)
+
+    def __contains__(self, question_id):
+        return question_id in self._members
+
+    def items(self):
+        # (question_id, assinatura) na ordem de inserção
+        for position, question_id in enumerate(self._question_ids):
+            yield question_id, self._signatures[position * NUM_PERM:(position + 1) * NUM_PERM]
+
+    def add(self, question_id, sig):
+        # Ignora ids já indexados (ex.: a questão inserida por este processo
+        # e relida no refresh)
+        with self._lock:
+            if question_id in self._members:
+                return False
+            self._members.add(question_id)
+            position = len(self._question_ids)
+            self._question_ids.append(question_id)
+            self._signatures.extend(sig)
+            self.max_id = max(self.max_id, question_id)
+            for band, key in enumerate(band_keys(sig)):
+                self._recent[band].setdefault(key, []).append(position)
+            self._recent_count += 1
+            if self._recent_count > max(10000, position // 4):
+                self._build()
+            return True
+
+    def _candidates(self, sig):
+        found = set()
+        for band, key in enumerate(band_keys(sig)):
+            keys, positions = self._keys[band], self._positions[band]
+            i = bisect_left(keys, key)
+            while i < len(keys) and keys[i] == key:
+                found.add(positions[i])
+                i += 1
+            found.update(self._recent[band].get(key, ()))
+        return found
+
+    def matches(self, sig, threshold):
+        # [(question_id, similaridade)] acima do limiar, da mais parecida para a menos
+        with self._lock:
+            result = []
+            for position in self._candidates(sig):
+                start = position * NUM_PERM
+                score = similarity(sig, self._signatures[start:start + NUM_PERM])
+                if score >= threshold:
+                    result.append((self._question_ids[position], score))
+        result.sort(key=lambda match: (-match[1], match[0]))
+        return result
+
+    def find(self, sig, threshold):
+        found = self.matches(sig, threshold)
+        return found[0] if found else None
+
+
+def _signature_rows(subject, exam_type, after_id=0):
+    # Questões sem assinatura gravada (anteriores ao backfill ou importadas
+    # em lote) têm a assinatura calculada na leitura
+    rows = db.session.query(Question.id, Question.minhash, Question.text) \
+        .filter(Question.subject == subject, Question.exam_type == exam_type, Question.id > after_id) \
+        .order_by(Question.id).yield_per(10000)
+    for question_id, minhash, text in rows:
+        yield question_id, array("H", minhash) if minhash else signature(text)
+
+
+def load_index(subject, exam_type):
+    question_ids, signatures = array("I"), []
+    for question_id, sig in _signature_rows(subject, exam_type):
+        question_ids.append(question_id)
+        signatures.append(sig)
+    return SignatureIndex(question_ids, signatures)
+
+
+class _IndexEntry:
+    __slots__ = ("index", "ready", "lock", "refresh_at", "watermark")
+
+    def __init__(self):
+        self.index = None
+        self.ready = threading.Event()
+        self.lock = threading.Lock()
+        self.refresh_at = 0.0
+        self.watermark = 0 # Maior id lido do banco; as inserções locais não contam
+
+
+class Deduplicator:
+    """Índices de assinaturas por (assunto, prova), carregados sob demanda
+    numa thread, um carregamento por chave. Quem pede um índice ainda em
+    carga espera até load_wait segundos; depois disso a questão segue sem
+    checagem no banco (question_dedupe_skipped_total). A cada
+    refresh_interval segundos uma requisição lê as questões com id maior que
+    o último lido do banco (inseridas por outros processos ou importações);
+    as demais seguem com o índice atual. As inserções deste processo entram
+    no índice depois do commit."""
+
+    def __init__(self, app, threshold, refresh_interval, load_wait):
+        self.app = app
+        self.threshold = threshold
+        self.refresh_interval = refresh_interval
+        self.load_wait = load_wait
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def _load(self, key, entry):
+        try:
+            with self.app.app_context():
+                index = load_index(*key)
+            entry.watermark = index.max_id
+            entry.refresh_at = time.monotonic() + self.refresh_interval
+            entry.index = index
+        except Exception as e:
+            # A próxima chamada tenta de novo
+            self.app.logger.warning("Erro ao carregar o índice de duplicatas de %s/%s: %s", *key, e)
+            with self._lock:
+                self._indexes.pop(key, None)
+        finally:
+            entry.ready.set()
+
+    def warm(self, subject, exam_type):
+        # Começa a carregar o índice sem esperar por ele
+        key = (subject, exam_type)
+        with self._lock:
+            entry = self._indexes.get(key)
+            if entry is None:
+                entry = self._indexes[key] = _IndexEntry()
+                threading.Thread(target=self._load, args=(key, entry), name="dedupe-index", daemon=True).start()
+        return entry
+
+    def index(self, subject, exam_type):
+        # None se o índice não ficou pronto a tempo
+        entry = self._indexes.get((subject, exam_type)) or self.warm(subject, exam_type)
+        if not entry.ready.wait(self.load_wait) or entry.index is None:
+            return None
+        if entry.refresh_at < time.monotonic() and entry.lock.acquire(blocking=False):
+            try:
+                entry.refresh_at = time.monotonic() + self.refresh_interval
+                for question_id, sig in _signature_rows(subject, exam_type, entry.watermark):
+                    entry.index.add(question_id, sig)
+                    entry.watermark = max(entry.watermark, question_id)
+            finally:
+                entry.lock.release()
+        return entry.index
+
+    def find(self, subject, exam_type, sig):
+        index = self.index(subject, exam_type)
+        if index is None:
+            dedupe_skipped.inc(subject=subject, exam_type=exam_type)
+            return None
+        return index.find(sig, self.threshold)
+
+    def added(self, question_id, subject, exam_type, sig):
+        # Só atualiza índices já carregados; os demais leem a questão do banco
+        entry = self._indexes.get((subject, exam_type))
+        if entry is not None and entry.index is not None:
+            entry.index.add(question_id, sig)
+
+
+_deduplicator = None
+_deduplicator_lock = threading.Lock()
+_INFO_KEY = "dedupe_inserted"
+
+
+def get_deduplicator():
+    global _deduplicator
+    if _deduplicator is None:
+        with _deduplicator_lock:
+            if _deduplicator is None:
+                config = current_app.config
+                _deduplicator = Deduplicator(
+                    current_app._get_current_object(),
+                    config["DEDUPE_THRESHOLD"],
+                    config["DEDUPE_REFRESH_INTERVAL"],
+                    config["DEDUPE_LOAD_WAIT_S"],
+                )
+    return _deduplicator
+
+
+@event.listens_for(Question, "after_insert")
+def _stash_question(mapper, connection, target):
+    # Guarda a assinatura até o commit: indexada no flush, uma inserção
+    # desfeita ficaria no índice como duplicata de uma questão inexistente
+    if _deduplicator is not None:
+        sig = array("H", target.minhash) if target.minhash else signature(target.text)
+        object_session(target).info.setdefault(_INFO_KEY, []).append((target, target.id, target.subject, target.exam_type, sig))
+
+
+@event.listens_for(Session, "after_commit")
+def _index_committed(session):
+    # Também chamado ao liberar um savepoint; espera o commit da transação principal
+    if session.in_nested_transaction():
+        return
+    for question, question_id, subject, exam_type, sig in session.info.pop(_INFO_KEY, ()):
+        # Inserções de um savepoint desfeito voltam a ser transientes
+        if inspect(question).persistent:
+            _deduplicator.added(question_id, subject, exam_type, sig)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _discard_uncommitted(session, transaction):
+    if transaction.parent is None:
+        session.info.pop(_INFO_KEY, None)
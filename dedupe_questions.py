@@ -0,0 +1,81 @@
+import argparse
+import time
+from sqlalchemy import update
+from .app import app, db
+from .models import Question
+from .dedupe import load_index, signature
+
+
+def backfill_signatures(batch_size=1000):
+    # Grava Question.minhash das questões que ainda não têm, em lotes por id
+    done, last_id = 0, 0
+    started = time.perf_counter()
+    while True:
+        rows = db.session.query(Question.id, Question.text) \
+            .filter(Question.minhash.is_(None), Question.id > last_id) \
+            .order_by(Question.id).limit(batch_size).all()
+        if not rows:
+            break
+        db.session.execute(update(Question), [{"id": question_id, "minhash": signature(text).tobytes()} for question_id, text in rows])
+        db.session.commit()
+        done += len(rows)
+        last_id = rows[-1][0]
+        print(f"{done} assinaturas gravadas ({done / (time.perf_counter() - started):.0f} questões/s)")
+    return done
+
+
+def duplicate_clusters(subject, exam_type, threshold):
+    # Agrupa (union-find) as questões cuja similaridade estimada passa do limiar
+    index = load_index(subject, exam_type)
+    question_ids = [question_id for question_id, _ in index.items()]
+    parent = list(range(len(question_ids)))
+
+    def root(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    position_of = {question_id: position for position, question_id in enumerate(question_ids)}
+    for position, (_, sig) in enumerate(index.items()):
+        for question_id, _ in index.matches(sig, threshold):
+            a, b = root(position), root(position_of[question_id])
+            if a != b:
+                parent[max(a, b)] = min(a, b)
+
+    clusters = {}
+    for position, question_id in enumerate(question_ids):
+        clusters.setdefault(root(position), []).append(question_id)
+    return sorted((ids for ids in clusters.values() if len(ids) > 1), key=lambda ids: (-len(ids), ids[0]))
+
+
+def report(threshold, subject=None, exam_type=None, show=10):
+    groups = db.session.query(Question.subject, Question.exam_type).distinct()
+    if subject:
+        groups = groups.filter(Question.subject == subject)
+    if exam_type:
+        groups = groups.filter(Question.exam_type == exam_type)
+    for group_subject, group_exam_type in groups.order_by(Question.subject, Question.exam_type).all():
+        started = time.perf_counter()
+        clusters = duplicate_clusters(group_subject, group_exam_type, threshold)
+        redundant = sum(len(ids) - 1 for ids in clusters)
+        print(f"{group_subject}/{group_exam_type}: {len(clusters)} grupos de quase duplicatas, "
+              f"{redundant} questões redundantes ({time.perf_counter() - started:.1f}s)")
+        for ids in clusters[:show]:
+            first = db.session.get(Question, ids[0])
+            print(f"  {len(ids)} questões {ids[:10]}{' ...' if len(ids) > 10 else ''}: {first.text[:80]!r}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Grava as assinaturas MinHash das questões e relata grupos de quase duplicatas")
+    parser.add_argument("--threshold", type=float, help="Similaridade mínima (padrão: DEDUPE_THRESHOLD)")
+    parser.add_argument("--subject")
+    parser.add_argument("--exam-type")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--show", type=int, default=10, help="Grupos listados por assunto/prova")
+    parser.add_argument("--skip-backfill", action="store_true", help="Só relata, sem gravar assinaturas")
+    args = parser.parse_args()
+    with app.app_context():
+        if not args.skip_backfill:
+            backfill_signatures(args.batch_size)
+        report(args.threshold or app.config["DEDUPE_THRESHOLD"], args.subject, args.exam_type, args.show)
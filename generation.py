@@ -0,0 +1,222 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from flask import current_app
+from .app import db
+from .models import Question, AIInteraction
+from .metrics import counter
+from .llm import complete, acomplete, usage_tokens
+from . import dedupe
+import threading
+import json
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+generation_errors = counter("ai_generation_errors_total", "Questões que a IA não conseguiu gerar, por tipo de erro")
+
+
+class GenerationError(Exception):
+    pass
+
+
+def _get_executor():
+    # O pool é criado sob demanda para respeitar a configuração do app;
+    # o número de workers é o limite de chamadas simultâneas por processo
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=current_app.config["AI_MAX_CONCURRENCY"],
+                    thread_name_prefix="ai-generation",
+                )
+    return _executor
+
+
+def question_messages(subject, exam_type, topic):
+    return [
+        {"role": "system", "content": f"Você é um especialista em {subject} para {exam_type} e cria questões de múltipla escolha. Formate a saída como um objeto JSON com as chaves 'question_text', 'options' (uma lista de strings) e 'correct_answer' (uma string que corresponde a uma das opções)."},
+        {"role": "user", "content": f"Crie uma questão de múltipla escolha sobre {topic}."}
+    ]
+
+
+def batch_messages(subject, exam_type, topic, count):
+    return [
+        {"role": "system", "content": f"Você é um especialista em {subject} para {exam_type} e cria questões de múltipla escolha. Formate a saída como um objeto JSON com a chave 'questions', uma lista em que cada item tem as chaves 'question_text', 'options' (uma lista de strings) e 'correct_answer' (uma string que corresponde a uma das opções)."},
+        {"role": "user", "content": f"Crie {count} questões de múltipla escolha diferentes entre si sobre {topic}."}
+    ]
+
+
+def parse_question(data):
+    # Valida um item gerado pela IA; retorna None se estiver malformado
+    if not isinstance(data, dict):
+        return None
+    text = data.get("question_text")
+    options = data.get("options")
+    correct_answer = data.get("correct_answer")
+    if not isinstance(text, str) or not text.strip():
+        return None
+    if not isinstance(options, list) or len(options) < 2 or not all(isinstance(o, str) for o in options):
+        return None
+    if correct_answer not in options:
+        return None
+    return {"question_text": text, "options": options, "correct_answer": correct_answer}
+
+
+# Cada resultado é (dados da questão, conteúdo bruto, (tokens de entrada, de saída))
+
+def _parsed_result(response):
+    content = response.choices[0].message.content
+    question_data = parse_question(json.loads(content))
+    if question_data is None:
+        raise GenerationError("Resposta da IA fora do formato esperado")
+    return question_data, content, usage_tokens(response)
+
+
+def generate_one(subject, exam_type, topic):
+    response = complete(
+        "question_generation",
+        messages=question_messages(subject, exam_type, topic),
+        response_format={ "type": "json_object" }
+    )
+    return _parsed_result(response)
+
+
+async def agenerate_one(subject, exam_type, topic):
+    response = await acomplete(
+        "question_generation",
+        messages=question_messages(subject, exam_type, topic),
+        response_format={ "type": "json_object" }
+    )
+    return _parsed_result(response)
+
+
+def _split_tokens(tokens, parts):
+    # Divide os tokens de uma chamada em lote entre as questões (o resto fica na primeira)
+    if tokens is None or parts == 0:
+        return [tokens] * parts
+    return [tokens // parts + (tokens % parts if i == 0 else 0) for i in range(parts)]
+
+
+def _request_batch(subject, exam_type, topic, count):
+    response = complete(
+        "question_generation",
+        messages=batch_messages(subject, exam_type, topic, count),
+        response_format={ "type": "json_object" }
+    )
+    items = json.loads(response.choices[0].message.content).get("questions")
+    if not isinstance(items, list):
+        raise GenerationError("Resposta da IA fora do formato esperado")
+    # Itens inválidos são descartados individualmente
+    valid = [q for q in map(parse_question, items) if q is not None][:count]
+    prompt_tokens, completion_tokens = usage_tokens(response)
+    shares = zip(_split_tokens(prompt_tokens, len(valid)), _split_tokens(completion_tokens, len(valid)))
+    return [(q, json.dumps(q, ensure_ascii=False), tokens) for q, tokens in zip(valid, shares)]
+
+
+def generate_batch(subject, exam_type, topic, count, max_rounds=3):
+    # Pede K questões em uma única chamada; se faltarem itens válidos,
+    # completa com chamadas menores, só com o que falta. Se uma dessas
+    # chamadas falhar, as questões já válidas são mantidas e a falha só
+    # é levantada quando não há nenhuma
+    results = []
+    for _ in range(max_rounds):
+        missing = count - len(results)
+        if missing <= 0:
+            break
+        try:
+            results.extend(_request_batch(subject, exam_type, topic, missing))
+        except Exception as e:
+            if not results:
+                raise
+            generation_errors.inc(error=type(e).__name__)
+            break
+    if not results:
+        raise GenerationError("A IA não retornou nenhuma questão válida")
+    return results
+
+
+def generate_many(subject, exam_type, topic, num_questions, max_concurrency=None, batch_size=1):
+    # Dispara as chamadas em paralelo, limitadas por requisição (semáforo)
+    # e por processo (pool de threads). Com batch_size > 1 cada chamada
+    # gera até batch_size questões. Os resultados são coletados conforme
+    # terminam; falhas individuais não derrubam as demais.
+    if max_concurrency is None:
+        max_concurrency = current_app.config["AI_REQUEST_CONCURRENCY"]
+    slots = threading.BoundedSemaphore(max(1, max_concurrency))
+    executor = _get_executor()
+
+    def task(count):
+        try:
+            if batch_size > 1:
+                return generate_batch(subject, exam_type, topic, count)
+            return [generate_one(subject, exam_type, topic)]
+        finally:
+            slots.release()
+
+    futures = []
+    batch_size = max(1, batch_size)
+    for start in range(0, num_questions, batch_size):
+        slots.acquire()
+        futures.append(executor.submit(task, min(batch_size, num_questions - start)))
+
+    results, errors = [], []
+    for future in as_completed(futures):
+        try:
+            results.extend(future.result())
+        except Exception as e:
+            generation_errors.inc(error=type(e).__name__)
+            errors.append(e)
+    return results, errors
+
+
+def persist_generated(user_id, subject, exam_type, prompt, results, difficulty="dynamic", pool_key=None):
+    # Insere todas as questões e interações de uma vez (um único flush);
+    # o commit fica a cargo de quem chama. Sem user_id (reabastecimento do
+    # pool em segundo plano) não há interação de usuário a registrar.
+    # Quase duplicatas de questões existentes (ou do próprio lote) não são
+    # inseridas: o usuário recebe a questão já existente e o pool simplesmente
+    # não ganha o item repetido.
+    deduplicate = current_app.config["DEDUPE_ENABLED"]
+    threshold = current_app.config["DEDUPE_THRESHOLD"]
+    questions, new_questions, batch = [], [], []
+    for question_data, content, (prompt_tokens, completion_tokens) in results:
+        if user_id is not None:
+            db.session.add(AIInteraction(
+                user_id=user_id,
+                interaction_type="question_generation",
+                prompt=prompt,
+                response=content,
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens
+            ))
+        sig = dedupe.signature(question_data["question_text"])
+        if deduplicate:
+            existing = next((q for other, q in batch if dedupe.similarity(sig, other) >= threshold), None)
+            if existing is None:
+                match = dedupe.get_deduplicator().find(subject, exam_type, sig)
+                existing = db.session.get(Question, match[0]) if match else None
+            if existing is not None:
+                dedupe.dedupe_hits.inc(subject=subject, exam_type=exam_type)
+                if pool_key is None and existing not in questions:
+                    questions.append(existing)
+                continue
+            dedupe.dedupe_misses.inc(subject=subject, exam_type=exam_type)
+
+        question = Question(
+            text=question_data["question_text"],
+            options=question_data["options"],
+            correct_answer=question_data["correct_answer"],
+            subject=subject,
+            exam_type=exam_type,
+            difficulty=difficulty,
+            created_by_ia=True,
+            pool_key=pool_key,
+            minhash=sig.tobytes()
+        )
+        batch.append((sig, question))
+        questions.append(question)
+        new_questions.append(question)
+    db.session.add_all(new_questions)
+    db.session.flush()
+    return questions
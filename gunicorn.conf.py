@@ -0,0 +1,65 @@
+# Configuração de produção: gunicorn -c gunicorn.conf.py
+#
+# SERVE_MODE=wsgi (padrão): workers gthread. Cada chamada à IA ocupa uma
+#   thread durante toda a resposta da OpenAI, então GUNICORN_THREADS limita
+#   quantas rodam ao mesmo tempo por worker.
+# SERVE_MODE=asgi: workers uvicorn servindo asgi.py. As rotas de IA rodam no
+#   event loop (centenas de chamadas em andamento por processo) e as demais no
+#   pool de ASGI_WSGI_THREADS threads de cada worker.
+import importlib
+import multiprocessing
+import os
+import shutil
+import sys
+
+# O backend é um pacote com imports relativos (e config.py na raiz): o
+# pacote é importado pelo nome da pasta, como em python -m <pasta>.seed
+ROOT = os.path.dirname(os.path.abspath(__file__))
+PACKAGE = os.path.basename(ROOT)
+for path in (ROOT, os.path.dirname(ROOT)):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+SERVE_MODE = os.environ.get("SERVE_MODE", "wsgi")
+cpus = multiprocessing.cpu_count()
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+# Respostas da IA (sobretudo em stream) podem levar dezenas de segundos
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+graceful_timeout = 30
+keepalive = 5
+# Recicla workers aos poucos (vazamentos de memória), sem reiniciar todos juntos
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 5000))
+max_requests_jitter = max_requests // 10
+accesslog = "-"
+
+# Métricas somadas entre os workers (metrics.py); a pasta é limpa a cada início do servidor
+os.environ.setdefault("METRICS_DIR", f"/tmp/{PACKAGE}_metrics")
+METRICS_DIR = os.environ["METRICS_DIR"]
+
+
+def on_starting(server):
+    shutil.rmtree(METRICS_DIR, ignore_errors=True)
+    os.makedirs(METRICS_DIR, exist_ok=True)
+
+
+def post_worker_init(worker):
+    # Eventos do Stripe pendentes (ou com nova tentativa) voltam a ser
+    # aplicados assim que o worker sobe, sem esperar o próximo webhook
+    app = importlib.import_module(f"{PACKAGE}.app").app
+    importlib.import_module(f"{PACKAGE}.stripe_events").start_worker(app)
+
+
+def child_exit(server, worker):
+    importlib.import_module(f"{PACKAGE}.metrics").archive_worker(METRICS_DIR, worker.pid)
+
+
+if SERVE_MODE == "asgi":
+    wsgi_app = f"{PACKAGE}.asgi:application"
+    worker_class = "uvicorn.workers.UvicornWorker"
+    workers = int(os.environ.get("WEB_CONCURRENCY", cpus))
+else:
+    wsgi_app = f"{PACKAGE}.app:app"
+    worker_class = "gthread"
+    workers = int(os.environ.get("WEB_CONCURRENCY", cpus * 2 + 1))
+    threads = int(os.environ.get("GUNICORN_THREADS", 8))
@@ -0,0 +1,133 @@
+from datetime import datetime
+from sqlalchemy import and_, delete, or_, select
+from .app import db
+from .models import AIInteraction
+import base64
+import gzip
+import json
+import os
+import zlib
+
+
+def encode_cursor(timestamp, interaction_id):
+    return base64.urlsafe_b64encode(json.dumps([timestamp.isoformat(), interaction_id]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        timestamp, interaction_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(timestamp), int(interaction_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def user_history(user_id, limit=20, cursor=None, interaction_type=None):
+    # Interações do usuário, das mais recentes para as mais antigas, paginadas
+    # por (timestamp, id) pelo índice ix_ai_interaction_user_timestamp: cada
+    # página custa o mesmo, por mais fundo que esteja. Retorna (interações,
+    # próximo cursor ou None)
+    query = AIInteraction.query.filter(AIInteraction.user_id == user_id)
+    if interaction_type:
+        query = query.filter(AIInteraction.interaction_type == interaction_type)
+    after = decode_cursor(cursor) if cursor else None
+    if after:
+        timestamp, interaction_id = after
+        query = query.filter(or_(
+            AIInteraction.timestamp < timestamp,
+            and_(AIInteraction.timestamp == timestamp, AIInteraction.id < interaction_id)
+        ))
+    rows = query.order_by(AIInteraction.timestamp.desc(), AIInteraction.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_cursor(rows[limit - 1].timestamp, rows[limit - 1].id) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+def interaction_body(interaction):
+    return {
+        "id": interaction.id,
+        "interaction_type": interaction.interaction_type,
+        "prompt": interaction.prompt,
+        "response": interaction.response,
+        "cached": bool(interaction.cached),
+        "prompt_tokens": interaction.prompt_tokens,
+        "completion_tokens": interaction.completion_tokens,
+        "timestamp": interaction.timestamp.isoformat(),
+    }
+
+
+def archive_path(directory, day):
+    return os.path.join(directory, f"{day:%Y}", f"{day:%m}", f"ai_interactions-{day.isoformat()}.ndjson.gz")
+
+
+def _append(path, lines):
+    # Cada lote vira um membro gzip completo no fim do arquivo do dia (gzip.open
+    # e zcat leem os membros em sequência); gravado em disco antes do DELETE
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "ab") as f:
+        f.write(gzip.compress("".join(lines).encode("utf-8"), compresslevel=6))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def archive_before(cutoff, directory, batch_size=5000):
+    # Move as interações anteriores a cutoff para arquivos NDJSON.gz por dia
+    # (directory/AAAA/MM/ai_interactions-AAAA-MM-DD.ndjson.gz) e as apaga da
+    # tabela. Percorre pela chave primária, já que os ids crescem com o
+    # tempo, e para no primeiro lote sem nada a arquivar. Se o processo cair
+    # entre gravar um lote e apagá-lo, o lote é gravado de novo na próxima
+    # execução: quem lê os arquivos deve descartar ids repetidos.
+    # Retorna {"rows", "text_bytes", "archive_bytes", "files"}.
+    columns = AIInteraction.__table__.columns
+    stats = {"rows": 0, "text_bytes": 0, "archive_bytes": 0, "files": set()}
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(*columns).where(columns.id > last_id).order_by(columns.id).limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        first_id, last_id = last_id, rows[-1].id
+        old = [row for row in rows if row.timestamp is not None and row.timestamp < cutoff]
+        if not old:
+            break
+
+        by_day = {}
+        for row in old:
+            response = zlib.decompress(row.response_z).decode("utf-8") if row.response_z is not None else row.response
+            line = json.dumps({
+                "id": row.id,
+                "user_id": row.user_id,
+                "interaction_type": row.interaction_type,
+                "prompt": row.prompt,
+                "response": response,
+                "cached": bool(row.cached),
+                "prompt_tokens": row.prompt_tokens,
+                "completion_tokens": row.completion_tokens,
+                "timestamp": row.timestamp.isoformat(),
+            }, ensure_ascii=False) + "\n"
+            by_day.setdefault(row.timestamp.date(), []).append(line)
+            stats["text_bytes"] += len(row.prompt.encode("utf-8")) + len(response.encode("utf-8"))
+        for day, lines in by_day.items():
+            path = archive_path(directory, day)
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            _append(path, lines)
+            stats["archive_bytes"] += os.path.getsize(path) - size
+            stats["files"].add(path)
+
+        db.session.execute(delete(AIInteraction).where(
+            AIInteraction.id > first_id, AIInteraction.id <= last_id, AIInteraction.timestamp < cutoff
+        ))
+        db.session.commit()
+        stats["rows"] += len(old)
+    stats["files"] = sorted(stats["files"])
+    return stats
+
+
+def read_archive(path):
+    # Interações de um arquivo do arquivamento, sem ids repetidos
+    seen = set()
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            item = json.loads(line)
+            if item["id"] not in seen:
+                seen.add(item["id"])
+                yield item
@@ -0,0 +1,210 @@
+import argparse
+import hashlib
+import json
+import os
+import resource
+import time
+from sqlalchemy import insert as plain_insert
+from .app import app, db
+from .models import Question
+from .progress import dialect_insert
+from .textnorm import normalize_text
+
+DIFFICULTIES = {"easy", "medium", "hard", "dynamic"}
+
+
+class InvalidQuestion(ValueError):
+    pass
+
+
+def question_content_hash(text, options, correct_answer, subject, exam_type):
+    # Mesmo hash para questões que só diferem em caixa, acentos ou espaços
+    payload = json.dumps([
+        normalize_text(text),
+        [normalize_text(o) for o in options],
+        normalize_text(correct_answer),
+        normalize_text(subject),
+        normalize_text(exam_type),
+    ], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def validate(record):
+    # Retorna o dicionário pronto para o INSERT ou levanta InvalidQuestion
+    if not isinstance(record, dict):
+        raise InvalidQuestion("registro não é um objeto")
+    text = record.get("text")
+    options = record.get("options")
+    correct_answer = record.get("correct_answer")
+    subject = record.get("subject")
+    exam_type = record.get("exam_type")
+    difficulty = record.get("difficulty", "medium")
+    for name, value in (("text", text), ("subject", subject), ("exam_type", exam_type), ("correct_answer", correct_answer)):
+        if not isinstance(value, str) or not value.strip():
+            raise InvalidQuestion(f"campo '{name}' ausente ou vazio")
+    if not isinstance(options, list) or len(options) < 2 or not all(isinstance(o, str) for o in options):
+        raise InvalidQuestion("'options' deve ser uma lista com ao menos duas strings")
+    if correct_answer not in options:
+        raise InvalidQuestion("'correct_answer' não está entre as opções")
+    if difficulty not in DIFFICULTIES:
+        raise InvalidQuestion(f"dificuldade desconhecida: {difficulty}")
+    return {
+        "text": text,
+        "options": options,
+        "correct_answer": correct_answer,
+        "subject": subject,
+        "exam_type": exam_type,
+        "difficulty": difficulty,
+        "created_by_ia": bool(record.get("created_by_ia", False)),
+        "content_hash": question_content_hash(text, options, correct_answer, subject, exam_type),
+    }
+
+
+def iter_json_array(f, chunk_size=1 << 16):
+    # Lê um array JSON de objetos em blocos, sem carregar o arquivo inteiro
+    decoder = json.JSONDecoder()
+    buf, pos, eof, started = "", 0, False, False
+
+    def read_more():
+        nonlocal buf, pos, eof
+        chunk = f.read(chunk_size)
+        eof = not chunk
+        buf, pos = buf[pos:] + chunk, 0
+
+    while True:
+        separators = " \t\r\n," if started else " \t\r\n"
+        while pos < len(buf) and buf[pos] in separators:
+            pos += 1
+        if pos >= len(buf):
+            if eof:
+                raise ValueError("array JSON incompleto")
+            read_more()
+            continue
+        if not started:
+            if buf[pos] != "[":
+                raise ValueError("o arquivo deve conter um array JSON")
+            started, pos = True, pos + 1
+            continue
+        if buf[pos] == "]":
+            return
+        try:
+            record, pos = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            # Objeto cortado no fim do bloco: lê mais e tenta de novo
+            if eof:
+                raise
+            read_more()
+            continue
+        yield record
+
+
+def iter_ndjson(f):
+    for line in f:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except json.JSONDecodeError as e:
+            yield InvalidQuestion(f"JSON inválido: {e}")
+
+
+def iter_records(path):
+    with open(path, "r", encoding="utf-8") as f:
+        if path.endswith((".ndjson", ".jsonl")):
+            yield from iter_ndjson(f)
+            return
+        # Sem extensão conhecida: "[" indica array, "{" indica uma questão por linha
+        head = f.read(1)
+        while head and head.isspace():
+            head = f.read(1)
+        f.seek(0)
+        yield from (iter_json_array(f) if head == "[" else iter_ndjson(f))
+
+
+class ImportStats:
+    def __init__(self):
+        self.read = self.inserted = self.duplicates = self.invalid = 0
+        self.started = time.perf_counter()
+
+    def rate(self):
+        return self.read / max(time.perf_counter() - self.started, 1e-9)
+
+    def report(self, label="Progresso"):
+        # ru_maxrss vem em KB no Linux
+        peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(f"{label}: {self.read} lidas, {self.inserted} inseridas, {self.duplicates} duplicadas, "
+              f"{self.invalid} inválidas, {self.rate():.0f} linhas/s, pico de memória {peak_mb:.0f} MB")
+
+
+def _insert_batch(batch):
+    # Upsert em lote pelo hash de conteúdo; retorna quantas linhas entraram
+    # (executemany com RETURNING: o SQLAlchemy agrupa as linhas em INSERTs
+    # de vários VALUES sem recompilar a instrução a cada lote)
+    insert = dialect_insert()
+    if insert is not None:
+        stmt = insert(Question).on_conflict_do_nothing(index_elements=[Question.content_hash])
+    else:
+        existing = {h for (h,) in db.session.query(Question.content_hash).filter(
+            Question.content_hash.in_([row["content_hash"] for row in batch]))}
+        batch = [row for row in batch if row["content_hash"] not in existing]
+        if not batch:
+            return 0
+        stmt = plain_insert(Question)
+    inserted = len(db.session.execute(stmt.returning(Question.id), batch).all())
+    db.session.commit()
+    return inserted
+
+
+def import_files(paths, batch_size=1000, report_every=50000, verbose=True):
+    stats = ImportStats()
+    batch, batch_hashes = [], set()
+    next_report = report_every
+
+    def flush():
+        inserted = _insert_batch(batch)
+        stats.inserted += inserted
+        stats.duplicates += len(batch) - inserted
+        batch.clear()
+        batch_hashes.clear()
+
+    for path in paths:
+        for record in iter_records(path):
+            stats.read += 1
+            try:
+                if isinstance(record, InvalidQuestion):
+                    raise record
+                row = validate(record)
+            except InvalidQuestion as e:
+                stats.invalid += 1
+                if verbose and stats.invalid <= 20:
+                    print(f"{path}: registro {stats.read} ignorado: {e}")
+                continue
+            if row["content_hash"] in batch_hashes:
+                stats.duplicates += 1
+                continue
+            batch_hashes.add(row["content_hash"])
+            batch.append(row)
+            if len(batch) >= batch_size:
+                flush()
+            if verbose and stats.read >= next_report:
+                stats.report()
+                next_report += report_every
+    if batch:
+        flush()
+    if verbose:
+        stats.report("Importação concluída")
+    return stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Importa questões de arquivos JSON (array) ou NDJSON, sem apagar as existentes")
+    parser.add_argument("paths", nargs="+", help="Arquivos .json ou .ndjson/.jsonl")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--report-every", type=int, default=50000, help="Intervalo (em registros) dos relatórios de progresso")
+    args = parser.parse_args()
+    for path in args.paths:
+        if not os.path.exists(path):
+            parser.error(f"arquivo não encontrado: {path}")
+    with app.app_context():
+        import_files(args.paths, batch_size=args.batch_size, report_every=args.report_every)
@@ -0,0 +1,369 @@
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from openai import AsyncOpenAI, OpenAI, APIConnectionError, APIStatusError
+from types import SimpleNamespace
+from .metrics import counter, histogram
+import asyncio
+import random
+import threading
+import time
+
+# Chamadas à OpenAI de todas as rotas (ai.py, questions.py, pool e asgi.py)
+# passam por complete/acomplete, que cuidam de:
+# - prazo total por chamada (LLM_DEADLINE), dividido entre as tentativas;
+# - novas tentativas com backoff exponencial e jitter, só para erros
+#   transitórios (conexão, timeout, 408/409/429/5xx), respeitando Retry-After;
+# - circuit breaker por modelo: depois de LLM_BREAKER_FAILURES falhas
+#   seguidas as chamadas falham na hora (CircuitOpenError) por
+#   LLM_BREAKER_COOLDOWN segundos, até uma chamada de teste dar certo;
+# - modelo alternativo (LLM_FALLBACK_MODEL) com o principal indisponível ou
+#   com muitas chamadas em andamento no processo;
+# - hedging opcional: sem resposta em LLM_HEDGE_AFTER segundos, uma segunda
+#   chamada idêntica é disparada e vale a que terminar primeiro;
+# e medem latência, erros, novas tentativas e tokens por tipo de interação.
+
+MODEL = "gpt-4.1-mini" # Ou outro modelo adequado
+
+request_duration = histogram(
+    "openai_request_duration_seconds", "Latência das chamadas à OpenAI (com stream, até o início da resposta)",
+    buckets=(0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60),
+)
+errors = counter("openai_errors_total", "Chamadas à OpenAI que falharam, por tipo de erro")
+retries = counter("openai_retries_total", "Novas tentativas de chamadas à OpenAI")
+tokens = counter("openai_tokens_total", "Tokens consumidos, por tipo de interação e direção (input/output)")
+circuit_opened = counter("openai_circuit_opened_total", "Vezes que o circuit breaker abriu, por modelo")
+fallbacks = counter("openai_fallbacks_total", "Chamadas desviadas para o modelo alternativo, por motivo")
+hedges = counter("openai_hedges_total", "Chamadas duplicadas por demora, por vencedora")
+
+# As novas tentativas são feitas aqui, não no SDK, para controlar prazo e backoff
+client = OpenAI(max_retries=0)
+async_client = AsyncOpenAI(max_retries=0)
+
+_settings = SimpleNamespace(
+    timeout=30.0, deadline=60.0, max_retries=3, backoff_base=0.5, backoff_max=8.0,
+    breaker_failures=5, breaker_cooldown=30.0,
+    fallback_model="", fallback_inflight=0,
+    hedge_after=0.0, hedge_ratio=0.1, hedge_threads=32,
+)
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, retry_after):
+        super().__init__("IA temporariamente indisponível, tente novamente em instantes")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Fechado -> aberto após falhas seguidas -> meio aberto (uma chamada de teste) após o cooldown."""
+
+    def __init__(self, model, failures, cooldown):
+        self.model = model
+        self.failures = failures
+        self.cooldown = cooldown
+        self._consecutive = 0
+        self._opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return "closed"
+        return "half_open" if self._probing or time.monotonic() - self._opened_at >= self.cooldown else "open"
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._probing or time.monotonic() - self._opened_at < self.cooldown:
+                return False
+            self._probing = True
+            return True
+
+    def retry_after(self):
+        if self._opened_at is None:
+            return 0
+        return max(1, int(self.cooldown - (time.monotonic() - self._opened_at)) + 1)
+
+    def record_success(self):
+        with self._lock:
+            self._consecutive = 0
+            self._opened_at = None
+            self._probing = False
+
+    def release(self):
+        # Chamada de teste interrompida sem resultado: libera outra tentativa
+        with self._lock:
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive += 1
+            if self._probing or (self._opened_at is None and self._consecutive >= self.failures):
+                self._opened_at = time.monotonic()
+                self._probing = False
+                circuit_opened.inc(model=self.model)
+
+
+class _HedgeBudget:
+    # Cada chamada rende `ratio` fichas; cada hedge gasta uma. Limita as
+    # chamadas duplicadas a uma fração do tráfego mesmo com o upstream lento
+    def __init__(self):
+        self._tokens = 1.0
+        self._lock = threading.Lock()
+
+    def earn(self):
+        with self._lock:
+            self._tokens = min(10.0, self._tokens + _settings.hedge_ratio)
+
+    def spend(self):
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+_hedge_budget = _HedgeBudget()
+_hedge_executor = None
+_executor_lock = threading.Lock()
+_inflight = 0
+_inflight_lock = threading.Lock()
+
+
+def init_app(app):
+    config = app.config
+    _settings.timeout = config["LLM_TIMEOUT"]
+    _settings.deadline = config["LLM_DEADLINE"]
+    _settings.max_retries = config["LLM_MAX_RETRIES"]
+    _settings.backoff_base = config["LLM_BACKOFF_BASE"]
+    _settings.backoff_max = config["LLM_BACKOFF_MAX"]
+    _settings.breaker_failures = config["LLM_BREAKER_FAILURES"]
+    _settings.breaker_cooldown = config["LLM_BREAKER_COOLDOWN"]
+    _settings.fallback_model = config["LLM_FALLBACK_MODEL"]
+    _settings.fallback_inflight = config["LLM_FALLBACK_INFLIGHT"]
+    _settings.hedge_after = config["LLM_HEDGE_AFTER"]
+    _settings.hedge_ratio = config["LLM_HEDGE_RATIO"]
+    _settings.hedge_threads = config["LLM_HEDGE_THREADS"]
+
+
+def breaker(model):
+    if model not in _breakers:
+        with _breakers_lock:
+            if model not in _breakers:
+                _breakers[model] = CircuitBreaker(model, _settings.breaker_failures, _settings.breaker_cooldown)
+    return _breakers[model]
+
+
+def _choose_model(model):
+    fallback = _settings.fallback_model
+    if fallback and fallback != model:
+        if _settings.fallback_inflight and _inflight >= _settings.fallback_inflight and breaker(fallback).allow():
+            fallbacks.inc(reason="load")
+            return fallback
+        if breaker(model).allow():
+            return model
+        if breaker(fallback).allow():
+            fallbacks.inc(reason="circuit_open")
+            return fallback
+    elif breaker(model).allow():
+        return model
+    raise CircuitOpenError(breaker(model).retry_after())
+
+
+def _track_inflight(delta):
+    global _inflight
+    with _inflight_lock:
+        _inflight += delta
+
+
+def retryable(error):
+    # Mesmo critério do SDK: falhas de conexão/timeout e 408, 409, 429 e 5xx
+    if isinstance(error, APIConnectionError):
+        return True
+    return isinstance(error, APIStatusError) and (error.status_code in (408, 409, 429) or error.status_code >= 500)
+
+
+def _retry_delay(error, attempt):
+    # Backoff exponencial com jitter completo; um Retry-After do servidor é respeitado
+    delay = random.uniform(0, min(_settings.backoff_max, _settings.backoff_base * 2 ** attempt))
+    response = getattr(error, "response", None)
+    if response is not None:
+        try:
+            delay = max(delay, float(response.headers.get("retry-after", 0)))
+        except ValueError:
+            pass
+    return delay
+
+
+def record_usage(interaction_type, usage):
+    # Soma os tokens de um objeto usage da OpenAI e devolve (entrada, saída);
+    # (None, None) quando a resposta não informou o consumo
+    if usage is None:
+        return None, None
+    tokens.inc(usage.prompt_tokens, interaction_type=interaction_type, direction="input")
+    tokens.inc(usage.completion_tokens, interaction_type=interaction_type, direction="output")
+    return usage.prompt_tokens, usage.completion_tokens
+
+
+def _prepare(kwargs):
+    kwargs.setdefault("model", MODEL)
+    if kwargs.get("stream"):
+        # O último chunk do stream traz o usage (com choices vazio)
+        kwargs.setdefault("stream_options", {"include_usage": True})
+    return kwargs
+
+
+class _Attempt:
+    # Uma tentativa: escolhe o modelo, mede e informa o resultado ao breaker
+    def __init__(self, interaction_type, kwargs, expires):
+        self.interaction_type = interaction_type
+        self.model = _choose_model(kwargs["model"])
+        self.kwargs = {**kwargs, "model": self.model, "timeout": max(0.1, min(_settings.timeout, expires - time.monotonic()))}
+        self.hedge = _settings.hedge_after > 0 and not kwargs.get("stream")
+        self.started = time.perf_counter()
+        if self.hedge:
+            _hedge_budget.earn()
+        _track_inflight(1)
+
+    def succeeded(self, response):
+        _track_inflight(-1)
+        breaker(self.model).record_success()
+        request_duration.observe(time.perf_counter() - self.started, interaction_type=self.interaction_type, model=self.model, outcome="ok")
+        if not self.kwargs.get("stream"):
+            record_usage(self.interaction_type, response.usage)
+        return response
+
+    def cancelled(self):
+        _track_inflight(-1)
+        breaker(self.model).release()
+
+    def failed(self, error):
+        _track_inflight(-1)
+        request_duration.observe(time.perf_counter() - self.started, interaction_type=self.interaction_type, model=self.model, outcome="error")
+        errors.inc(interaction_type=self.interaction_type, error=type(error).__name__)
+        if retryable(error):
+            breaker(self.model).record_failure()
+            return True
+        # Erros do pedido (400, 401...) mostram que o upstream está respondendo
+        breaker(self.model).record_success()
+        return False
+
+
+def _get_hedge_executor():
+    global _hedge_executor
+    if _hedge_executor is None:
+        with _executor_lock:
+            if _hedge_executor is None:
+                _hedge_executor = ThreadPoolExecutor(max_workers=_settings.hedge_threads, thread_name_prefix="ai-hedge")
+    return _hedge_executor
+
+
+def _hedged(interaction_type, call):
+    def count_loser_tokens(future):
+        # A chamada perdedora não pode ser interrompida; os tokens dela também são cobrados
+        if future.exception() is None:
+            record_usage(interaction_type, future.result().usage)
+
+    executor = _get_hedge_executor()
+    first = executor.submit(call)
+    done, _ = wait([first], timeout=_settings.hedge_after)
+    if done or not _hedge_budget.spend():
+        return first.result()
+    second = executor.submit(call)
+    pending, error = {first, second}, None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is not None:
+                error = future.exception()
+                continue
+            hedges.inc(winner="hedge" if future is second else "primary")
+            for loser in pending:
+                loser.add_done_callback(count_loser_tokens)
+            return future.result()
+    raise error
+
+
+async def _ahedged(call):
+    first = asyncio.ensure_future(call())
+    done, _ = await asyncio.wait({first}, timeout=_settings.hedge_after)
+    if done or not _hedge_budget.spend():
+        return await first
+    second = asyncio.ensure_future(call())
+    pending, error = {first, second}, None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    error = task.exception()
+                    continue
+                hedges.inc(winner="hedge" if task is second else "primary")
+                return task.result()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def complete(interaction_type, deadline=None, **kwargs):
+    # chat.completions.create com prazo, novas tentativas, breaker, fallback e
+    # hedging. Sem stream, os tokens já são contabilizados aqui; com stream,
+    # quem consome chama record_usage no último chunk (as novas tentativas
+    # valem só para a abertura do stream)
+    kwargs = _prepare(kwargs)
+    expires = time.monotonic() + (deadline or _settings.deadline)
+    for attempt_number in range(_settings.max_retries + 1):
+        try:
+            attempt = _Attempt(interaction_type, kwargs, expires)
+        except CircuitOpenError as e:
+            errors.inc(interaction_type=interaction_type, error=type(e).__name__)
+            raise
+        call = lambda: client.chat.completions.create(**attempt.kwargs)
+        try:
+            response = _hedged(interaction_type, call) if attempt.hedge else call()
+        except Exception as e:
+            if not attempt.failed(e) or attempt_number == _settings.max_retries:
+                raise
+            delay = _retry_delay(e, attempt_number)
+            if time.monotonic() + delay >= expires:
+                raise
+            retries.inc(interaction_type=interaction_type)
+            time.sleep(delay)
+            continue
+        return attempt.succeeded(response)
+
+
+async def acomplete(interaction_type, deadline=None, **kwargs):
+    kwargs = _prepare(kwargs)
+    expires = time.monotonic() + (deadline or _settings.deadline)
+    for attempt_number in range(_settings.max_retries + 1):
+        try:
+            attempt = _Attempt(interaction_type, kwargs, expires)
+        except CircuitOpenError as e:
+            errors.inc(interaction_type=interaction_type, error=type(e).__name__)
+            raise
+        call = lambda: async_client.chat.completions.create(**attempt.kwargs)
+        try:
+            response = await (_ahedged(call) if attempt.hedge else call())
+        except asyncio.CancelledError:
+            attempt.cancelled()
+            raise
+        except Exception as e:
+            if not attempt.failed(e) or attempt_number == _settings.max_retries:
+                raise
+            delay = _retry_delay(e, attempt_number)
+            if time.monotonic() + delay >= expires:
+                raise
+            retries.inc(interaction_type=interaction_type)
+            await asyncio.sleep(delay)
+            continue
+        return attempt.succeeded(response)
+
+
+def usage_tokens(response):
+    # (entrada, saída) de uma resposta já contabilizada por complete/acomplete
+    usage = response.usage
+    return (usage.prompt_tokens, usage.completion_tokens) if usage is not None else (None, None)
@@ -0,0 +1,302 @@
+from bisect import bisect_left
+import atexit
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+
+# Registro simples de métricas do processo. Cada worker do gunicorn tem o
+# seu; com METRICS_DIR, os workers exportam um snapshot periódico para a
+# pasta e o /metrics soma todos (ver collect). Os locks só protegem
+# atualizações em memória: nada de I/O no caminho das requisições.
+_registry = {}
+_registry_lock = threading.Lock()
+_logger = logging.getLogger(__name__)
+
+
+def _pairs(key):
+    # Labels no formato do snapshot (JSON): [[nome, valor], ...]
+    return [list(pair) for pair in key]
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def total(self):
+        return sum(self._values.values())
+
+    def samples(self):
+        return [(dict(key), value) for key, value in list(self._values.items())]
+
+    def dump(self):
+        return {"type": "counter", "help": self.help_text, "values": [[_pairs(key), value] for key, value in list(self._values.items())]}
+
+
+# Limites padrão dos histogramas de latência, em segundos
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        # labels -> [contagem por faixa (a última é +Inf), soma]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][index] += 1
+            state[1] += value
+
+    def count(self, **labels):
+        state = self._values.get(tuple(sorted(labels.items())))
+        return sum(state[0]) if state else 0
+
+    def quantile(self, q, **labels):
+        # Limite superior da faixa que contém o quantil (None sem observações)
+        state = self._values.get(tuple(sorted(labels.items())))
+        if not state:
+            return None
+        counts = state[0]
+        rank = q * sum(counts)
+        seen = 0
+        for bound, n in zip(self.buckets + (float("inf"),), counts):
+            seen += n
+            if seen >= rank and n:
+                return bound
+        return float("inf")
+
+    def samples(self):
+        # [(labels, contagens acumuladas por limite, soma, total)], como no formato do Prometheus
+        result = []
+        with self._lock:
+            items = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        for key, counts, total in items:
+            cumulative, seen = [], 0
+            for n in counts:
+                seen += n
+                cumulative.append(seen)
+            result.append((dict(key), list(zip(self.buckets + (float("inf"),), cumulative)), total, seen))
+        return result
+
+    def dump(self):
+        with self._lock:
+            values = [[_pairs(key), list(counts), total] for key, (counts, total) in self._values.items()]
+        return {"type": "histogram", "help": self.help_text, "buckets": list(self.buckets), "values": values}
+
+
+def _register(cls, name, *args):
+    with _registry_lock:
+        if name not in _registry:
+            _registry[name] = cls(name, *args)
+        return _registry[name]
+
+
+def counter(name, help_text=""):
+    return _register(Counter, name, help_text)
+
+
+def histogram(name, help_text="", buckets=DEFAULT_BUCKETS):
+    return _register(Histogram, name, help_text, buckets)
+
+
+def snapshot():
+    # Estado de todas as métricas do processo, serializável em JSON
+    with _registry_lock:
+        metrics = list(_registry.values())
+    return {metric.name: metric.dump() for metric in metrics}
+
+
+def merge(target, data):
+    # Soma o snapshot data em target (contadores e faixas dos histogramas)
+    for name, metric in data.items():
+        current = target.setdefault(name, {**metric, "values": []})
+        index = {tuple(map(tuple, value[0])): value for value in current["values"]}
+        for value in metric["values"]:
+            key = tuple(map(tuple, value[0]))
+            existing = index.get(key)
+            if existing is None:
+                existing = index[key] = [value[0]] + [list(v) if isinstance(v, list) else v for v in value[1:]]
+                current["values"].append(existing)
+            elif metric["type"] == "counter":
+                existing[1] += value[1]
+            else:
+                existing[1] = [a + b for a, b in zip(existing[1], value[1])]
+                existing[2] += value[2]
+    return target
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(data):
+    # Formato de texto do Prometheus (versão 0.0.4)
+    lines = []
+    for name in sorted(data):
+        metric = data[name]
+        lines.append(f"# HELP {name} {_escape(metric['help'])}")
+        lines.append(f"# TYPE {name} {metric['type']}")
+        for pairs, *value in sorted(metric["values"], key=lambda v: v[0]):
+            if metric["type"] == "counter":
+                lines.append(f"{name}{_labels(pairs)} {_number(value[0])}")
+                continue
+            counts, total = value
+            seen = 0
+            for bound, n in zip(metric["buckets"] + [float("inf")], counts):
+                seen += n
+                lines.append(f"{name}_bucket{_labels(pairs + [['le', _number(bound)]])} {seen}")
+            lines.append(f"{name}_sum{_labels(pairs)} {_number(total)}")
+            lines.append(f"{name}_count{_labels(pairs)} {seen}")
+    return "\n".join(lines) + "\n"
+
+
+# Exportação entre workers (METRICS_DIR): <pid>.json por worker vivo e
+# archive.json com o acumulado dos que já saíram (gunicorn.conf.py: child_exit)
+
+_exporter_pid = None
+
+
+def _write_json(path, data):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+class _DirectoryLock:
+    def __init__(self, directory, exclusive):
+        self.path = os.path.join(directory, ".lock")
+        self.mode = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+
+    def __enter__(self):
+        self.file = open(self.path, "a")
+        fcntl.flock(self.file, self.mode)
+
+    def __exit__(self, *exc):
+        fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
+
+
+def export(directory):
+    _write_json(os.path.join(directory, f"{os.getpid()}.json"), snapshot())
+
+
+def start_exporter(directory, interval):
+    # Chamado no worker (depois do fork); repete a cada interval segundos e no encerramento
+    global _exporter_pid
+    if _exporter_pid == os.getpid():
+        return
+    _exporter_pid = os.getpid()
+    os.makedirs(directory, exist_ok=True)
+
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                export(directory)
+            except OSError as e:
+                _logger.warning("Erro ao exportar métricas: %s", e)
+
+    threading.Thread(target=run, name="metrics-exporter", daemon=True).start()
+    atexit.register(export, directory)
+
+
+def archive_worker(directory, pid):
+    # Incorpora o último snapshot de um worker encerrado ao acumulado, para
+    # que os contadores somados não diminuam quando workers são reciclados
+    path = os.path.join(directory, f"{pid}.json")
+    if not os.path.exists(path):
+        return
+    with _DirectoryLock(directory, exclusive=True):
+        archive = os.path.join(directory, "archive.json")
+        _write_json(archive, merge(_read_json(archive), _read_json(path)))
+        os.remove(path)
+
+
+def collect(directory=None):
+    # Snapshot do processo somado aos dos demais workers (quando há METRICS_DIR)
+    data = {}
+    if directory and os.path.isdir(directory):
+        own = f"{os.getpid()}.json"
+        with _DirectoryLock(directory, exclusive=False):
+            for filename in os.listdir(directory):
+                if filename.endswith(".json") and filename != own:
+                    merge(data, _read_json(os.path.join(directory, filename)))
+    return merge(data, snapshot())
+
+
+def init_app(app):
+    # Latência por rota e o endpoint /metrics
+    from flask import Response, abort, g, request
+    global _logger
+
+    _logger = app.logger
+
+    directory = app.config["METRICS_DIR"]
+    interval = app.config["METRICS_EXPORT_INTERVAL"]
+    token = app.config["METRICS_TOKEN"]
+    request_duration = histogram("http_request_duration_seconds", "Latência das requisições por rota (até o início da resposta)")
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+        if directory and _exporter_pid != os.getpid():
+            start_exporter(directory, interval)
+
+    @app.after_request
+    def observe_request(response):
+        started = g.get("request_started")
+        if started is not None:
+            request_duration.observe(
+                time.perf_counter() - started,
+                endpoint=request.endpoint or "unmatched", method=request.method, status=response.status_code,
+            )
+        return response
+
+    @app.route("/metrics")
+    def metrics():
+        if token and request.headers.get("Authorization") != f"Bearer {token}":
+            abort(401)
+        return Response(render(collect(directory)), mimetype="text/plain; version=0.0.4")
@@ -1,11 +1,16 @@
 from .app import db
 from datetime import datetime
+import zlib
 
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
     password = db.Column(db.String(128), nullable=False)
     is_subscribed = db.Column(db.Boolean, default=False)
+    # Cliente no Stripe, criado no primeiro checkout; o webhook localiza o usuário por ele
+    stripe_customer_id = db.Column(db.String(255), unique=True, nullable=True)
+    # Epoch em segundos: tokens de acesso emitidos antes disso foram revogados
+    tokens_valid_after = db.Column(db.Integer, nullable=True, index=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     def __repr__(self):
@@ -21,10 +26,38 @@ class Question(db.Model):
     difficulty = db.Column(db.String(50), default='medium')
     created_by_ia = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Preenchido enquanto a questão aguarda no pool de questões pré-geradas
+    pool_key = db.Column(db.String(255), nullable=True, index=True)
+    # sha256 do conteúdo normalizado; evita duplicatas na importação em lote
+    content_hash = db.Column(db.String(64), nullable=True, unique=True)
+    # Assinatura MinHash do texto (ver dedupe.py), usada para detectar quase duplicatas
+    minhash = db.Column(db.LargeBinary, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_question_subject_exam_difficulty', 'subject', 'exam_type', 'difficulty'),
+        # Busca textual em português (só no Postgres; nos demais bancos a busca usa o índice em memória)
+        db.Index('ix_question_text_fts', db.func.to_tsvector('portuguese', text), postgresql_using='gin').ddl_if(dialect='postgresql'),
+    )
 
     def __repr__(self):
         return f'<Question {self.id} - {self.subject}>'
 
+class QuestionPoolBucket(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(255), unique=True, nullable=False)
+    subject = db.Column(db.String(120), nullable=False)
+    exam_type = db.Column(db.String(120), nullable=False)
+    difficulty = db.Column(db.String(50), nullable=False)
+    topic = db.Column(db.Text, nullable=False) # Prompt original, usado para reabastecer
+    low_since = db.Column(db.DateTime, nullable=True) # Quando o balde ficou abaixo do mínimo
+    last_refilled_at = db.Column(db.DateTime, nullable=True)
+    last_refill_lag = db.Column(db.Float, nullable=True) # Segundos entre ficar baixo e ser reabastecido
+    hits = db.Column(db.Integer, nullable=False, default=0) # Pedidos com este tema; decide se o balde é reabastecido
+    last_hit_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<QuestionPoolBucket {self.key}>'
+
 class UserProgress(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -35,32 +68,158 @@ class UserProgress(db.Model):
 
     user = db.relationship('User', backref=db.backref('progress', lazy=True))
 
+    # Uma linha por usuário e dia; é o alvo do upsert em progress.upsert_progress
+    __table_args__ = (db.UniqueConstraint('user_id', 'date', name='uq_user_progress_user_date'),)
+
     def __repr__(self):
         return f'<UserProgress {self.user_id} on {self.date}>'
 
-class Subscription(db.Model):
+class ProgressSummary(db.Model):
+    # Resumo do calendário de progresso, um por usuário. "days" guarda os
+    # últimos 365 dias empacotados (pares uint16: respondidas, corretas) a
+    # partir de start_date; é reconstruído quando version != built_version
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0) # Incrementado a cada resposta
+    built_version = db.Column(db.Integer, nullable=True)
+    start_date = db.Column(db.Date, nullable=True)
+    days = db.Column(db.LargeBinary, nullable=True)
+    total_answered = db.Column(db.Integer, default=0)
+    total_correct = db.Column(db.Integer, default=0)
+    active_days = db.Column(db.Integer, default=0)
+    current_streak = db.Column(db.Integer, default=0)
+    longest_streak = db.Column(db.Integer, default=0)
+
+    def __repr__(self):
+        return f'<ProgressSummary {self.user_id} v{self.version}>'
+
+class AnswerEvent(db.Model):
+    # Histórico de respostas por questão; alimenta estatísticas e revisões
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    question_id = db.Column(db.Integer, db.ForeignKey('question.id'), nullable=False, index=True)
+    is_correct = db.Column(db.Boolean, nullable=False)
+    answered_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (db.Index('ix_answer_event_user_question', 'user_id', 'question_id'),)
+
+    def __repr__(self):
+        return f'<AnswerEvent {self.user_id} -> {self.question_id}>'
+
+class QuestionStats(db.Model):
+    # Estatísticas agregadas por questão, atualizadas a cada resposta (ver adaptive.py).
+    # rating é a dificuldade estimada na escala logística do modelo de Rasch/Elo
+    question_id = db.Column(db.Integer, db.ForeignKey('question.id'), primary_key=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    correct = db.Column(db.Integer, nullable=False, default=0)
+    rating = db.Column(db.Float, nullable=False, default=0.0)
+
+    def __repr__(self):
+        return f'<QuestionStats {self.question_id} {self.rating:.2f}>'
+
+class UserSkill(db.Model):
+    # Habilidade estimada do usuário por assunto, na mesma escala de QuestionStats.rating
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+    subject = db.Column(db.String(120), primary_key=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    correct = db.Column(db.Integer, nullable=False, default=0)
+    rating = db.Column(db.Float, nullable=False, default=0.0)
+
+    def __repr__(self):
+        return f'<UserSkill {self.user_id} {self.subject} {self.rating:.2f}>'
+
+class ReviewCard(db.Model):
+    # Estado de revisão espaçada (SM-2) de cada questão respondida pelo usuário;
+    # o índice (user_id, due_at) atende a fila de revisão sem varrer os cartões
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    question_id = db.Column(db.Integer, db.ForeignKey('question.id'), nullable=False)
+    repetitions = db.Column(db.Integer, nullable=False, default=0) # Acertos seguidos
+    interval_days = db.Column(db.Float, nullable=False, default=0.0)
+    ease = db.Column(db.Float, nullable=False, default=2.5)
+    lapses = db.Column(db.Integer, nullable=False, default=0) # Vezes que errou depois de acertar
+    due_at = db.Column(db.DateTime, nullable=False)
+    last_reviewed_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'question_id', name='uq_review_card_user_question'),
+        db.Index('ix_review_card_user_due', 'user_id', 'due_at'),
+    )
+
+    def __repr__(self):
+        return f'<ReviewCard {self.user_id} -> {self.question_id} due {self.due_at}>'
+
+class Subscription(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     stripe_customer_id = db.Column(db.String(255), unique=True, nullable=False)
     stripe_subscription_id = db.Column(db.String(255), unique=True, nullable=False)
     status = db.Column(db.String(50), nullable=False) # active, cancelled, past_due, etc.
     start_date = db.Column(db.DateTime, default=datetime.utcnow)
     end_date = db.Column(db.DateTime, nullable=True)
+    # created do último evento do Stripe aplicado; eventos mais antigos que chegam atrasados são ignorados
+    last_event_created = db.Column(db.Integer, nullable=True)
 
     user = db.relationship('User', backref=db.backref('subscription', uselist=False, lazy=True))
 
     def __repr__(self):
         return f'<Subscription {self.stripe_subscription_id} for user {self.user_id}>'
 
+class StripeEvent(db.Model):
+    # Eventos do webhook do Stripe, gravados como chegaram e aplicados depois
+    # pelo worker (stripe_events.py). A chave é o id do evento: um reenvio do
+    # Stripe não gera uma segunda linha e, portanto, não é aplicado duas vezes
+    id = db.Column(db.String(255), primary_key=True)
+    type = db.Column(db.String(100), nullable=False)
+    customer_id = db.Column(db.String(255), nullable=True)
+    created = db.Column(db.Integer, nullable=False) # Timestamp do evento no Stripe; define a ordem por cliente
+    payload = db.Column(db.Text, nullable=False)
+    received_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    processed_at = db.Column(db.DateTime, nullable=True) # Vazio enquanto pendente
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    last_error = db.Column(db.Text, nullable=True)
+
+    # O worker busca os pendentes (processed_at nulo) em ordem de created
+    __table_args__ = (db.Index('ix_stripe_event_pending', 'processed_at', 'created'),)
+
+    def __repr__(self):
+        return f'<StripeEvent {self.id} {self.type}>'
+
 class AIInteraction(db.Model):
+    # Respostas a partir de COMPRESS_MIN_BYTES são gravadas comprimidas (zlib)
+    # em response_z; as menores ficam em texto na coluna response. O atributo
+    # response lê e grava nas duas de forma transparente
+    COMPRESS_MIN_BYTES = 512
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     interaction_type = db.Column(db.String(50), nullable=False) # 'question_generation', 'chat'
     prompt = db.Column(db.Text, nullable=False)
-    response = db.Column(db.Text, nullable=False)
+    response_text = db.Column('response', db.Text, nullable=True)
+    response_z = db.Column(db.LargeBinary, nullable=True)
+    cached = db.Column(db.Boolean, default=False) # Resposta servida pelo cache do chat, sem chamar a IA
+    # Tokens cobrados pela OpenAI (usage); vazios em respostas do cache e streams interrompidos
+    prompt_tokens = db.Column(db.Integer, nullable=True)
+    completion_tokens = db.Column(db.Integer, nullable=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
     user = db.relationship('User', backref=db.backref('ai_interactions', lazy=True))
 
+    # Histórico do usuário (/ai/history) paginado por (timestamp, id) sem ordenar a tabela
+    __table_args__ = (db.Index('ix_ai_interaction_user_timestamp', 'user_id', 'timestamp', 'id'),)
+
+    @property
+    def response(self):
+        if self.response_z is not None:
+            return zlib.decompress(self.response_z).decode('utf-8')
+        return self.response_text
+
+    @response.setter
+    def response(self, value):
+        data = value.encode('utf-8')
+        if len(data) >= self.COMPRESS_MIN_BYTES:
+            self.response_text, self.response_z = None, zlib.compress(data, 6)
+        else:
+            self.response_text, self.response_z = value, None
+
     def __repr__(self):
         return f'<AIInteraction {self.id} - {self.interaction_type}>'
@@ -0,0 +1,156 @@
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import func, or_
+from sqlalchemy.exc import IntegrityError
+from .app import db
+from .models import Question, QuestionPoolBucket
+from .generation import generate_many, persist_generated
+from .metrics import counter
+from .textnorm import normalize_text
+import hashlib
+
+pool_hits = counter("question_pool_hits_total", "Questões servidas a partir do pool")
+pool_misses = counter("question_pool_misses_total", "Questões geradas na hora por falta de estoque no pool")
+
+
+def pool_key(subject, exam_type, difficulty, topic):
+    raw = "|".join(normalize_text(part) for part in (subject, exam_type, difficulty, topic))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _available(key):
+    return Question.query.filter_by(pool_key=key).count()
+
+
+def _whitelisted(topic):
+    return normalize_text(topic) in {normalize_text(t) for t in current_app.config["QUESTION_POOL_TOPICS"]}
+
+
+def _eligible(bucket):
+    # Prompts livres são quase sempre únicos: só temas da lista ou pedidos
+    # com frequência justificam gastar geração antecipada
+    return bucket.hits >= current_app.config["QUESTION_POOL_MIN_HITS"] or _whitelisted(bucket.topic)
+
+
+def _get_or_create_bucket(key, subject, exam_type, difficulty, topic):
+    bucket = QuestionPoolBucket.query.filter_by(key=key).first()
+    if bucket:
+        return bucket, False
+    try:
+        # Outro worker pode ter criado o mesmo balde ao mesmo tempo
+        with db.session.begin_nested():
+            bucket = QuestionPoolBucket(
+                key=key, subject=subject, exam_type=exam_type, difficulty=difficulty, topic=topic, hits=0
+            )
+            db.session.add(bucket)
+        return bucket, True
+    except IntegrityError:
+        return QuestionPoolBucket.query.filter_by(key=key).first(), False
+
+
+def take(subject, exam_type, difficulty, topic, num_questions):
+    # Retira até num_questions questões prontas do balde; o restante deve
+    # ser gerado na hora por quem chama. O commit fica a cargo de quem chama.
+    key = pool_key(subject, exam_type, difficulty, topic)
+    bucket, created = _get_or_create_bucket(key, subject, exam_type, difficulty, topic)
+    now = datetime.utcnow()
+    # Contagem aproximada (sem lock): basta para separar temas populares
+    bucket.hits += 1
+    bucket.last_hit_at = now
+
+    taken, depth = [], 0
+    if not created:
+        depth = _available(key)
+        taken = Question.query.filter_by(pool_key=key).order_by(Question.id) \
+            .limit(num_questions).with_for_update(skip_locked=True).all()
+        for question in taken:
+            question.pool_key = None
+    if bucket.low_since is None and _eligible(bucket) \
+            and depth - len(taken) < current_app.config["QUESTION_POOL_LOW_WATERMARK"]:
+        bucket.low_since = now
+
+    pool_hits.inc(len(taken))
+    pool_misses.inc(num_questions - len(taken))
+    return taken
+
+
+def refill_bucket(bucket):
+    # Completa o balde até o nível máximo, gerando em lote
+    depth = _available(bucket.key)
+    missing = current_app.config["QUESTION_POOL_HIGH_WATERMARK"] - depth
+    added = 0
+    if missing > 0:
+        results, errors = generate_many(
+            bucket.subject, bucket.exam_type, bucket.topic, missing,
+            batch_size=current_app.config["AI_BATCH_SIZE"]
+        )
+        for e in errors:
+            current_app.logger.warning("Erro ao reabastecer o pool %s: %s", bucket.key, e)
+        added = len(persist_generated(
+            None, bucket.subject, bucket.exam_type, bucket.topic, results,
+            difficulty=bucket.difficulty, pool_key=bucket.key
+        ))
+    else:
+        errors = []
+
+    now = datetime.utcnow()
+    if depth + added >= current_app.config["QUESTION_POOL_LOW_WATERMARK"]:
+        if bucket.low_since:
+            bucket.last_refill_lag = (now - bucket.low_since).total_seconds()
+        bucket.low_since = None
+    elif not errors:
+        # A geração funcionou, mas a deduplicação descartou as repetidas: o
+        # balde só volta à fila no próximo pedido, e não a cada passada
+        bucket.low_since = None
+    bucket.last_refilled_at = now
+    db.session.commit()
+    return added
+
+
+def buckets_to_refill():
+    return QuestionPoolBucket.query.filter(QuestionPoolBucket.low_since.isnot(None)) \
+        .order_by(QuestionPoolBucket.low_since.asc()).all()
+
+
+def prune_buckets():
+    # Remove os baldes sem pedidos dentro do TTL (menos os da lista); o
+    # estoque que sobrou volta ao banco de questões em vez de ser descartado
+    cutoff = datetime.utcnow() - timedelta(seconds=current_app.config["QUESTION_POOL_BUCKET_TTL"])
+    stale = QuestionPoolBucket.query.filter(or_(
+        QuestionPoolBucket.last_hit_at < cutoff, QuestionPoolBucket.last_hit_at.is_(None)
+    )).all()
+    removed = 0
+    for bucket in stale:
+        if _whitelisted(bucket.topic):
+            continue
+        # Pela sessão (e não em lote) para que o catálogo e a busca vejam as questões liberadas
+        for question in Question.query.filter_by(pool_key=bucket.key):
+            question.pool_key = None
+        db.session.delete(bucket)
+        removed += 1
+    db.session.commit()
+    return removed
+
+
+def stats():
+    depths = dict(
+        db.session.query(Question.pool_key, func.count(Question.id))
+        .filter(Question.pool_key.isnot(None)).group_by(Question.pool_key).all()
+    )
+    hits, misses = pool_hits.total(), pool_misses.total()
+    now = datetime.utcnow()
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": hits / (hits + misses) if hits + misses else None,
+        "buckets": [{
+            "subject": b.subject,
+            "exam_type": b.exam_type,
+            "difficulty": b.difficulty,
+            "topic": b.topic,
+            "available": depths.get(b.key, 0),
+            "hits": b.hits,
+            "pending_refill_seconds": (now - b.low_since).total_seconds() if b.low_since else 0,
+            "last_refill_lag_seconds": b.last_refill_lag,
+        } for b in QuestionPoolBucket.query.all()],
+    }
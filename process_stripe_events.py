@@ -0,0 +1,41 @@
+import argparse
+import time
+from .app import app, db
+from .models import StripeEvent
+from .stripe_events import drain
+
+def process_once():
+    with app.app_context():
+        started = time.perf_counter()
+        applied = drain(app.config["STRIPE_EVENTS_BATCH"], app.config["STRIPE_EVENTS_MAX_ATTEMPTS"])
+        if applied:
+            print(f"{applied} eventos do Stripe aplicados em {time.perf_counter() - started:.2f}s")
+
+def retry_failed():
+    # Devolve à fila os eventos que esgotaram as tentativas (depois de corrigida a causa)
+    with app.app_context():
+        reset = StripeEvent.query.filter(StripeEvent.processed_at.is_(None), StripeEvent.attempts >= app.config["STRIPE_EVENTS_MAX_ATTEMPTS"]) \
+            .update({"attempts": 0}, synchronize_session=False)
+        db.session.commit()
+        print(f"{reset} eventos do Stripe voltaram para a fila")
+
+def run_forever():
+    interval = app.config["STRIPE_EVENTS_POLL_INTERVAL"]
+    while True:
+        try:
+            process_once()
+        except Exception as e:
+            print(f"Erro ao processar eventos do Stripe: {str(e)}")
+        time.sleep(interval)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Aplica os eventos do Stripe gravados pelo webhook")
+    parser.add_argument("--once", action="store_true", help="Aplica os pendentes e sai")
+    parser.add_argument("--retry-failed", action="store_true", help="Recoloca na fila os eventos que esgotaram as tentativas")
+    args = parser.parse_args()
+    if args.retry_failed:
+        retry_failed()
+    if args.once:
+        process_once()
+    elif not args.retry_failed:
+        run_forever()
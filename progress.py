@@ -1,34 +1,137 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, make_response
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy import insert as sql_insert, select, tuple_
+from types import SimpleNamespace
 from .app import db
-from .models import UserProgress
-from datetime import datetime
+from .models import UserProgress, ProgressSummary
+from .progress_summary import WINDOW_DAYS, get_summary, calendar_entries, summary_body
 
 progress_bp = Blueprint("progress", __name__, url_prefix="/progress")
 
+def dialect_insert():
+    # insert() com suporte a ON CONFLICT no banco atual, ou None se não houver
+    dialect = db.engine.dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        return insert
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+        return insert
+    return None
+
+def locked_rows(model, key_columns, rows):
+    # Cria as linhas que faltam (rows traz os valores iniciais, uma por chave)
+    # e devolve todas travadas até o commit, como {chave: SimpleNamespace com as
+    # colunas}. Depois de alteradas, grave com db.session.execute(update(model), [vars(r) ...]).
+    insert = dialect_insert()
+    key_names = [column.key for column in key_columns]
+    if insert is not None:
+        # Um único statement: o DO UPDATE sem efeito trava a linha existente e
+        # o RETURNING a lê (executemany: compilar um VALUES com centenas de
+        # linhas custa mais que o próprio banco)
+        other = next(c for c in model.__table__.columns if not c.primary_key and c.key not in key_names)
+        stmt = insert(model).on_conflict_do_update(index_elements=key_columns, set_={other.key: getattr(model, other.key)})
+        stmt = stmt.returning(*model.__table__.columns)
+        result = db.session.execute(stmt, sorted(rows, key=lambda row: tuple(row[k] for k in key_names)))
+    else:
+        # Outros bancos: insere as que faltam e lê todas com lock
+        keys = [tuple(row[k] for k in key_names) for row in rows]
+        existing = {tuple(r) for r in db.session.query(*key_columns).filter(tuple_(*key_columns).in_(keys))}
+        missing = [row for row, key in zip(rows, keys) if key not in existing]
+        if missing:
+            db.session.execute(sql_insert(model), missing)
+        result = db.session.execute(
+            select(*model.__table__.columns).where(tuple_(*key_columns).in_(keys)).order_by(*key_columns).with_for_update()
+        )
+    return {tuple(getattr(row, k) for k in key_names): SimpleNamespace(**row._mapping) for row in result}
+
+def upsert_progress(rows):
+    # Soma contadores diários em um único INSERT ... ON CONFLICT DO UPDATE,
+    # sem ler a linha antes (atômico sob respostas concorrentes). Cada item de
+    # rows tem user_id, date, questions_answered e correct_answers, com no
+    # máximo um item por (user_id, date). O commit fica a cargo de quem chama.
+    if not rows:
+        return
+    insert = dialect_insert()
+    if insert is None:
+        # Outros bancos: leitura com lock seguida de escrita
+        for row in rows:
+            progress = UserProgress.query.filter_by(user_id=row["user_id"], date=row["date"]).with_for_update().first()
+            if not progress:
+                progress = UserProgress(user_id=row["user_id"], date=row["date"], questions_answered=0, correct_answers=0)
+                db.session.add(progress)
+            progress.questions_answered += row["questions_answered"]
+            progress.correct_answers += row["correct_answers"]
+        bump_summary_versions({row["user_id"] for row in rows})
+        return
+
+    stmt = insert(UserProgress).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[UserProgress.user_id, UserProgress.date],
+        set_={
+            "questions_answered": UserProgress.questions_answered + stmt.excluded.questions_answered,
+            "correct_answers": UserProgress.correct_answers + stmt.excluded.correct_answers,
+        }
+    )
+    db.session.execute(stmt)
+    bump_summary_versions({row["user_id"] for row in rows})
+
+def bump_summary_versions(user_ids):
+    # Marca o resumo de progresso como desatualizado (também atômico); ele é
+    # reconstruído na próxima leitura e o ETag antigo deixa de valer
+    insert = dialect_insert()
+    if insert is None:
+        for user_id in user_ids:
+            summary = db.session.get(ProgressSummary, user_id, with_for_update=True)
+            if not summary:
+                summary = ProgressSummary(user_id=user_id, version=0)
+                db.session.add(summary)
+            summary.version += 1
+        return
+    stmt = insert(ProgressSummary).values([{"user_id": user_id, "version": 1} for user_id in sorted(user_ids)])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[ProgressSummary.user_id],
+        set_={"version": ProgressSummary.version + 1}
+    )
+    db.session.execute(stmt)
+
+def _authorized_range(user_id):
+    # Retorna (dias, resposta de erro)
+    if int(get_jwt_identity()) != user_id:
+        return None, (jsonify({"msg": "Acesso não autorizado"}), 403)
+    days = request.args.get("days", WINDOW_DAYS, type=int)
+    if not days or days < 1 or days > WINDOW_DAYS:
+        return None, (jsonify({"msg": f"days deve estar entre 1 e {WINDOW_DAYS}"}), 400)
+    return days, None
+
+def _conditional(summary, days, build_body):
+    # O ETag muda a cada resposta registrada e a cada virada de dia
+    etag = f"{summary.user_id}-{summary.version}-{summary.start_date.isoformat()}-{days}"
+    if request.if_none_match.contains(etag):
+        response = make_response("", 304)
+    else:
+        response = make_response(jsonify(build_body()), 200)
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
 @progress_bp.route("/<int:user_id>", methods=["GET"])
 @jwt_required()
 def get_user_progress(user_id):
-    current_user_id = get_jwt_identity()
-    if current_user_id != user_id:
-        return jsonify({"msg": "Acesso não autorizado"}), 403
-
-    # Buscar progresso dos últimos 365 dias para o calendário
-    one_year_ago = datetime.utcnow() - timedelta(days=365)
-    progress_data = UserProgress.query.filter(
-        UserProgress.user_id == user_id,
-        UserProgress.date >= one_year_ago.date()
-    ).order_by(UserProgress.date.asc()).all()
-
-    result = []
-    for entry in progress_data:
-        result.append({
-            "date": entry.date.isoformat(),
-            "questions_answered": entry.questions_answered,
-            "correct_answers": entry.correct_answers,
-            "score_percentage": (entry.correct_answers / entry.questions_answered * 100) if entry.questions_answered > 0 else 0
-        })
-    return jsonify(result), 200
-
-from datetime import timedelta
+    days, error = _authorized_range(user_id)
+    if error:
+        return error
+
+    # Calendário dos últimos dias (365 por padrão) a partir do resumo compactado
+    summary = get_summary(user_id)
+    return _conditional(summary, days, lambda: calendar_entries(summary, days))
+
+@progress_bp.route("/<int:user_id>/summary", methods=["GET"])
+@jwt_required()
+def get_user_progress_summary(user_id):
+    days, error = _authorized_range(user_id)
+    if error:
+        return error
 
+    summary = get_summary(user_id)
+    return _conditional(summary, days, lambda: summary_body(summary, days))
@@ -0,0 +1,110 @@
+from array import array
+from datetime import datetime, timedelta
+from .app import db
+from .models import UserProgress, ProgressSummary
+
+WINDOW_DAYS = 365
+_MAX_COUNT = 0xFFFF
+
+
+def _unpack(summary):
+    counts = array("H")
+    counts.frombytes(summary.days)
+    return counts
+
+
+def rebuild(summary, today):
+    # Uma única consulta por intervalo em UserProgress; o resultado fica
+    # empacotado em 4 bytes por dia
+    start = today - timedelta(days=WINDOW_DAYS - 1)
+    version = summary.version
+    counts = array("H", bytes(4 * WINDOW_DAYS))
+    rows = db.session.query(UserProgress.date, UserProgress.questions_answered, UserProgress.correct_answers).filter(
+        UserProgress.user_id == summary.user_id,
+        UserProgress.date >= start,
+        UserProgress.date <= today
+    )
+    for day, answered, correct in rows:
+        i = 2 * (day - start).days
+        counts[i] = min(answered or 0, _MAX_COUNT)
+        counts[i + 1] = min(correct or 0, _MAX_COUNT)
+
+    answered = counts[0::2]
+    longest = run = 0
+    for n in answered:
+        run = run + 1 if n else 0
+        longest = max(longest, run)
+    # A sequência atual não é quebrada por hoje ainda não ter respostas
+    current = 0
+    for n in reversed(answered[:-1] if not answered[-1] else answered):
+        if not n:
+            break
+        current += 1
+
+    summary.start_date = start
+    summary.days = counts.tobytes()
+    summary.total_answered = sum(answered)
+    summary.total_correct = sum(counts[1::2])
+    summary.active_days = sum(1 for n in answered if n)
+    summary.current_streak = current
+    summary.longest_streak = longest
+    summary.built_version = version
+
+
+def get_summary(user_id):
+    today = datetime.now().date()
+    summary = db.session.get(ProgressSummary, user_id)
+    if summary is None:
+        summary = ProgressSummary(user_id=user_id, version=0)
+        db.session.add(summary)
+    if summary.built_version != summary.version or summary.start_date != today - timedelta(days=WINDOW_DAYS - 1):
+        rebuild(summary, today)
+        db.session.commit()
+    return summary
+
+
+def _days(summary, days):
+    counts = _unpack(summary)
+    first = WINDOW_DAYS - days
+    for i in range(first, WINDOW_DAYS):
+        yield summary.start_date + timedelta(days=i), counts[2 * i], counts[2 * i + 1]
+
+
+def calendar_entries(summary, days):
+    # Mesmo formato de antes: só os dias com atividade, em ordem
+    return [{
+        "date": day.isoformat(),
+        "questions_answered": answered,
+        "correct_answers": correct,
+        "score_percentage": (correct / answered * 100) if answered > 0 else 0
+    } for day, answered, correct in _days(summary, days) if answered]
+
+
+def summary_body(summary, days):
+    weeks = {}
+    answered_in_range = correct_in_range = 0
+    for day, answered, correct in _days(summary, days):
+        answered_in_range += answered
+        correct_in_range += correct
+        week_start = day - timedelta(days=day.weekday())
+        week = weeks.setdefault(week_start, [0, 0])
+        week[0] += answered
+        week[1] += correct
+    return {
+        "days": days,
+        "questions_answered": answered_in_range,
+        "correct_answers": correct_in_range,
+        "score_percentage": (correct_in_range / answered_in_range * 100) if answered_in_range else 0,
+        "year": {
+            "questions_answered": summary.total_answered,
+            "correct_answers": summary.total_correct,
+            "active_days": summary.active_days,
+        },
+        "current_streak": summary.current_streak,
+        "longest_streak": summary.longest_streak,
+        "weeks": [{
+            "week_start": week_start.isoformat(),
+            "questions_answered": answered,
+            "correct_answers": correct,
+        } for week_start, (answered, correct) in sorted(weeks.items())],
+    }
@@ -0,0 +1,164 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask import request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from .metrics import counter, histogram
+import logging
+import time
+
+# Instrumentação das queries: os eventos do SQLAlchemy medem cada statement e
+# somam no contexto da requisição atual (ContextVar, então vale também para as
+# threads do asyncio.to_thread no modo ASGI). Ao fim da requisição, o número de
+# queries e o tempo de banco vão para histogramas por endpoint.
+
+queries_per_request = histogram(
+    "db_queries_per_request", "Queries por requisição",
+    buckets=(0, 1, 2, 3, 4, 5, 7, 10, 15, 20, 30, 50, 100),
+)
+db_time_per_request = histogram("db_time_per_request_seconds", "Tempo de banco por requisição")
+slow_queries = counter("db_slow_queries_total", "Statements acima de QUERY_SLOW_MS")
+commit_duration = histogram("db_commit_duration_seconds", "Duração dos commits (flush pendente + COMMIT)")
+nplus1_requests = counter("db_nplus1_requests_total", "Requisições com o mesmo statement repetido (N+1)")
+
+_current = ContextVar("query_stats", default=None)
+_slow_seconds = 0.1
+_nplus1_threshold = 10
+_logger = logging.getLogger(__name__)
+
+
+class RequestStats:
+    __slots__ = ("endpoint", "queries", "db_time", "statements")
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.queries = 0
+        self.db_time = 0.0
+        # statement -> execuções; os statements do SQLAlchemy já vêm parametrizados,
+        # então um lazy load em laço repete o mesmo texto
+        self.statements = {}
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # O início fica no ExecutionContext (mais barato que a pilha em conn.info,
+    # usada só quando não há contexto)
+    if context is not None:
+        context._query_started = time.perf_counter()
+    else:
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - (context._query_started if context is not None else conn.info["query_started"].pop())
+    stats = _current.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_time += elapsed
+        statements = stats.statements
+        statements[statement] = statements.get(statement, 0) + 1
+    if elapsed >= _slow_seconds:
+        endpoint = stats.endpoint if stats is not None else "none"
+        slow_queries.inc(endpoint=endpoint)
+        _logger.warning("Query lenta (%.0f ms) em %s: %s", elapsed * 1000, endpoint, " ".join(statement.split())[:300])
+
+
+def _handle_error(exception_context):
+    # O after_cursor_execute não roda quando o statement falha
+    if exception_context.execution_context is None and exception_context.connection is not None:
+        started = exception_context.connection.info.get("query_started")
+        if started:
+            started.pop()
+
+
+def _before_commit(session):
+    session.info["commit_started"] = time.perf_counter()
+
+
+def _after_commit(session):
+    started = session.info.pop("commit_started", None)
+    if started is not None:
+        commit_duration.observe(time.perf_counter() - started)
+
+
+def begin(endpoint):
+    stats = RequestStats(endpoint)
+    _current.set(stats)
+    return stats
+
+
+def finish():
+    stats = _current.get()
+    if stats is None:
+        return None
+    _current.set(None)
+    queries_per_request.observe(stats.queries, endpoint=stats.endpoint)
+    db_time_per_request.observe(stats.db_time, endpoint=stats.endpoint)
+    if stats.statements:
+        statement, repeats = max(stats.statements.items(), key=lambda item: item[1])
+        if repeats >= _nplus1_threshold:
+            nplus1_requests.inc(endpoint=stats.endpoint)
+            _logger.warning("Possível N+1 em %s: %dx %s", stats.endpoint, repeats, " ".join(statement.split())[:300])
+    return stats
+
+
+@contextmanager
+def track(endpoint):
+    # Para código fora das requisições do Flask (rotas ASGI, workers)
+    begin(endpoint)
+    try:
+        yield
+    finally:
+        finish()
+
+
+def summary():
+    # {endpoint: {"requests", "queries_mean", "queries_p50", ...}}; os
+    # percentis são limites de faixa dos histogramas
+    result = {}
+    for labels, _, total, count in queries_per_request.samples():
+        endpoint = labels["endpoint"]
+        result[endpoint] = {
+            "requests": count,
+            "queries_mean": round(total / count, 2) if count else 0,
+            "queries_p50": queries_per_request.quantile(0.5, endpoint=endpoint),
+            "queries_p99": queries_per_request.quantile(0.99, endpoint=endpoint),
+            "db_time_p50_s": db_time_per_request.quantile(0.5, endpoint=endpoint),
+            "db_time_p99_s": db_time_per_request.quantile(0.99, endpoint=endpoint),
+        }
+    return result
+
+
+def init_app(app):
+    global _slow_seconds, _nplus1_threshold, _logger
+    if not app.config["QUERY_STATS_ENABLED"]:
+        return
+    # Os eventos de cursor também disparam fora do contexto do app (threads, CLIs)
+    _logger = app.logger
+    _slow_seconds = app.config["QUERY_SLOW_MS"] / 1000
+    _nplus1_threshold = app.config["QUERY_NPLUS1_THRESHOLD"]
+    timing_header = app.config["QUERY_TIMING_HEADER"]
+
+    # Eventos na classe Engine: valem para todos os engines do processo
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(Engine, "handle_error", _handle_error)
+        event.listen(Session, "before_commit", _before_commit)
+        event.listen(Session, "after_commit", _after_commit)
+
+    @app.before_request
+    def begin_request_stats():
+        begin(request.endpoint or "unmatched")
+
+    if timing_header:
+        @app.after_request
+        def add_timing_header(response):
+            stats = _current.get()
+            if stats is not None:
+                response.headers["Server-Timing"] = f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries"'
+            return response
+
+    @app.teardown_request
+    def finish_request_stats(exception=None):
+        finish()
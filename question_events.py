@@ -0,0 +1,91 @@
+from collections import namedtuple
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+from .models import Question
+
+# Mudanças em Question para os caches do processo (catálogo e baldes de
+# sorteio). São coletadas no flush, mas só repassadas depois do commit:
+# avisados no flush, os caches poderiam recarregar a versão antiga ainda
+# confirmada no banco e guardá-la. Quem escuta recebe (mudanças, committed);
+# committed=False quando a transação terminou sem commit (a versão em cache
+# pode ter vindo do flush desfeito). Mudanças feitas dentro de um savepoint
+# desfeito continuam na lista e são repassadas no commit da transação.
+#
+# Cada mudança é (kind, id, before, after, old_text, text), com kind
+# "insert", "update" ou "delete", before/after = QuestionKey ou None e o
+# enunciado antes e depois (None onde não se aplica). Inserts em lote pelo
+# Core (import_questions.py) não passam pelo flush e não são vistos aqui.
+
+QuestionChange = namedtuple("QuestionChange", ["kind", "id", "before", "after", "old_text", "text"])
+QuestionKey = namedtuple("QuestionKey", ["subject", "exam_type", "difficulty", "pool_key"])
+
+_listeners = []
+_INFO_KEY = "question_changes"
+
+
+def on_questions_committed(listener):
+    _listeners.append(listener)
+    return listener
+
+
+def _load_previous(target, value, oldvalue, initiator):
+    return value
+
+
+# Carrega o valor anterior ao alterar um atributo ainda não lido (ex.: depois
+# do commit), para que o histórico traga o balde e o enunciado de origem
+for _name in QuestionKey._fields + ("text",):
+    event.listen(getattr(Question, _name), "set", _load_previous, active_history=True, retval=True)
+
+
+def _value(question, name, previous=False):
+    history = inspect(question).attrs[name].history
+    return history.deleted[0] if previous and history.deleted else getattr(question, name)
+
+
+def _key(question, previous=False):
+    return QuestionKey(*(_value(question, name, previous) for name in QuestionKey._fields))
+
+
+@event.listens_for(Session, "after_flush")
+def _collect(session, flush_context):
+    # new/dirty/deleted e o histórico dos atributos ainda são os de antes do flush
+    changes = None
+    for kind, objects in (("insert", session.new), ("update", session.dirty), ("delete", session.deleted)):
+        for obj in objects:
+            if not isinstance(obj, Question) or (kind == "update" and not session.is_modified(obj)):
+                continue
+            if changes is None:
+                changes = session.info.setdefault(_INFO_KEY, [])
+            changes.append(QuestionChange(
+                kind, obj.id,
+                None if kind == "insert" else _key(obj, previous=True),
+                None if kind == "delete" else _key(obj),
+                None if kind == "insert" else _value(obj, "text", previous=True),
+                None if kind == "delete" else obj.text,
+            ))
+
+
+def _notify(changes, committed):
+    for listener in _listeners:
+        listener(changes, committed)
+
+
+@event.listens_for(Session, "after_commit")
+def _committed(session):
+    # Também chamado ao liberar um savepoint; aí a transação principal
+    # continua aberta e as mudanças esperam o commit dela
+    if session.in_nested_transaction():
+        return
+    changes = session.info.pop(_INFO_KEY, None)
+    if changes:
+        _notify(changes, True)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _ended(session, transaction):
+    # Fim da transação principal sem commit (rollback ou close)
+    if transaction.parent is None:
+        changes = session.info.pop(_INFO_KEY, None)
+        if changes:
+            _notify(changes, False)
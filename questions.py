@@ -1,18 +1,25 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from .app import db
-from .models import Question, User, UserProgress
+from .models import Question
+from .generation import generate_many, persist_generated
+from .llm import CircuitOpenError
+from .ratelimit import RateLimitError, enforce
+from .answers import record_answer
+from .catalog import get_question_record, get_question_records
+from .selection import get_engine
+from .search import search_questions
+from .adaptive import question_ratings, target_rating, user_ability
+from .reviews import due_cards, next_due_at
+from .authz import subscription_required
+from . import pool
 
 questions_bp = Blueprint("questions", __name__, url_prefix="/questions")
 
 @questions_bp.route("/generate", methods=["POST"])
-@jwt_required()
+@subscription_required("Assinatura necessária para gerar questões")
 def generate_questions():
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-
-    if not user or not user.is_subscribed:
-        return jsonify({"msg": "Assinatura necessária para gerar questões"}), 403
+    current_user_id = int(get_jwt_identity())
 
     data = request.get_json()
     subject = data.get("subject")
@@ -21,71 +28,128 @@ def generate_questions():
 
     if not subject or not exam_type:
         return jsonify({"msg": "Assunto e tipo de prova são obrigatórios"}), 400
+    max_questions = current_app.config["QUESTIONS_MAX_PER_REQUEST"]
+    if not isinstance(num_questions, int) or not 1 <= num_questions <= max_questions:
+        return jsonify({"msg": f"num_questions deve ser um inteiro entre 1 e {max_questions}"}), 400
 
     # Se o usuário especificou um prompt para IA, usar a IA para gerar
     prompt_ia = data.get("prompt_ia")
     if prompt_ia:
-        from .ai import client as openai_client # Importar o cliente OpenAI
-        from .models import AIInteraction # Importar o modelo AIInteraction
-        import json
-
-        generated_questions = []
-        for _ in range(num_questions):
-            try:
-                response = openai_client.chat.completions.create(
-                    model="gpt-4.1-mini", # Ou outro modelo adequado
-                    messages=[
-                        {"role": "system", "content": f"Você é um especialista em {subject} para {exam_type} e cria questões de múltipla escolha. Formate a saída como um objeto JSON com as chaves 'question_text', 'options' (uma lista de strings) e 'correct_answer' (uma string que corresponde a uma das opções)."},
-                        {"role": "user", "content": f"Crie uma questão de múltipla escolha sobre {prompt_ia}."}
-                    ],
-                    response_format={ "type": "json_object" }
-                )
-                ia_response_content = response.choices[0].message.content
-                generated_question_data = json.loads(ia_response_content)
-
-                new_question = Question(
-                    text=generated_question_data["question_text"],
-                    options=generated_question_data["options"],
-                    correct_answer=generated_question_data["correct_answer"],
-                    subject=subject,
-                    exam_type=exam_type,
-                    difficulty="dynamic",
-                    created_by_ia=True
-                )
-                db.session.add(new_question)
-                generated_questions.append(new_question)
-
-                ai_interaction = AIInteraction(
-                    user_id=current_user_id,
-                    interaction_type="question_generation",
-                    prompt=prompt_ia,
-                    response=ia_response_content
-                )
-                db.session.add(ai_interaction)
-
-            except Exception as e:
-                # Logar o erro ou retornar uma mensagem de erro específica
-                print(f"Erro ao gerar questão com IA: {str(e)}")
-                continue # Tentar gerar a próxima questão
+        # Cada questão pedida gasta uma ficha do limite de geração do usuário
+        try:
+            enforce(current_user_id, "generate", cost=num_questions)
+        except RateLimitError as e:
+            return jsonify({"msg": str(e)}), 429, {"Retry-After": str(e.retry_after)}
+        difficulty = data.get("difficulty", "dynamic")
+        # Primeiro retiramos questões já prontas do pool; só o que faltar é gerado na hora
+        questions = []
+        if current_app.config["QUESTION_POOL_ENABLED"]:
+            questions = pool.take(subject, exam_type, difficulty, prompt_ia, num_questions)
+
+        missing = num_questions - len(questions)
+        if missing > 0:
+            # Modo em lote: várias questões por chamada, economizando o prompt de sistema repetido
+            batch_size = current_app.config["AI_BATCH_SIZE"] if data.get("batch") else 1
+            results, errors = generate_many(subject, exam_type, prompt_ia, missing, batch_size=batch_size)
+            for e in errors:
+                # As questões geradas com sucesso são mantidas; as falhas já
+                # entram em ai_generation_errors_total
+                current_app.logger.warning("Erro ao gerar questão com IA: %s", e)
+            unavailable = next((e for e in errors if isinstance(e, CircuitOpenError)), None)
+            if not questions and not results and unavailable is not None:
+                # OpenAI degradada e nada no pool: falha na hora em vez de devolver uma lista vazia
+                return jsonify({"msg": str(unavailable)}), 503, {"Retry-After": str(unavailable.retry_after)}
+            questions += persist_generated(current_user_id, subject, exam_type, prompt_ia, results, difficulty=difficulty)
 
         db.session.commit()
-        return jsonify([{"id": q.id, "text": q.text, "options": q.options} for q in generated_questions]), 200
-
-    # Caso contrário, buscar questões existentes no banco de dados
-    existing_questions = Question.query.filter_by(subject=subject, exam_type=exam_type).limit(num_questions).all()
+        return jsonify([{"id": q.id, "text": q.text, "options": q.options} for q in questions]), 200
+
+    # Caso contrário, sortear questões existentes que o usuário ainda não viu;
+    # no modo adaptativo, as de dificuldade próxima da habilidade do usuário no assunto
+    if data.get("adaptive"):
+        target = target_rating(user_ability(current_user_id, subject), current_app.config["ADAPTIVE_TARGET_SUCCESS"])
+        question_ids = get_engine().sample_near(
+            current_user_id, subject, exam_type, num_questions, target,
+            lambda ids: question_ratings(get_question_records(ids)),
+            candidates=current_app.config["ADAPTIVE_CANDIDATES"]
+        )
+    else:
+        question_ids = get_engine().sample(current_user_id, subject, exam_type, data.get("difficulty"), num_questions)
+    existing_questions = get_question_records(question_ids)
     if not existing_questions:
         return jsonify({"msg": "Nenhuma questão encontrada para os critérios especificados."}), 404
 
-    return jsonify([{"id": q.id, "text": q.text, "options": q.options} for q in existing_questions]), 200
+    return jsonify([{"id": q.id, "text": q.text, "options": list(q.options)} for q in existing_questions]), 200
+
+@questions_bp.route("/search", methods=["GET"])
+@jwt_required()
+def search():
+    q = request.args.get("q", "").strip()
+    if not q:
+        return jsonify({"msg": "Parâmetro q é obrigatório"}), 400
+    limit = min(max(request.args.get("limit", 20, type=int), 1), 100)
+
+    hits, next_cursor = search_questions(
+        q,
+        subject=request.args.get("subject"),
+        exam_type=request.args.get("exam_type"),
+        limit=limit,
+        cursor=request.args.get("cursor")
+    )
+    records = {r.id: r for r in get_question_records([question_id for question_id, _ in hits])}
+    return jsonify({
+        "results": [{
+            "id": question_id,
+            "text": records[question_id].text,
+            "options": list(records[question_id].options),
+            "subject": records[question_id].subject,
+            "exam_type": records[question_id].exam_type,
+            "difficulty": records[question_id].difficulty,
+            "score": score
+        } for question_id, score in hits if question_id in records],
+        "next_cursor": next_cursor
+    }), 200
+
+@questions_bp.route("/review", methods=["GET"])
+@jwt_required()
+def review_queue():
+    # Questões já respondidas cuja revisão venceu, das mais atrasadas para as mais recentes
+    current_user_id = int(get_jwt_identity())
+    limit = min(max(request.args.get("limit", 20, type=int), 1), 100)
+    now = datetime.utcnow()
+
+    cards = due_cards(current_user_id, now, limit)
+    records = {r.id: r for r in get_question_records([card.question_id for card in cards])}
+    upcoming = next_due_at(current_user_id, now) if len(cards) < limit else None
+    return jsonify({
+        "cards": [{
+            "id": card.question_id,
+            "text": records[card.question_id].text,
+            "options": list(records[card.question_id].options),
+            "subject": records[card.question_id].subject,
+            "exam_type": records[card.question_id].exam_type,
+            "due_at": card.due_at.isoformat(),
+            "interval_days": card.interval_days,
+            "repetitions": card.repetitions,
+            "lapses": card.lapses
+        } for card in cards if card.question_id in records],
+        "next_due_at": upcoming.isoformat() if upcoming else None
+    }), 200
+
+@questions_bp.route("/pool/stats", methods=["GET"])
+@jwt_required()
+def question_pool_stats():
+    return jsonify(pool.stats()), 200
 
 @questions_bp.route("/<int:question_id>/answer", methods=["POST"])
 @jwt_required()
 def answer_question(question_id):
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    question = Question.query.get(question_id)
+    # A identidade do JWT já foi validada; não recarregamos o usuário
+    current_user_id = int(get_jwt_identity())
+    # O gabarito vem do catálogo em memória, sem consultar a questão no banco
+    question = get_question_record(question_id)
 
-    if not user or not question:
+    if not question:
         return jsonify({"msg": "Usuário ou questão não encontrada"}), 404
 
     data = request.get_json()
@@ -93,32 +157,24 @@ def answer_question(question_id):
 
     is_correct = (user_answer == question.correct_answer)
 
-    # Atualizar progresso do usuário
-    today = datetime.now().date()
-    user_progress = UserProgress.query.filter_by(user_id=current_user_id, date=today).first()
-
-    if not user_progress:
-        user_progress = UserProgress(user_id=current_user_id, date=today)
-        db.session.add(user_progress)
-
-    user_progress.questions_answered += 1
-    if is_correct:
-        user_progress.correct_answers += 1
-
-    db.session.commit()
+    # Atualizar progresso do usuário (upsert atômico) e registrar a resposta;
+    # no modo write-behind a gravação fica para a thread de flush
+    if record_answer(current_user_id, question, is_correct):
+        db.session.commit()
+    get_engine().mark_seen(current_user_id, [question_id])
 
     return jsonify({"is_correct": is_correct, "correct_answer": question.correct_answer}), 200
 
 @questions_bp.route("/<int:question_id>", methods=["GET"])
 @jwt_required()
 def get_question(question_id):
-    question = Question.query.get(question_id)
+    question = get_question_record(question_id)
     if not question:
         return jsonify({"msg": "Questão não encontrada"}), 404
     return jsonify({
         "id": question.id,
         "text": question.text,
-        "options": question.options,
+        "options": list(question.options),
         "subject": question.subject,
         "exam_type": question.exam_type,
         "difficulty": question.difficulty
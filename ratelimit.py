@@ -0,0 +1,207 @@
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import event, func
+from .app import db
+from .models import AIInteraction
+from .metrics import counter
+import sqlite3
+import threading
+import time
+
+rate_limited = counter("rate_limited_total", "Requisições recusadas com 429, por limite (rota ou cota diária de tokens)")
+
+
+class RateLimitError(Exception):
+    def __init__(self, retry_after, msg="Muitas requisições, tente novamente em instantes"):
+        super().__init__(msg)
+        self.retry_after = retry_after
+
+
+def parse_rate(value):
+    # "20/60" -> 20 requisições a cada 60 segundos: balde de 20 fichas que se
+    # recompõe a 20/60 fichas por segundo. Vazio ou "0" desliga o limite
+    if not value or value.strip() == "0":
+        return None
+    count, _, seconds = value.partition("/")
+    return float(count), float(count) / float(seconds or 1)
+
+
+def _today():
+    return datetime.utcnow().date()
+
+
+def _seconds_until_tomorrow():
+    now = datetime.utcnow()
+    tomorrow = datetime.combine(now.date() + timedelta(days=1), datetime.min.time())
+    return max(1, int((tomorrow - now).total_seconds()) + 1)
+
+
+def tokens_used_today(user_id):
+    # Soma de AIInteraction do dia (UTC); só é consultada quando o contador
+    # do usuário não está no backend, não a cada requisição
+    start = datetime.combine(_today(), datetime.min.time())
+    used = db.session.query(func.coalesce(func.sum(
+        func.coalesce(AIInteraction.prompt_tokens, 0) + func.coalesce(AIInteraction.completion_tokens, 0)
+    ), 0)).filter(AIInteraction.user_id == user_id, AIInteraction.timestamp >= start).scalar()
+    return int(used)
+
+
+class MemoryBackend:
+    """Baldes e contadores no processo: cada worker do gunicorn limita por conta própria."""
+
+    def __init__(self, quota_sync_interval, max_keys=100000):
+        self.quota_sync_interval = quota_sync_interval
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._usage = {}
+        self._day = None
+        self._lock = threading.Lock()
+
+    def take(self, key, capacity, rate, cost=1):
+        # Retorna 0 se as fichas foram retiradas, ou os segundos até haver fichas suficientes
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            if tokens < cost:
+                self._buckets[key] = (tokens, now)
+                return (cost - tokens) / rate
+            self._buckets[key] = (tokens - cost, now)
+            if len(self._buckets) > self.max_keys:
+                self._evict(now)
+            return 0
+
+    def _evict(self, now):
+        # Descarta os baldes parados há mais de uma hora (já cheios em limites
+        # de até uma hora, equivalem a um balde novo) e, se não bastar, os mais antigos
+        full = [key for key, (tokens, updated) in self._buckets.items() if now - updated > 3600]
+        for key in full or list(self._buckets)[:len(self._buckets) // 10]:
+            del self._buckets[key]
+
+    def usage(self, user_id, day, load):
+        # Tokens usados no dia; relidos do banco a cada quota_sync_interval
+        # segundos para incluir o consumo registrado pelos outros workers
+        now = time.monotonic()
+        entry = self._usage.get(user_id) if day == self._day else None
+        if entry is None or now - entry[1] > self.quota_sync_interval:
+            entry = (load(), now)
+            with self._lock:
+                if day != self._day:
+                    self._usage, self._day = {}, day # Contadores de dias anteriores
+                self._usage[user_id] = entry
+        return entry[0]
+
+    def add_usage(self, user_id, day, amount):
+        with self._lock:
+            entry = self._usage.get(user_id) if day == self._day else None
+            if entry is not None:
+                self._usage[user_id] = (entry[0] + amount, entry[1])
+
+
+class SQLiteBackend:
+    """Arquivo SQLite local, compartilhado entre os workers da mesma máquina.
+
+    Mesma interface do MemoryBackend; um Redis pode ser usado do mesmo modo
+    implementando take/usage/add_usage.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._day = None
+        self._local = threading.local()
+        conn = self._connect()
+        conn.execute("CREATE TABLE IF NOT EXISTS rate_bucket (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)")
+        conn.execute("CREATE TABLE IF NOT EXISTS token_usage (user_id INTEGER NOT NULL, day TEXT NOT NULL, used INTEGER NOT NULL, PRIMARY KEY (user_id, day))")
+
+    def _connect(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def take(self, key, capacity, rate, cost=1):
+        # Um único UPSERT atômico: recompõe o balde e retira as fichas só se
+        # houver o suficiente (sem RETURNING, o pedido foi recusado)
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute(
+            "INSERT INTO rate_bucket (key, tokens, updated) VALUES (:key, :capacity - :cost, :now) "
+            "ON CONFLICT(key) DO UPDATE SET tokens = min(:capacity, tokens + (:now - updated) * :rate) - :cost, updated = :now "
+            "WHERE min(:capacity, tokens + (:now - updated) * :rate) >= :cost RETURNING tokens",
+            {"key": key, "capacity": capacity, "rate": rate, "cost": cost, "now": now}
+        ).fetchone()
+        if row is not None:
+            return 0
+        tokens, updated = conn.execute("SELECT tokens, updated FROM rate_bucket WHERE key = ?", (key,)).fetchone()
+        return (cost - min(capacity, tokens + (now - updated) * rate)) / rate
+
+    def usage(self, user_id, day, load):
+        # O banco só é lido quando o contador do dia ainda não existe; a partir
+        # daí todos os workers somam no mesmo contador
+        conn = self._connect()
+        day = day.isoformat()
+        row = conn.execute("SELECT used FROM token_usage WHERE user_id = ? AND day = ?", (user_id, day)).fetchone()
+        if row is not None:
+            return row[0]
+        if day != self._day:
+            conn.execute("DELETE FROM token_usage WHERE day < ?", (day,))
+            self._day = day
+        used = load()
+        return conn.execute(
+            "INSERT INTO token_usage (user_id, day, used) VALUES (?, ?, ?) "
+            "ON CONFLICT(user_id, day) DO UPDATE SET used = used RETURNING used",
+            (user_id, day, used)
+        ).fetchone()[0]
+
+    def add_usage(self, user_id, day, amount):
+        # Sem a linha do dia, o próximo usage() lê do banco o total já com este consumo
+        self._connect().execute("UPDATE token_usage SET used = used + ? WHERE user_id = ? AND day = ?", (amount, user_id, day.isoformat()))
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                config = current_app.config
+                if config["RATE_LIMIT_BACKEND"] == "sqlite":
+                    _backend = SQLiteBackend(config["RATE_LIMIT_PATH"])
+                else:
+                    _backend = MemoryBackend(config["AI_QUOTA_SYNC_INTERVAL"])
+    return _backend
+
+
+def enforce(user_id, limit, cost=1):
+    # Retira cost fichas do balde do usuário para o limite (RATE_LIMIT_<LIMIT>)
+    # e confere a cota diária de tokens da IA. Levanta RateLimitError com a
+    # espera sugerida; nenhuma consulta ao banco no caminho comum
+    config = current_app.config
+    if not config["RATE_LIMIT_ENABLED"]:
+        return
+    backend = get_backend()
+    quota = config["AI_DAILY_TOKEN_QUOTA"]
+    if quota and backend.usage(user_id, _today(), lambda: tokens_used_today(user_id)) >= quota:
+        rate_limited.inc(limit="quota")
+        raise RateLimitError(_seconds_until_tomorrow(), "Cota diária de uso da IA atingida")
+    rate = parse_rate(config[f"RATE_LIMIT_{limit.upper()}"])
+    if rate is not None:
+        capacity, refill = rate
+        wait = backend.take(f"{limit}:{user_id}", capacity, refill, min(cost, capacity))
+        if wait:
+            rate_limited.inc(limit=limit)
+            raise RateLimitError(max(1, int(wait) + 1))
+
+
+@event.listens_for(AIInteraction, "after_insert")
+def _charge_tokens(mapper, connection, target):
+    # Cada interação registrada soma os tokens ao contador do dia do usuário
+    used = (target.prompt_tokens or 0) + (target.completion_tokens or 0)
+    if used and target.user_id is not None and _backend is not None:
+        _backend.add_usage(target.user_id, _today(), used)
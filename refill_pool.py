@@ -0,0 +1,36 @@
+import argparse
+import time
+from .app import app, db
+from .pool import buckets_to_refill, prune_buckets, refill_bucket
+
+def refill_once():
+    with app.app_context():
+        removed = prune_buckets()
+        if removed:
+            print(f"{removed} baldes sem pedidos recentes removidos do pool")
+        for bucket in buckets_to_refill():
+            started = time.perf_counter()
+            try:
+                added = refill_bucket(bucket)
+            except Exception as e:
+                db.session.rollback()
+                print(f"Erro ao reabastecer o pool {bucket.key}: {str(e)}")
+                continue
+            print(f"Pool {bucket.subject}/{bucket.exam_type}/{bucket.difficulty} \"{bucket.topic}\": "
+                  f"+{added} questões em {time.perf_counter() - started:.1f}s "
+                  f"(atraso de reabastecimento: {bucket.last_refill_lag or 0:.1f}s)")
+
+def run_forever():
+    interval = app.config["QUESTION_POOL_REFILL_INTERVAL"]
+    while True:
+        refill_once()
+        time.sleep(interval)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reabastece o pool de questões pré-geradas por IA")
+    parser.add_argument("--once", action="store_true", help="Reabastece uma vez e sai")
+    args = parser.parse_args()
+    if args.once:
+        refill_once()
+    else:
+        run_forever()
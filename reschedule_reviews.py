@@ -0,0 +1,54 @@
+import argparse
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import func, update
+from .app import app, db
+from .models import ReviewCard
+
+
+def overloaded_users(now, daily_limit):
+    # Usuários com mais cartões vencidos do que conseguem revisar num dia
+    # (tipicamente quem volta depois de semanas sem estudar)
+    return [user_id for user_id, in db.session.query(ReviewCard.user_id)
+            .filter(ReviewCard.due_at <= now)
+            .group_by(ReviewCard.user_id)
+            .having(func.count(ReviewCard.id) > daily_limit)
+            .order_by(ReviewCard.user_id)]
+
+
+def spread_user(user_id, now, daily_limit):
+    # Mantém vencidos só daily_limit cartões e distribui os demais pelos dias
+    # seguintes, daily_limit por dia. Os mais urgentes (mais atrasados em
+    # relação ao próprio intervalo, ou seja, mais esquecidos) ficam primeiro.
+    cards = db.session.query(ReviewCard.id, ReviewCard.due_at, ReviewCard.interval_days) \
+        .filter(ReviewCard.user_id == user_id, ReviewCard.due_at <= now).all()
+    cards.sort(key=lambda card: -(now - card.due_at).total_seconds() / max(card.interval_days, 1.0))
+    changes = []
+    for position, card in enumerate(cards[daily_limit:], start=daily_limit):
+        changes.append({"id": card.id, "due_at": now + timedelta(days=position // daily_limit)})
+    if changes:
+        db.session.execute(update(ReviewCard), changes)
+    return len(changes)
+
+
+def reschedule(daily_limit, user_id=None):
+    now = datetime.utcnow()
+    user_ids = [user_id] if user_id else overloaded_users(now, daily_limit)
+    started = time.perf_counter()
+    moved = 0
+    for i, uid in enumerate(user_ids, start=1):
+        moved += spread_user(uid, now, daily_limit)
+        db.session.commit()
+        if i % 1000 == 0:
+            print(f"{i}/{len(user_ids)} usuários, {moved} cartões reagendados")
+    print(f"{len(user_ids)} usuários, {moved} cartões reagendados em {time.perf_counter() - started:.1f}s")
+    return moved
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Distribui revisões vencidas acumuladas pelos próximos dias")
+    parser.add_argument("--daily-limit", type=int, help="Revisões por dia (padrão: REVIEW_DAILY_LIMIT)")
+    parser.add_argument("--user", type=int, help="Reagenda só este usuário")
+    args = parser.parse_args()
+    with app.app_context():
+        reschedule(args.daily_limit or app.config["REVIEW_DAILY_LIMIT"], args.user)
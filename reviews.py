@@ -0,0 +1,70 @@
+from datetime import timedelta
+from sqlalchemy import func, update
+from .app import db
+from .models import ReviewCard
+from .progress import locked_rows
+
+# SM-2: acerto vale nota 4 e erro nota 1 (escala de 0 a 5). Erros zeram a
+# sequência e trazem a questão de volta no dia seguinte; acertos seguidos
+# espaçam a revisão em 1, 6 e depois intervalo anterior x facilidade, até
+# MAX_INTERVAL_DAYS. Acertos antes da data da revisão (prática extra) não
+# avançam o cartão; erros contam sempre.
+DEFAULT_EASE = 2.5
+MAX_INTERVAL_DAYS = 36500
+MIN_EASE = 1.3
+CORRECT_GRADE = 4
+WRONG_GRADE = 1
+
+
+def sm2(card, is_correct, now):
+    # Atualiza em O(1) um ReviewCard (ou objeto equivalente) após uma resposta
+    if is_correct and card.due_at > now:
+        card.last_reviewed_at = now
+        return
+    grade = CORRECT_GRADE if is_correct else WRONG_GRADE
+    card.ease = max(MIN_EASE, card.ease + 0.1 - (5 - grade) * (0.08 + (5 - grade) * 0.02))
+    if is_correct:
+        card.repetitions += 1
+        if card.repetitions == 1:
+            card.interval_days = 1.0
+        elif card.repetitions == 2:
+            card.interval_days = 6.0
+        else:
+            card.interval_days = min(MAX_INTERVAL_DAYS, round(card.interval_days * card.ease, 2))
+    else:
+        if card.repetitions:
+            card.lapses += 1
+        card.repetitions = 0
+        card.interval_days = 1.0
+    card.due_at = now + timedelta(days=card.interval_days)
+    card.last_reviewed_at = now
+
+
+def schedule_reviews(answers):
+    # Reagenda os cartões das respostas (em ordem), criando os que faltam.
+    # O commit fica a cargo de quem chama.
+    if not answers:
+        return
+    keys = sorted({(a.user_id, a.question_id) for a in answers})
+    first_seen = {}
+    for answer in answers:
+        first_seen.setdefault((answer.user_id, answer.question_id), answer.answered_at)
+    cards = locked_rows(ReviewCard, [ReviewCard.user_id, ReviewCard.question_id], [
+        {"user_id": user_id, "question_id": question_id, "repetitions": 0, "interval_days": 0.0,
+         "ease": DEFAULT_EASE, "lapses": 0, "due_at": first_seen[(user_id, question_id)]}
+        for user_id, question_id in keys
+    ])
+    for answer in answers:
+        sm2(cards[(answer.user_id, answer.question_id)], answer.is_correct, answer.answered_at)
+    db.session.execute(update(ReviewCard), [vars(card) for card in cards.values()])
+
+
+def due_cards(user_id, now, limit):
+    # Percorre o índice (user_id, due_at) a partir do início: O(log n + k)
+    return ReviewCard.query.filter(ReviewCard.user_id == user_id, ReviewCard.due_at <= now) \
+        .order_by(ReviewCard.due_at, ReviewCard.id).limit(limit).all()
+
+
+def next_due_at(user_id, now):
+    return db.session.query(func.min(ReviewCard.due_at)) \
+        .filter(ReviewCard.user_id == user_id, ReviewCard.due_at > now).scalar()
@@ -0,0 +1,206 @@
+from array import array
+from collections import defaultdict
+from flask import current_app
+from sqlalchemy import func, or_, and_
+from .app import db
+from .models import Question
+from .question_events import on_questions_committed
+from .textnorm import normalize_text, tokens
+import base64
+import heapq
+import json
+import math
+import threading
+import time
+
+PG_CONFIG = "portuguese"
+
+
+def encode_cursor(score, question_id):
+    return base64.urlsafe_b64encode(json.dumps([score, question_id]).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        score, question_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return float(score), int(question_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def pg_search(q, subject, exam_type, limit, after):
+    # Busca textual do Postgres (índice GIN sobre o tsvector em português),
+    # ordenada por relevância e paginada por (relevância, id)
+    document = func.to_tsvector(PG_CONFIG, Question.text)
+    query = func.websearch_to_tsquery(PG_CONFIG, q)
+    rank = func.ts_rank_cd(document, query)
+    stmt = db.session.query(Question.id, rank.label("score")).filter(document.op("@@")(query), Question.pool_key.is_(None))
+    if subject:
+        stmt = stmt.filter(Question.subject == subject)
+    if exam_type:
+        stmt = stmt.filter(Question.exam_type == exam_type)
+    if after:
+        stmt = stmt.filter(or_(rank < after[0], and_(rank == after[0], Question.id > after[1])))
+    return [(question_id, float(score)) for question_id, score in stmt.order_by(rank.desc(), Question.id.asc()).limit(limit)]
+
+
+class InvertedIndex:
+    """Índice invertido em memória com ranking BM25, usado quando o banco
+    não tem busca textual (SQLite, testes). Os termos são normalizados sem
+    acentos, como em normalize_text."""
+
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self):
+        self._postings = defaultdict(lambda: (array("I"), array("H")))
+        self._lengths = {} # id -> número de termos
+        self._filters = {} # id -> (assunto, prova)
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    def add(self, question_id, text, subject, exam_type):
+        terms = tokens(normalize_text(text))
+        frequencies = defaultdict(int)
+        for term in terms:
+            frequencies[term] += 1
+        with self._lock:
+            if question_id in self._lengths:
+                return
+            self._lengths[question_id] = len(terms)
+            self._filters[question_id] = (subject, exam_type)
+            self._total_length += len(terms)
+            for term, tf in frequencies.items():
+                ids, tfs = self._postings[term]
+                ids.append(question_id)
+                tfs.append(min(tf, 0xFFFF))
+
+    def remove(self, question_id, text):
+        # text é o enunciado indexado, de onde saem as listas a percorrer
+        with self._lock:
+            length = self._lengths.pop(question_id, None)
+            if length is None:
+                return
+            del self._filters[question_id]
+            self._total_length -= length
+            for term in set(tokens(normalize_text(text))):
+                postings = self._postings.get(term)
+                if postings is None:
+                    continue
+                ids, tfs = postings
+                try:
+                    position = ids.index(question_id)
+                except ValueError:
+                    continue
+                del ids[position]
+                del tfs[position]
+                if not ids:
+                    del self._postings[term]
+
+    def __contains__(self, question_id):
+        return question_id in self._lengths
+
+    def __len__(self):
+        return len(self._lengths)
+
+    def search(self, q, subject, exam_type, limit, after):
+        terms = set(tokens(normalize_text(q)))
+        with self._lock:
+            n = len(self._lengths)
+            if not n or not terms:
+                return []
+            lengths = self._lengths
+            k1, b = self.K1, self.B
+            norm = k1 * b / (self._total_length / n)
+            scores = {}
+            for term in terms:
+                if term not in self._postings:
+                    continue
+                ids, tfs = self._postings[term]
+                idf = math.log(1 + (n - len(ids) + 0.5) / (len(ids) + 0.5)) * (k1 + 1)
+                get = scores.get
+                for question_id, tf in zip(ids, tfs):
+                    scores[question_id] = get(question_id, 0.0) + idf * tf / (tf + k1 * (1 - b) + norm * lengths[question_id])
+            filters = self._filters
+
+        def accepted(hit):
+            question_id, score = hit
+            if subject or exam_type:
+                doc_subject, doc_exam_type = filters[question_id]
+                if subject and doc_subject != subject or exam_type and doc_exam_type != exam_type:
+                    return False
+            return not after or score < after[0] or score == after[0] and question_id > after[1]
+
+        hits = ((question_id, round(score, 6)) for question_id, score in scores.items())
+        return heapq.nsmallest(limit, filter(accepted, hits), key=lambda hit: (-hit[1], hit[0]))
+
+_index = None
+_index_lock = threading.Lock()
+_refresh_lock = threading.Lock()
+_refresh_at = 0.0
+_watermark = 0 # Maior id lido do banco
+
+
+def _load_rows(index, after_id):
+    global _watermark
+    rows = db.session.query(Question.id, Question.text, Question.subject, Question.exam_type) \
+        .filter(Question.pool_key.is_(None), Question.id > after_id).order_by(Question.id).yield_per(10000)
+    for row in rows:
+        index.add(*row)
+        _watermark = max(_watermark, row[0])
+
+
+def get_index():
+    # Carregado do banco no primeiro uso e mantido pelas mudanças confirmadas
+    # neste processo (question_events). A cada SEARCH_REFRESH_INTERVAL
+    # segundos lê as questões com id acima do último lido: inseridas por
+    # outros processos ou pelo import_questions, que grava pelo Core. Edições,
+    # exclusões e saídas do pool feitas em outro processo não são relidas
+    global _index, _refresh_at
+    interval = current_app.config["SEARCH_REFRESH_INTERVAL"]
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                index = InvertedIndex()
+                _load_rows(index, 0)
+                _refresh_at = time.monotonic() + interval
+                _index = index
+    elif _refresh_at < time.monotonic() and _refresh_lock.acquire(blocking=False):
+        # Uma releitura por vez; as demais buscas seguem com o índice atual
+        try:
+            _refresh_at = time.monotonic() + interval
+            _load_rows(_index, _watermark)
+        finally:
+            _refresh_lock.release()
+    return _index
+
+
+def search_questions(q, subject=None, exam_type=None, limit=20, cursor=None):
+    # Retorna ([(id, relevância)], próximo cursor ou None)
+    after = decode_cursor(cursor) if cursor else None
+    backend = current_app.config["SEARCH_BACKEND"]
+    if backend == "auto":
+        backend = "postgres" if db.engine.dialect.name == "postgresql" else "memory"
+    if backend == "postgres":
+        hits = pg_search(q, subject, exam_type, limit + 1, after)
+    else:
+        hits = get_index().search(q, subject, exam_type, limit + 1, after)
+    next_cursor = encode_cursor(*hits[limit - 1][::-1]) if len(hits) > limit else None
+    return hits[:limit], next_cursor
+
+
+@on_questions_committed
+def _index_questions(changes, committed):
+    # Questões ainda reservadas no pool de IA só entram quando saem dele
+    if _index is None:
+        return
+    for change in changes:
+        if change.kind != "insert" and change.id in _index:
+            _index.remove(change.id, change.old_text)
+        if not committed:
+            # O índice pode ter sido carregado com o flush desfeito
+            if change.kind == "insert" and change.id in _index:
+                _index.remove(change.id, change.text)
+            continue
+        if change.after is not None and change.after.pool_key is None:
+            _index.add(change.id, change.text, change.after.subject, change.after.exam_type)
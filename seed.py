@@ -1,32 +1,18 @@
-import json
-from app import app, db
-from models import Question
+import os
+from .app import app
+from .import_questions import import_files
 
-def load_questions_from_json(filepath):
-    with open(filepath, 'r', encoding='utf-8') as f:
-        questions_data = json.load(f)
-    return questions_data
+QUESTIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'initial_questions')
 
 def seed_questions():
+    # Importa as questões iniciais sem apagar as existentes (inclusive as
+    # geradas por IA); as já importadas são ignoradas pelo hash de conteúdo
     with app.app_context():
-        # Apagar questões existentes para evitar duplicatas
-        db.session.query(Question).delete()
-
-        # Carregar questões do ENEM
-        enem_questions = load_questions_from_json('initial_questions/enem.json')
-        for q_data in enem_questions:
-            new_question = Question(**q_data)
-            db.session.add(new_question)
-
-        # Carregar questões de Residência Médica
-        residencia_questions = load_questions_from_json('initial_questions/residencia_medica.json')
-        for q_data in residencia_questions:
-            new_question = Question(**q_data)
-            db.session.add(new_question)
-
-        db.session.commit()
+        import_files([
+            os.path.join(QUESTIONS_DIR, 'enem.json'),
+            os.path.join(QUESTIONS_DIR, 'residencia_medica.json'),
+        ])
         print("Banco de dados populado com questões iniciais!")
 
 if __name__ == "__main__":
     seed_questions()
-
@@ -0,0 +1,244 @@
+from array import array
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from flask import current_app
+from .app import db
+from .models import Question, AnswerEvent
+from .question_events import on_questions_committed
+import heapq
+import random
+import threading
+import time
+
+_rng = random.SystemRandom()
+
+
+class SeenSet:
+    """Conjunto compacto de ids no estilo roaring: os ids são divididos em
+    blocos de 2^16; blocos esparsos guardam um array ordenado de uint16 e
+    blocos densos viram um bitmap de 8 KB."""
+
+    DENSE_THRESHOLD = 4096
+
+    def __init__(self, ids=()):
+        self._chunks = {}
+        self._size = 0
+        for question_id in ids:
+            self.add(question_id)
+
+    def add(self, question_id):
+        high, low = question_id >> 16, question_id & 0xFFFF
+        chunk = self._chunks.get(high)
+        if chunk is None:
+            chunk = self._chunks[high] = array("H")
+        if isinstance(chunk, bytearray):
+            byte, bit = low >> 3, 1 << (low & 7)
+            if chunk[byte] & bit:
+                return
+            chunk[byte] |= bit
+        else:
+            i = bisect_left(chunk, low)
+            if i < len(chunk) and chunk[i] == low:
+                return
+            insort(chunk, low)
+            if len(chunk) > self.DENSE_THRESHOLD:
+                bitmap = bytearray(8192)
+                for value in chunk:
+                    bitmap[value >> 3] |= 1 << (value & 7)
+                self._chunks[high] = bitmap
+        self._size += 1
+
+    def __contains__(self, question_id):
+        chunk = self._chunks.get(question_id >> 16)
+        if chunk is None:
+            return False
+        low = question_id & 0xFFFF
+        if isinstance(chunk, bytearray):
+            return bool(chunk[low >> 3] & (1 << (low & 7)))
+        i = bisect_left(chunk, low)
+        return i < len(chunk) and chunk[i] == low
+
+    def __len__(self):
+        return self._size
+
+
+class SelectionEngine:
+    """Sorteia questões por (assunto, prova, dificuldade) a partir de arrays
+    de ids mantidos em memória, evitando as que o usuário já viu."""
+
+    def __init__(self, bucket_ttl, seen_ttl, max_users):
+        self.bucket_ttl = bucket_ttl
+        self.seen_ttl = seen_ttl
+        self.max_users = max_users
+        self._buckets = {}
+        self._loaders = {}
+        self._versions = {} # Incrementado a cada mudança aplicada ao balde
+        self._seen = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _bucket(self, subject, exam_type, difficulty):
+        key = (subject, exam_type, difficulty)
+        entry = self._buckets.get(key)
+        if entry is not None and entry[0] >= time.monotonic():
+            return entry[1]
+        with self._lock:
+            loader = self._loaders.setdefault(key, threading.Lock())
+        # Um carregamento por balde; com o balde vencido, quem não pegou o
+        # carregamento segue com a versão anterior
+        if not loader.acquire(blocking=entry is None):
+            return entry[1]
+        try:
+            entry = self._buckets.get(key)
+            if entry is not None and entry[0] >= time.monotonic():
+                return entry[1]
+            version = self._versions.get(key, 0)
+            # Questões ainda no pool de IA ficam de fora: estão reservadas
+            query = db.session.query(Question.id).filter(
+                Question.subject == subject,
+                Question.exam_type == exam_type,
+                Question.pool_key.is_(None)
+            )
+            if difficulty:
+                query = query.filter(Question.difficulty == difficulty)
+            ids = array("I", (row[0] for row in query))
+            with self._lock:
+                # Mudanças confirmadas durante a leitura podem ter ficado de
+                # fora dela: usa o resultado só nesta chamada
+                if self._versions.get(key, 0) == version:
+                    self._buckets[key] = (time.monotonic() + self.bucket_ttl, ids)
+            return ids
+        finally:
+            loader.release()
+
+    def _seen_set(self, user_id):
+        with self._lock:
+            entry = self._seen.get(user_id)
+            if entry is not None and entry[0] >= time.monotonic():
+                self._seen.move_to_end(user_id)
+                return entry[1]
+        ids = db.session.query(AnswerEvent.question_id).filter(AnswerEvent.user_id == user_id).distinct()
+        seen = SeenSet(row[0] for row in ids)
+        with self._lock:
+            self._seen[user_id] = (time.monotonic() + self.seen_ttl, seen)
+            while len(self._seen) > self.max_users:
+                self._seen.popitem(last=False)
+        return seen
+
+    def mark_seen(self, user_id, question_ids):
+        # Só atualiza usuários já carregados; os demais são lidos do histórico quando preciso
+        with self._lock:
+            entry = self._seen.get(user_id)
+            if entry is not None:
+                for question_id in question_ids:
+                    entry[1].add(question_id)
+
+    def invalidate_bucket(self, subject, exam_type, difficulty):
+        with self._lock:
+            for key in ((subject, exam_type, difficulty), (subject, exam_type, None)):
+                self._buckets.pop(key, None)
+                self._versions[key] = self._versions.get(key, 0) + 1
+
+    def apply_changes(self, changes):
+        # Aplica inserts, mudanças de balde e remoções confirmadas aos baldes
+        # carregados, sem reler o banco. Cada balde alterado ganha um array
+        # novo: quem está sorteando continua com o anterior
+        added, removed = {}, {}
+        for change in changes:
+            before = change.before if change.before and change.before.pool_key is None else None
+            after = change.after if change.after and change.after.pool_key is None else None
+            if before == after:
+                continue
+            for target, key in ((removed, before), (added, after)):
+                if key is not None:
+                    for bucket in ((key.subject, key.exam_type, key.difficulty), (key.subject, key.exam_type, None)):
+                        target.setdefault(bucket, set()).add(change.id)
+        with self._lock:
+            for bucket in added.keys() | removed.keys():
+                self._versions[bucket] = self._versions.get(bucket, 0) + 1
+                entry = self._buckets.get(bucket)
+                if entry is None:
+                    continue
+                new = added.get(bucket, set())
+                # Os adicionados também saem da cópia, para não duplicar
+                drop = removed.get(bucket, set()) | new
+                ids = array("I", (i for i in entry[1] if i not in drop))
+                ids.extend(sorted(new))
+                self._buckets[bucket] = (entry[0], ids)
+
+    def _draw(self, ids, seen, count):
+        chosen = set()
+        # Sorteio por rejeição: O(N) tentativas enquanto o usuário viu uma
+        # parte pequena do balde
+        attempts = 4 * count + 16
+        while len(chosen) < count and attempts:
+            question_id = ids[_rng.randrange(len(ids))]
+            if question_id not in seen:
+                chosen.add(question_id)
+            attempts -= 1
+
+        if len(chosen) < count:
+            # Balde quase todo visto: varre os que faltam e, se ainda assim
+            # não houver o suficiente, completa repetindo questões já vistas
+            unseen = [i for i in ids if i not in seen and i not in chosen]
+            chosen.update(_rng.sample(unseen, min(len(unseen), count - len(chosen))))
+            if len(chosen) < count:
+                rest = [i for i in ids if i not in chosen]
+                chosen.update(_rng.sample(rest, min(len(rest), count - len(chosen))))
+        # A ordem de um set de ints segue os ids; a servida tem de ser aleatória
+        result = list(chosen)
+        _rng.shuffle(result)
+        return result
+
+    def sample(self, user_id, subject, exam_type, difficulty, num_questions):
+        ids = self._bucket(subject, exam_type, difficulty)
+        seen = self._seen_set(user_id)
+        if not ids:
+            return []
+        result = self._draw(ids, seen, num_questions)
+        self.mark_seen(user_id, result)
+        return result
+
+    def sample_near(self, user_id, subject, exam_type, num_questions, target, ratings, candidates=8):
+        # Modo adaptativo: sorteia candidates vezes mais questões não vistas e
+        # fica com as de dificuldade estimada mais próxima do alvo.
+        # ratings recebe a lista de ids e devolve {id: dificuldade}
+        ids = self._bucket(subject, exam_type, None)
+        seen = self._seen_set(user_id)
+        if not ids:
+            return []
+        pool = self._draw(ids, seen, min(len(ids), num_questions * candidates))
+        estimates = ratings(pool)
+        result = heapq.nsmallest(num_questions, pool, key=lambda i: abs(estimates.get(i, 0.0) - target))
+        self.mark_seen(user_id, result)
+        return result
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                config = current_app.config
+                _engine = SelectionEngine(
+                    config["SELECTION_BUCKET_TTL"],
+                    config["SELECTION_SEEN_TTL"],
+                    config["SELECTION_MAX_USERS"],
+                )
+    return _engine
+
+
+@on_questions_committed
+def _invalidate_buckets(changes, committed):
+    if _engine is None:
+        return
+    if committed:
+        _engine.apply_changes(changes)
+        return
+    # Sem commit: algum balde pode ter sido lido com o flush desfeito
+    for change in changes:
+        for key in (change.before, change.after):
+            if key is not None:
+                _engine.invalidate_bucket(key.subject, key.exam_type, key.difficulty)
@@ -0,0 +1,262 @@
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError
+from .app import db
+from .models import User, Subscription, StripeEvent
+from .authz import revoke_tokens
+from .metrics import counter, histogram
+from .progress import dialect_insert
+import atexit
+import json
+import os
+import threading
+
+events_received = counter("stripe_events_received_total", "Eventos recebidos pelo webhook do Stripe (duplicate=true: reenvio já gravado)")
+events_processed = counter("stripe_events_processed_total", "Eventos do Stripe processados pelo worker, por resultado")
+event_lag = histogram("stripe_event_lag_seconds", "Tempo entre o recebimento de um evento do Stripe e sua aplicação")
+
+# Chave do lock consultivo do Postgres que garante um único processador por vez
+_LOCK_KEY = 0x5791be
+
+
+def _customer_of(obj):
+    return obj.get("id") if obj.get("object") == "customer" else obj.get("customer")
+
+
+def record_event(payload):
+    # Grava o evento (corpo do webhook já verificado), sem aplicá-lo. Devolve
+    # False se o id já estava gravado (reenvio do Stripe). O commit fica a
+    # cargo de quem chama.
+    event = json.loads(payload)
+    row = {
+        "id": event["id"],
+        "type": event["type"],
+        "customer_id": _customer_of(event["data"]["object"]),
+        "created": event["created"],
+        "payload": payload.decode("utf-8") if isinstance(payload, bytes) else payload,
+        "received_at": datetime.utcnow(),
+        "attempts": 0,
+    }
+    insert = dialect_insert()
+    if insert is not None:
+        result = db.session.execute(insert(StripeEvent).values(**row).on_conflict_do_nothing(index_elements=[StripeEvent.id]))
+        new = result.rowcount == 1
+    else:
+        try:
+            with db.session.begin_nested():
+                db.session.add(StripeEvent(**row))
+            new = True
+        except IntegrityError:
+            new = False
+    events_received.inc(duplicate=str(not new).lower())
+    return new
+
+
+class _Lookups:
+    # Usuários e assinaturas dos eventos de um lote, carregados com uma query
+    # de cada em vez de duas ou três por evento
+    def __init__(self, events):
+        customers = {e["customer"] for e in events if e["customer"]}
+        subscription_ids = {e["object"].get("id") for e in events if e["type"].startswith("customer.subscription.")}
+        self.users = {u.stripe_customer_id: u for u in User.query.filter(User.stripe_customer_id.in_(customers))} if customers else {}
+        self.by_subscription = {}
+        self.by_user = {}
+        if self.users or subscription_ids:
+            user_ids = [u.id for u in self.users.values()]
+            for s in Subscription.query.filter(db.or_(Subscription.user_id.in_(user_ids), Subscription.stripe_subscription_id.in_(subscription_ids))):
+                self.add(s)
+        missing = {s.user_id for s in self.by_user.values()} - {u.id for u in self.users.values()}
+        self.users_by_id = {u.id: u for u in self.users.values()}
+        if missing:
+            self.users_by_id.update((u.id, u) for u in User.query.filter(User.id.in_(missing)))
+
+    def add(self, subscription):
+        self.by_subscription[subscription.stripe_subscription_id] = subscription
+        self.by_user[subscription.user_id] = subscription
+
+    def remove(self, subscription):
+        self.by_subscription.pop(subscription.stripe_subscription_id, None)
+        self.by_user.pop(subscription.user_id, None)
+
+
+def _stale(subscription, created):
+    # Evento mais antigo que o último aplicado (o Stripe não garante a ordem de entrega)
+    return subscription.last_event_created is not None and created < subscription.last_event_created
+
+
+def _apply(event, lookups):
+    # Aplica um evento ao banco. Devolve o id do usuário cuja assinatura
+    # mudou (os tokens dele devem ser revogados) ou None
+    obj = event["object"]
+    created = event["created"]
+    if event["type"] == "checkout.session.completed":
+        user = lookups.users.get(event["customer"])
+        if not user:
+            return None
+        subscription = lookups.by_user.get(user.id)
+        if subscription and _stale(subscription, created):
+            return None
+        user.is_subscribed = True
+        # Criar ou atualizar a assinatura no BD
+        if not subscription:
+            subscription = Subscription(user_id=user.id, stripe_customer_id=event["customer"], stripe_subscription_id=obj.get("subscription"), status="active")
+            db.session.add(subscription)
+        else:
+            lookups.remove(subscription)
+            subscription.stripe_subscription_id = obj.get("subscription")
+            subscription.status = "active"
+        subscription.last_event_created = created
+        lookups.add(subscription)
+        return user.id
+
+    if event["type"] in ("customer.subscription.updated", "customer.subscription.deleted"):
+        subscription = lookups.by_subscription.get(obj.get("id"))
+        if not subscription or _stale(subscription, created):
+            return None
+        user = lookups.users_by_id.get(subscription.user_id)
+        if event["type"] == "customer.subscription.deleted":
+            if user: user.is_subscribed = False
+            lookups.remove(subscription)
+            db.session.delete(subscription)
+        else:
+            subscription.status = obj.get("status")
+            subscription.last_event_created = created
+            if subscription.status in ("canceled", "unpaid") and user:
+                user.is_subscribed = False
+        return subscription.user_id
+    return None
+
+
+def _lock_processing():
+    # Um processador por vez (no Postgres, lock consultivo até o fim da
+    # transação): dois workers não podem dividir os eventos de um mesmo cliente
+    if db.engine.dialect.name != "postgresql":
+        return True
+    return db.session.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": _LOCK_KEY}).scalar()
+
+
+def process_pending(batch_size, max_attempts):
+    # Aplica até batch_size eventos pendentes, do mais antigo para o mais novo,
+    # num único commit. Cada evento roda num savepoint: se falhar, fica com o
+    # erro e os seguintes do mesmo cliente esperam a próxima rodada, mantendo
+    # a ordem por cliente. Devolve quantos eventos foram aplicados.
+    if not _lock_processing():
+        db.session.rollback()
+        return 0
+    rows = StripeEvent.query.filter(StripeEvent.processed_at.is_(None), StripeEvent.attempts < max_attempts) \
+        .order_by(StripeEvent.created, StripeEvent.id).limit(batch_size).all()
+    if not rows:
+        db.session.rollback()
+        return 0
+    events = [
+        {"type": row.type, "created": row.created, "customer": row.customer_id, "object": json.loads(row.payload)["data"]["object"]}
+        for row in rows
+    ]
+    lookups = _Lookups(events)
+
+    now = datetime.utcnow()
+    blocked, changed_users, applied, failed = set(), set(), 0, 0
+    for row, event in zip(rows, events):
+        key = row.customer_id or row.id
+        if key in blocked:
+            continue
+        row.attempts += 1
+        try:
+            with db.session.begin_nested():
+                user_id = _apply(event, lookups)
+        except Exception as e:
+            row.last_error = str(e)
+            blocked.add(key)
+            failed += 1
+            current_app.logger.warning("Erro ao aplicar o evento do Stripe %s (%s): %s", row.id, row.type, e)
+            continue
+        row.processed_at = now
+        row.last_error = None
+        applied += 1
+        event_lag.observe((now - row.received_at).total_seconds())
+        if user_id is not None:
+            changed_users.add(user_id)
+    for user_id in changed_users:
+        revoke_tokens(user_id) # Força novas claims com o estado atual da assinatura
+    db.session.commit()
+
+    events_processed.inc(applied, outcome="applied")
+    events_processed.inc(failed, outcome="failed")
+    return applied
+
+
+def drain(batch_size, max_attempts):
+    # Processa lotes até não restar evento aplicável; devolve o total aplicado
+    total = 0
+    while True:
+        applied = process_pending(batch_size, max_attempts)
+        total += applied
+        if applied < batch_size:
+            return total
+
+
+class EventWorker:
+    """Thread do processo que aplica os eventos pendentes, acordada pelo webhook."""
+
+    def __init__(self, app, batch_size, poll_interval, max_attempts):
+        self.app = app
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name="stripe-events", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def notify(self):
+        self._wake.set()
+
+    def _run(self):
+        # Além dos avisos do webhook, consulta periodicamente: eventos gravados
+        # por outros processos e novas tentativas dos que falharam
+        while not self._stopped:
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+            try:
+                with self.app.app_context():
+                    drain(self.batch_size, self.max_attempts)
+            except Exception as e:
+                self.app.logger.warning("Erro ao processar eventos do Stripe: %s", e)
+
+    def close(self):
+        self._stopped = True
+        self._wake.set()
+        self._thread.join(timeout=10)
+
+
+_worker = None
+_worker_pid = None
+_worker_lock = threading.Lock()
+
+
+def start_worker(app):
+    # Chamado na inicialização de cada processo web, depois do fork (hook
+    # post_worker_init do gunicorn e lifespan do ASGI), para que os pendentes
+    # e as novas tentativas andem sem esperar o próximo webhook. Idempotente
+    # por processo; com STRIPE_EVENTS_WORKER=false não faz nada
+    global _worker, _worker_pid
+    if not app.config["STRIPE_EVENTS_WORKER"]:
+        return None
+    if _worker_pid != os.getpid():
+        with _worker_lock:
+            if _worker_pid != os.getpid():
+                _worker = EventWorker(
+                    app,
+                    app.config["STRIPE_EVENTS_BATCH"],
+                    app.config["STRIPE_EVENTS_POLL_INTERVAL"],
+                    app.config["STRIPE_EVENTS_MAX_ATTEMPTS"],
+                )
+                _worker_pid = os.getpid()
+    return _worker
+
+
+def get_worker():
+    # Servidores sem o hook de inicialização (flask run) criam a thread no primeiro webhook
+    return start_worker(current_app._get_current_object())
@@ -1,7 +1,8 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from .app import db
-from .models import User, Subscription
+from .models import User
+from .stripe_events import record_event, get_worker
 import stripe
 import os
 
@@ -9,12 +10,14 @@ subscription_bp = Blueprint("subscription", __name__, url_prefix="/subscription"
 
 # Configurar Stripe (substituir com sua chave secreta em produção)
 stripe.api_key = os.environ.get("STRIPE_SECRET_KEY", "sk_test_YOUR_STRIPE_SECRET_KEY")
+# Benchmarks e testes apontam para um servidor Stripe falso local
+stripe.api_base = os.environ.get("STRIPE_API_BASE", stripe.api_base)
 
 @subscription_bp.route("/create-checkout-session", methods=["POST"])
 @jwt_required()
 def create_checkout_session():
-    current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
+    current_user_id = int(get_jwt_identity())
+    user = db.session.get(User, current_user_id)
 
     if not user:
         return jsonify({"msg": "Usuário não encontrado"}), 404
@@ -61,7 +64,7 @@ def stripe_webhook():
     endpoint_secret = os.environ.get("STRIPE_WEBHOOK_SECRET", "whsec_YOUR_WEBHOOK_SECRET")
 
     try:
-        event = stripe.Webhook.construct_event(
+        stripe.Webhook.construct_event(
             payload, sig_header, endpoint_secret
         )
     except ValueError as e:
@@ -71,51 +74,11 @@ def stripe_webhook():
         # Invalid signature
         return str(e), 400
 
-    # Lidar com os eventos do Stripe
-    if event["type"] == "checkout.session.completed":
-        session = event["data"]["object"]
-        customer_id = session.get("customer")
-        subscription_id = session.get("subscription")
-
-        user = User.query.filter_by(stripe_customer_id=customer_id).first()
-        if user:
-            user.is_subscribed = True
-            # Criar ou atualizar a assinatura no BD
-            subscription = Subscription.query.filter_by(user_id=user.id).first()
-            if not subscription:
-                subscription = Subscription(user_id=user.id, stripe_customer_id=customer_id, stripe_subscription_id=subscription_id, status="active")
-                db.session.add(subscription)
-            else:
-                subscription.stripe_subscription_id = subscription_id
-                subscription.status = "active"
-            db.session.commit()
-            print(f"Usuário {user.email} assinou com sucesso!")
-
-    elif event["type"] == "customer.subscription.updated":
-        subscription_data = event["data"]["object"]
-        subscription_id = subscription_data.get("id")
-        status = subscription_data.get("status")
-
-        subscription = Subscription.query.filter_by(stripe_subscription_id=subscription_id).first()
-        if subscription:
-            subscription.status = status
-            if status == "canceled" or status == "unpaid":
-                user = User.query.get(subscription.user_id)
-                if user: user.is_subscribed = False
-            db.session.commit()
-            print(f"Assinatura {subscription_id} atualizada para {status}")
-
-    elif event["type"] == "customer.subscription.deleted":
-        subscription_data = event["data"]["object"]
-        subscription_id = subscription_data.get("id")
-
-        subscription = Subscription.query.filter_by(stripe_subscription_id=subscription_id).first()
-        if subscription:
-            user = User.query.get(subscription.user_id)
-            if user: user.is_subscribed = False
-            db.session.delete(subscription)
-            db.session.commit()
-            print(f"Assinatura {subscription_id} deletada.")
+    # Só grava o evento (o id descarta reenvios do Stripe) e responde; a
+    # assinatura é atualizada em seguida pelo worker (ver stripe_events.py)
+    if record_event(payload):
+        db.session.commit()
+        if current_app.config["STRIPE_EVENTS_WORKER"]:
+            get_worker().notify()
 
     return jsonify({"status": "success"}), 200
-
@@ -0,0 +1,28 @@
+import re
+import unicodedata
+
+_whitespace = re.compile(r"\s+")
+_token = re.compile(r"\w+")
+
+# Artigos, preposições e outras palavras sem valor para busca e similaridade
+# (já sem acentos, como saem de normalize_text)
+STOPWORDS = frozenset("""
+a o as os um uma uns umas de do da dos das em no na nos nas por pelo pela para pra com sem
+e ou que qual quais quem como onde quando porque se sobre ao aos sao ser
+me te lhe eu voce isso isto esse essa este esta
+""".split())
+
+
+def fold_accents(text):
+    if text.isascii():
+        return text
+    return "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+
+
+def normalize_text(text):
+    # Caixa, acentos e espaços são ignorados: "  Mitose  Celular" == "mitose celular"
+    return _whitespace.sub(" ", fold_accents(text).casefold()).strip()
+
+
+def tokens(normalized, stopwords=STOPWORDS):
+    return [t for t in _token.findall(normalized) if t not in stopwords]